@@ -130,6 +130,28 @@ STATIC_URL = '/static/'
 # 配置静态文件加载路径
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# collectstatic 收集静态文件的目录(由nginx发送，文件名带哈希值，可以缓存一年):
+#     location /static/ { alias /path/to/blog/static_root/; expires 1y; gzip_static on; brotli_static on; }
+STATIC_ROOT = os.path.join(BASE_DIR, 'static_root')
+# 文件名加上内容哈希值，并生成 .gz/.br (manage.py build_assets)
+STATICFILES_STORAGE = 'utils.assets.CompressedManifestStaticFilesStorage'
+
+# 每个页面的js合并为一个文件(按加载顺序)，模板中使用 {% bundle '页面名' %}
+# DEBUG 时仍然分别加载原文件
+_BASE_SCRIPTS = ['js/vue-2.5.16.js', 'js/axios-0.18.0.min.js']
+_LIST_SCRIPTS = _BASE_SCRIPTS + ['js/jquery-1.12.4.min.js', 'js/host.js', 'js/common.js']
+ASSET_BUNDLES = {
+    'index': _LIST_SCRIPTS + ['js/index.js', 'js/jquery.pagination.min.js'],
+    'detail': _LIST_SCRIPTS + ['js/detail.js', 'js/jquery.pagination.min.js'],
+    'login': _BASE_SCRIPTS + ['js/host.js', 'js/common.js', 'js/login.js'],
+    'register': _BASE_SCRIPTS + ['js/host.js', 'js/common.js', 'js/register.js'],
+    'forget_password': _BASE_SCRIPTS + ['js/host.js', 'js/common.js', 'js/forget_password.js'],
+    'center': _BASE_SCRIPTS + ['js/host.js', 'js/common.js', 'js/center.js'],
+    'write_blog': _BASE_SCRIPTS + ['js/host.js', 'js/common.js', 'js/write_blog.js'],
+}
+# 合并文件的输出目录(在 STATICFILES_DIRS 中，collectstatic 时一起收集)
+ASSET_BUILD_DIR = os.path.join(BASE_DIR, 'static', 'bundles')
+
 CACHES = {
     "default": {  # 默认
         "BACKEND": "django_redis.cache.RedisCache",
@@ -209,3 +231,71 @@ MEDIA_URL = '/media/'
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# 文章浏览量先缓冲在redis中，定期批量写回数据库
+# 后台刷新线程的间隔(秒)，0 表示不启动(改由 manage.py flush_article_views 定时刷新)
+ARTICLE_VIEWS_FLUSH_INTERVAL = 60
+
+# 分页时每页数量(page_size)的上限
+PAGE_SIZE_MAX = 50
+
+# 首页整页缓存的过期时间(秒)，文章修改时会立即失效
+INDEX_PAGE_CACHE_TIMEOUT = 300
+# 首页在共享缓存(反向代理)中的缓存时间(秒)，共享缓存不能主动失效，时间不宜过长
+INDEX_PAGE_SHARED_MAX_AGE = 60
+
+# 图片验证码池(manage.py fill_captcha_pool 在后台补充)
+# 低于低水位时补充到高水位
+CAPTCHA_POOL_LOW_WATERMARK = 200
+CAPTCHA_POOL_HIGH_WATERMARK = 1000
+
+# 短信发送队列(manage.py sms_worker 在后台发送)
+# 短信网关，测试时可以换成 'libs.yuntongxun.fake.FakeCCP'
+SMS_GATEWAY = 'libs.yuntongxun.sms.CCP'
+# 同时发送的短信数
+SMS_WORKER_CONCURRENCY = 4
+# 最多发送次数，超过后放入死信列表
+SMS_MAX_ATTEMPTS = 5
+# 第一次重试的间隔(秒)，之后每次翻倍
+SMS_RETRY_BASE_DELAY = 2
+
+# 发送短信验证码的令牌桶限流 (容量, 补充一个令牌的间隔秒数)
+# 同一个手机号每60秒一条，同一个IP最多连续10条，之后每60秒一条
+SMS_THROTTLE_MOBILE = (1, 60)
+SMS_THROTTLE_IP = (10, 60)
+
+# 上传图片的衍生图(manage.py image_worker 在后台生成)
+# 衍生图的宽度(比原图宽的不生成)
+IMAGE_WIDTHS = (320, 640, 1280)
+# 衍生图的格式
+IMAGE_FORMATS = ('webp', 'jpeg')
+# 压缩质量
+IMAGE_QUALITY = 80
+# 模糊占位图的宽度
+IMAGE_PLACEHOLDER_WIDTH = 16
+# 同时处理图片的进程数
+IMAGE_WORKER_CONCURRENCY = 2
+
+# 上传文件按内容保存，相同的文件只保存一份(utils.storage)
+DEFAULT_FILE_STORAGE = 'utils.storage.ContentAddressedStorage'
+# 上传的文件直接写入临时文件，同时计算sha256
+# FILE_UPLOAD_TEMP_DIR 与 MEDIA_ROOT 在同一个文件系统时，保存文件只需要重命名
+FILE_UPLOAD_HANDLERS = ['utils.storage.HashingUploadHandler']
+# 引用计数为0的文件保留的时间(秒)，之后由 manage.py gc_media 删除
+MEDIA_GC_GRACE = 24 * 3600
+# 使用S3兼容的对象存储时:
+# DEFAULT_FILE_STORAGE = 'utils.storage.S3ContentAddressedStorage'
+# MEDIA_URL 改为存储桶(或CDN)的地址
+AWS_STORAGE_BUCKET_NAME = 'blog-media'
+# 本地测试时指向 MinIO 等S3兼容服务，如 'http://127.0.0.1:9000'，None 表示使用 AWS
+AWS_S3_ENDPOINT_URL = None
+
+# 上传文件的访问方式(utils.media)
+#   'python'     由django发送(支持304和Range，文件内容由 wsgi.file_wrapper 发送)
+#   'x-accel'    由nginx发送，需要配置 internal 的 location:
+#                    location /internal-media/ { internal; alias /path/to/blog/media/; }
+#   'x-sendfile' 由 Apache(mod_xsendfile)/lighttpd 发送
+MEDIA_SERVE_MODE = 'python'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/internal-media/'
+# 不是按内容保存的文件(旧的上传文件、缩略图)浏览器缓存的时间(秒)
+MEDIA_CACHE_MAX_AGE = 24 * 3600
@@ -14,9 +14,11 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+import re
+from urllib.parse import urlsplit
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from utils.media import serve_media
 # from django.http import HttpResponse
 # 1.导入系统的logging
 import logging
@@ -40,5 +42,9 @@ urlpatterns = [
     # path('', log),
     path('', include(('home.urls', 'home'), namespace='home')),
 ]
-# 图片访问的路由
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# 图片访问的路由(MEDIA_URL 为对象存储或CDN的地址时不需要)
+# 生产环境由nginx发送文件，见 settings.MEDIA_SERVE_MODE
+if not urlsplit(settings.MEDIA_URL).netloc:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+    ]
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
 
 application = get_wsgi_application()
+
+# 启动文章浏览量的后台刷新线程(settings.ARTICLE_VIEWS_FLUSH_INTERVAL 为0时不启动)
+from home.counters import start_views_flusher  # noqa: E402
+start_views_flusher()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 很少变化的数据(文章分类等)使用两级缓存
+from home.models import ArticleCategory, Tag
+from utils.cache import TwoTierCache
+
+category_cache = TwoTierCache('category', maxsize=8, ttl=60)
+tag_cache = TwoTierCache('tag', maxsize=4, ttl=60)
+
+# 标签云显示的标签数
+TAG_CLOUD_SIZE = 50
+
+
+def get_categories():
+    """获取所有文章分类"""
+    return category_cache.get_or_set('all', lambda: list(ArticleCategory.objects.all()))
+
+
+def get_category(cat_id):
+    """
+    根据id获取文章分类
+    :raise ArticleCategory.DoesNotExist: 分类不存在
+    """
+    try:
+        cat_id = int(cat_id)
+    except (TypeError, ValueError):
+        raise ArticleCategory.DoesNotExist()
+    for category in get_categories():
+        if category.id == cat_id:
+            return category
+    raise ArticleCategory.DoesNotExist()
+
+
+def invalidate_categories():
+    category_cache.delete('all')
+
+
+def get_tag_cloud():
+    """获取标签云(文章数最多的标签，按维护的文章数排序，走索引)"""
+    return tag_cache.get_or_set('cloud', lambda: list(
+        Tag.objects.filter(article_count__gt=0).order_by('-article_count', 'name')[:TAG_CLOUD_SIZE]))
+
+
+def invalidate_tag_cloud():
+    tag_cache.delete('cloud')
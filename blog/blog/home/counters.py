@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 文章浏览量的redis缓冲
+# 浏览量先累加到redis的hash中，再由刷新任务批量写回数据库
+# 评论数、分类文章数等反规范化计数的校正
+import threading
+import time
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Case, When, Value, PositiveIntegerField, Count
+from django_redis import get_redis_connection
+from redis.exceptions import LockNotOwnedError
+from home.models import ArticleCategory, Article, Comment, ViewsFlush
+from home import leaderboard
+
+logger = logging.getLogger('django')
+
+# 待写回的浏览量增量  field: 文章id  value: 增量
+VIEWS_KEY = 'article:views'
+# 正在写回数据库的增量(刷新过程中与新的增量分开)
+FLUSHING_KEY = 'article:views:flushing'
+# 刷新批次号(刷新hash对应的批次，写回进度按批次保存在数据库中)
+FLUSH_GENERATION_KEY = 'article:views:generation'
+# 刷新任务的分布式锁，避免多个刷新任务同时执行
+FLUSH_LOCK_KEY = 'article:views:lock'
+# 锁的有效期(秒)，每写回一批延长一次
+FLUSH_LOCK_TIMEOUT = 300
+
+
+def incr_article_views(article_id):
+    """
+    文章浏览量+1，同时更新热门文章排行榜(同一个pipeline，一次往返)
+    :param article_id: 文章id
+    :return: 该文章尚未写回数据库的浏览量增量(包含本次)
+    """
+    redis_conn = get_redis_connection('default')
+    pl = redis_conn.pipeline()
+    pl.hincrby(VIEWS_KEY, article_id, 1)
+    pl.hget(FLUSHING_KEY, article_id)
+    leaderboard.incr_score(pl, article_id)
+    pending, flushing, _ = pl.execute()
+    return int(pending) + int(flushing or 0)
+
+
+def get_pending_views(article_ids):
+    """
+    批量获取文章尚未写回数据库的浏览量增量
+    :param article_ids: 文章id列表
+    :return: {文章id: 增量}
+    """
+    article_ids = list(article_ids)
+    if not article_ids:
+        return {}
+    redis_conn = get_redis_connection('default')
+    pl = redis_conn.pipeline()
+    pl.hmget(VIEWS_KEY, article_ids)
+    pl.hmget(FLUSHING_KEY, article_ids)
+    pending, flushing = pl.execute()
+    return {
+        article_id: int(p or 0) + int(f or 0)
+        for article_id, p, f in zip(article_ids, pending, flushing)
+    }
+
+
+def apply_pending_views(articles):
+    """给(未保存的)文章对象加上待写回的增量，用于页面显示"""
+    articles = list(articles)
+    pending = get_pending_views([article.id for article in articles])
+    for article in articles:
+        article.total_views += pending.get(article.id, 0)
+    return articles
+
+
+def flush_article_views(batch_size=500):
+    """
+    将redis中累计的浏览量增量批量写回数据库
+        1.获取刷新锁
+        2.把当前的增量hash改名为刷新hash并分配新的批次号，新的浏览量继续写入新的hash
+        3.按文章id从小到大分批，每批用一条 UPDATE ... CASE 语句写回数据库，
+          同一个事务中保存该批次写回的最大文章id
+        4.每批写回成功后从刷新hash中删除对应的字段
+    上次刷新中断遗留下来的刷新hash会在下一次刷新时先处理，已经写回的文章(id不大于保存的进度)只删除字段，
+    不会重复写回；中断后到下一次刷新之前，页面显示的浏览量可能包含已经写回的增量
+    :param batch_size: 每条UPDATE语句更新的文章数
+    :return: 写回数据库的浏览量总数
+    """
+    redis_conn = get_redis_connection('default')
+    lock = redis_conn.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        # 其他进程正在刷新
+        return 0
+
+    total = 0
+    try:
+        if not redis_conn.exists(FLUSHING_KEY):
+            if not redis_conn.exists(VIEWS_KEY):
+                return 0
+            # 改名和分配批次号在同一个事务中
+            pl = redis_conn.pipeline()
+            pl.rename(VIEWS_KEY, FLUSHING_KEY)
+            pl.incr(FLUSH_GENERATION_KEY)
+            pl.execute()
+        generation = int(redis_conn.get(FLUSH_GENERATION_KEY) or 0)
+
+        deltas = {}
+        for article_id, delta in redis_conn.hgetall(FLUSHING_KEY).items():
+            deltas[int(article_id)] = int(delta)
+
+        article_ids = sorted(deltas)
+        for i in range(0, len(article_ids), batch_size):
+            batch = article_ids[i:i + batch_size]
+            # 延长锁的有效期，锁已经失效(被其他进程获取)时抛出 LockNotOwnedError，停止刷新
+            lock.reacquire()
+            with transaction.atomic():
+                progress, _ = ViewsFlush.objects.select_for_update().get_or_create(generation=generation)
+                pending = [article_id for article_id in batch if article_id > progress.last_id]
+                if pending:
+                    whens = [When(id=article_id, then=Value(deltas[article_id])) for article_id in pending]
+                    Article.objects.filter(id__in=pending).update(
+                        total_views=F('total_views') + Case(*whens, default=Value(0),
+                                                            output_field=PositiveIntegerField())
+                    )
+                    progress.last_id = pending[-1]
+                    progress.save(update_fields=['last_id'])
+            redis_conn.hdel(FLUSHING_KEY, *batch)
+            total += sum(deltas[article_id] for article_id in pending)
+
+        redis_conn.delete(FLUSHING_KEY)
+        # 之前批次的刷新hash都已经处理完，不再需要进度
+        ViewsFlush.objects.filter(generation__lt=generation).delete()
+    finally:
+        try:
+            lock.release()
+        except LockNotOwnedError:
+            logger.error('浏览量刷新超过了锁的有效期(%d秒)' % FLUSH_LOCK_TIMEOUT)
+    return total
+
+
+def _flush_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush_article_views()
+        except Exception as e:
+            logger.error(e)
+
+
+_flusher = None
+
+
+def start_views_flusher(interval=None):
+    """
+    在当前进程中启动后台刷新线程
+    :param interval: 刷新间隔(秒)，默认使用 settings.ARTICLE_VIEWS_FLUSH_INTERVAL，为0时不启动
+    """
+    global _flusher
+    if interval is None:
+        interval = getattr(settings, 'ARTICLE_VIEWS_FLUSH_INTERVAL', 0)
+    if not interval or _flusher is not None:
+        return _flusher
+    _flusher = threading.Thread(target=_flush_loop, args=(interval,),
+                                name='article-views-flusher', daemon=True)
+    _flusher.start()
+    return _flusher
+
+
+def reconcile_comments_count(batch_size=500):
+    """
+    根据评论表重新统计文章的评论数，修正不一致的计数
+    按文章id分批，每批锁定文章后用一条分组聚合查询统计评论数，只更新不一致的文章
+    :return: 修正的文章数
+    """
+    total = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            articles = list(Article.objects.select_for_update().only('id', 'comments_count')
+                            .filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not articles:
+                break
+            last_id = articles[-1].id
+            counts = dict(Comment.objects.filter(article_id__in=[article.id for article in articles])
+                          .order_by().values('article').annotate(count=Count('id'))
+                          .values_list('article', 'count'))
+            changed = []
+            for article in articles:
+                count = counts.get(article.id, 0)
+                if article.comments_count != count:
+                    article.comments_count = count
+                    changed.append(article)
+            Article.objects.bulk_update(changed, ['comments_count'])
+        total += len(changed)
+    return total
+
+
+def reconcile_article_count():
+    """
+    根据文章表重新统计分类的文章数，修正不一致的计数
+    :return: 修正的分类数
+    """
+    with transaction.atomic():
+        categories = list(ArticleCategory.objects.select_for_update().only('id', 'article_count'))
+        counts = dict(Article.objects.filter(category__isnull=False)
+                      .order_by().values('category').annotate(count=Count('id'))
+                      .values_list('category', 'count'))
+        changed = []
+        for category in categories:
+            count = counts.get(category.id, 0)
+            if category.article_count != count:
+                category.article_count = count
+                changed.append(category)
+        ArticleCategory.objects.bulk_update(changed, ['article_count'])
+    return len(changed)
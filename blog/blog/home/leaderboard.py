@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 热门文章排行榜
+# 文章的浏览量保存在redis的有序集合中，浏览量+1时同步更新分数
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from home.models import Article
+
+# 排行榜有序集合  member: 文章id  score: 浏览量
+HOT_KEY = 'article:hot'
+# 文章标题缓存
+TITLE_KEY = 'article:title:%s'
+TITLE_TIMEOUT = 24 * 3600
+
+
+def incr_score(redis_conn, article_id, amount=1):
+    """
+    增加文章在排行榜中的分数
+    :param redis_conn: redis连接或pipeline(浏览量计数时和计数命令放在同一个pipeline中)
+    """
+    return redis_conn.zincrby(HOT_KEY, amount, article_id)
+
+
+def remove_article(article_id):
+    """文章删除后从排行榜中移除"""
+    redis_conn = get_redis_connection('default')
+    redis_conn.zrem(HOT_KEY, article_id)
+    cache.delete(TITLE_KEY % article_id)
+
+
+def invalidate_title(article_id):
+    cache.delete(TITLE_KEY % article_id)
+
+
+def get_hot_articles(count=9):
+    """
+    获取热门文章
+        1.从有序集合中获取分数最高的文章id
+        2.从缓存中批量获取文章标题
+        3.缓存中没有的标题再查询数据库并写入缓存
+    排行榜为空(例如redis数据被清空)时直接查询数据库
+    :param count: 文章数量
+    :return: [{'id': 文章id, 'title': 文章标题}, ...]
+    """
+    redis_conn = get_redis_connection('default')
+    article_ids = [int(article_id) for article_id in redis_conn.zrevrange(HOT_KEY, 0, count - 1)]
+    if not article_ids:
+        return list(Article.objects.order_by('-total_views').values('id', 'title')[:count])
+
+    titles = cache.get_many([TITLE_KEY % article_id for article_id in article_ids])
+    missing = [article_id for article_id in article_ids if TITLE_KEY % article_id not in titles]
+    if missing:
+        fetched = {
+            TITLE_KEY % article_id: title
+            for article_id, title in Article.objects.filter(id__in=missing).values_list('id', 'title')
+        }
+        cache.set_many(fetched, TITLE_TIMEOUT)
+        titles.update(fetched)
+
+    # 已经删除的文章没有标题，跳过
+    return [
+        {'id': article_id, 'title': titles[TITLE_KEY % article_id]}
+        for article_id in article_ids
+        if TITLE_KEY % article_id in titles
+    ]
+
+
+def rebuild(batch_size=1000):
+    """
+    根据数据库中的浏览量(加上redis中尚未写回的增量)重建排行榜
+    :return: 排行榜中的文章数
+    """
+    redis_conn = get_redis_connection('default')
+    tmp_key = HOT_KEY + ':rebuild'
+    redis_conn.delete(tmp_key)
+
+    total = 0
+    batch = []
+    queryset = Article.objects.order_by('id').values_list('id', 'total_views')
+    for row in queryset.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            total += _add_batch(redis_conn, tmp_key, batch)
+            batch = []
+    if batch:
+        total += _add_batch(redis_conn, tmp_key, batch)
+
+    if total:
+        # 重建完成后再替换，重建期间排行榜仍可读
+        redis_conn.rename(tmp_key, HOT_KEY)
+    else:
+        redis_conn.delete(HOT_KEY)
+    return total
+
+
+def _add_batch(redis_conn, key, batch):
+    from home.counters import get_pending_views
+
+    pending = get_pending_views([article_id for article_id, _ in batch])
+    redis_conn.zadd(key, {
+        article_id: total_views + pending.get(article_id, 0)
+        for article_id, total_views in batch
+    })
+    return len(batch)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import json
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+from home.models import Article
+from users.models import User
+from utils.images import build_variants
+from utils.image_queue import QUEUE_KEY, make_job, save_variants
+
+
+class Command(BaseCommand):
+    """为已有的文章标题图和用户头像生成衍生图"""
+    help = '为已有的图片生成衍生图'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='重新生成所有图片的衍生图，默认只处理还没有衍生图的图片')
+        parser.add_argument('--concurrency', type=int, default=settings.IMAGE_WORKER_CONCURRENCY,
+                            help='同时处理图片的进程数')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='每批处理的图片数')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='只把任务放入队列，由 image_worker 处理')
+
+    def pending(self, model, batch_size, all_):
+        """分批取出需要处理的对象"""
+        objects = model.objects.exclude(avatar='').only('id', 'avatar', 'avatar_variants').order_by('id')
+        last_id = 0
+        while True:
+            batch = list(objects.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            yield [obj for obj in batch if all_ or not obj.avatar_variants]
+
+    def handle(self, *args, **options):
+        redis_conn = get_redis_connection('default')
+        total = failed = 0
+        with ProcessPoolExecutor(max_workers=options['concurrency'], initializer=django.setup) as executor:
+            for model in (Article, User):
+                for batch in self.pending(model, options['batch_size'], options['all']):
+                    jobs = [make_job(obj) for obj in batch]
+                    if not jobs:
+                        continue
+                    if options['enqueue']:
+                        redis_conn.lpush(QUEUE_KEY, *[json.dumps(job) for job in jobs])
+                        total += len(jobs)
+                        continue
+                    futures = [(job, executor.submit(build_variants, job['name'])) for job in jobs]
+                    for job, future in futures:
+                        try:
+                            save_variants(job, future.result())
+                            total += 1
+                        except Exception as e:
+                            failed += 1
+                            self.stderr.write('处理失败: %s %s' % (job['name'], e))
+                    self.stdout.write('已处理: %d' % total)
+        self.stdout.write('处理完成: %d, 失败: %d' % (total, failed))
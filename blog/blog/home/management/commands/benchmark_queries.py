@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 热点查询的基准测试
+# 生成测试数据后记录每个热点查询的耗时和执行计划(EXPLAIN)，用于在上线前发现索引失效
+import json
+import random
+import re
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from home.models import ArticleCategory, Article, Comment
+from users.models import User
+
+
+class Rollback(Exception):
+    """测试结束后回滚生成的数据"""
+
+
+# 执行计划中表示全表扫描或额外排序的特征
+# MySQL: "access_type": "ALL" / "using_filesort": true
+# SQLite: SCAN tb_xxx(没有使用索引) / USE TEMP B-TREE FOR ORDER BY
+FULL_SCAN_PATTERNS = [
+    re.compile(r'"access_type":\s*"ALL"'),
+    re.compile(r'"using_filesort":\s*true'),
+    re.compile(r'\bSCAN (TABLE )?tb_\w+(?! USING (COVERING )?INDEX)( |$)', re.M),
+    re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+]
+
+
+def explain(queryset):
+    if connection.vendor == 'mysql':
+        return queryset.explain(format='json')
+    return queryset.explain()
+
+
+def is_full_scan(plan):
+    return any(pattern.search(plan) for pattern in FULL_SCAN_PATTERNS)
+
+
+class Command(BaseCommand):
+    """
+    1.生成测试数据(文章、评论)
+    2.分别执行首页、热门文章、评论列表的热点查询，记录耗时
+    3.记录每个查询的执行计划，发现全表扫描或额外排序时给出警告
+    4.回滚测试数据
+    """
+    help = '生成测试数据并记录热点查询的耗时和执行计划'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=10000, help='生成的文章数')
+        parser.add_argument('--comments', type=int, default=50000, help='生成的评论数')
+        parser.add_argument('--categories', type=int, default=10, help='生成的分类数')
+        parser.add_argument('--repeat', type=int, default=20, help='每个查询的执行次数')
+        parser.add_argument('--output', help='将结果以json格式写入文件')
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='执行计划中出现全表扫描或额外排序时返回错误')
+        parser.add_argument('--keep', action='store_true', help='保留生成的测试数据')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                results = self.run(options)
+                if not options['keep']:
+                    raise Rollback()
+        except Rollback:
+            pass
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+        scans = [result['name'] for result in results if result['full_scan']]
+        if scans and options['fail_on_scan']:
+            raise CommandError('以下查询没有使用索引: %s' % ', '.join(scans))
+
+    def run(self, options):
+        self.stdout.write('生成测试数据...')
+        category, article = self.seed(options['articles'], options['comments'], options['categories'])
+
+        queries = [
+            ('index', Article.objects.filter(category=category).order_by('-created', '-id')[:10]),
+            ('hot_articles', Article.objects.order_by('-total_views')[:9]),
+            ('comments', Comment.objects.filter(article=article).order_by('-created')[:10]),
+        ]
+
+        results = []
+        for name, queryset in queries:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            plan = explain(queryset)
+            result = {
+                'name': name,
+                'min_ms': round(min(timings), 3),
+                'avg_ms': round(sum(timings) / len(timings), 3),
+                'full_scan': is_full_scan(plan),
+                'plan': plan,
+            }
+            results.append(result)
+
+            self.stdout.write('%-14s min %.3fms  avg %.3fms' % (name, result['min_ms'], result['avg_ms']))
+            self.stdout.write(plan)
+            if result['full_scan']:
+                self.stdout.write(self.style.WARNING('%s: 执行计划中出现全表扫描或额外排序' % name))
+        return results
+
+    @staticmethod
+    def seed(article_count, comment_count, category_count):
+        user = User.objects.create_user(username='benchmark', mobile='10000000000', password='benchmark')
+        categories = [ArticleCategory.objects.create(title='分类%d' % i) for i in range(category_count)]
+        now = timezone.now()
+        Article.objects.bulk_create([
+            Article(author=user,
+                    category=random.choice(categories),
+                    title='文章%d' % i,
+                    sumary='摘要',
+                    content='正文',
+                    total_views=random.randint(0, 100000),
+                    created=now - timedelta(minutes=random.randint(0, 525600)))
+            for i in range(article_count)
+        ], batch_size=1000)
+
+        article_ids = list(Article.objects.filter(author=user).values_list('id', flat=True))
+        Comment.objects.bulk_create([
+            Comment(content='评论', article_id=random.choice(article_ids), user=user)
+            for _ in range(comment_count)
+        ], batch_size=1000)
+
+        return categories[0], Article.objects.get(id=random.choice(article_ids))
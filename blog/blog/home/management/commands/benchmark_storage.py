@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import os
+import random
+import shutil
+import tempfile
+import time
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from utils.storage import ContentAddressedStorage
+
+
+def disk_usage(path):
+    """目录占用的磁盘空间(字节)和文件数"""
+    usage = count = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            usage += os.stat(os.path.join(root, file)).st_blocks * 512
+            count += 1
+    return usage, count
+
+
+class Command(BaseCommand):
+    """对比 按日期目录保存/按内容保存 上传文件时的磁盘占用和保存耗时"""
+    help = '上传文件存储的基准测试'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=200, help='上传的文件数')
+        parser.add_argument('--size', type=int, default=256, help='文件大小(KB)')
+        parser.add_argument('--duplicates', type=float, default=0.3,
+                            help='重复上传的比例(与之前上传的文件内容相同)')
+
+    def handle(self, *args, **options):
+        number, size = options['number'], options['size'] * 1024
+        rng = random.Random(0)
+        unique = max(1, round(number * (1 - options['duplicates'])))
+        # 前 unique 个文件内容不同，之后的文件随机重复之前的内容
+        order = list(range(unique)) + [rng.randrange(unique) for _ in range(number - unique)]
+        rng.shuffle(order)
+
+        work = tempfile.mkdtemp()
+        try:
+            # 上传的文件(相当于上传时写入的临时文件)
+            sources = []
+            for i in range(unique):
+                path = os.path.join(work, 'upload-%d.jpg' % i)
+                with open(path, 'wb') as f:
+                    f.write(os.urandom(size))
+                sources.append(path)
+
+            for label, storage_class, kwargs in (
+                    ('按日期目录保存', FileSystemStorage, {}),
+                    ('按内容保存', ContentAddressedStorage, {'track': False})):
+                location = os.path.join(work, storage_class.__name__)
+                storage = storage_class(location=location, **kwargs)
+                latencies = []
+                for i in order:
+                    with open(sources[i], 'rb') as f:
+                        start = time.perf_counter()
+                        storage.save('avatar/20200101/upload.jpg', File(f))
+                        latencies.append(time.perf_counter() - start)
+                latencies.sort()
+                usage, count = disk_usage(location)
+                self.stdout.write('%s: 文件 %d 个, 磁盘占用 %.1f MB, 保存耗时 平均 %.2f ms, p95 %.2f ms' % (
+                    label, count, usage / 1024 / 1024, sum(latencies) / len(latencies) * 1000,
+                    latencies[int(len(latencies) * 0.95)] * 1000))
+        finally:
+            shutil.rmtree(work)
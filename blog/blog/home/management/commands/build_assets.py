@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from utils import assets
+
+
+class Command(BaseCommand):
+    """合并压缩每个页面的js，收集静态文件(文件名带哈希值，生成 .gz/.br)，输出每个页面js的大小对比"""
+    help = '构建静态文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-collect', action='store_true',
+                            help='只生成合并文件，不运行 collectstatic')
+
+    def handle(self, *args, **options):
+        if assets.rjsmin is None:
+            self.stderr.write('没有安装rjsmin，js只合并不压缩')
+        if assets.brotli is None:
+            self.stderr.write('没有安装brotli，不生成 .br 文件')
+
+        # 1.生成合并文件
+        results = assets.write_bundles()
+
+        # 2.收集静态文件
+        if not options['no_collect']:
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+        # 3.每个页面的js: 原文件(分别请求) -> 合并压缩 -> gzip -> brotli
+        self.stdout.write('%-16s %8s %8s %8s %8s %10s' % ('页面', '请求数', '原文件', '合并后', 'gzip', 'brotli'))
+        for name, total, data in results:
+            br = assets.brotli_bytes(data)
+            self.stdout.write('%-16s %6d->1 %7.1fK %7.1fK %7.1fK %9s' % (
+                name, len(settings.ASSET_BUNDLES[name]), total / 1024, len(data) / 1024,
+                len(assets.gzip_bytes(data)) / 1024, '%.1fK' % (len(br) / 1024) if br else '-'))
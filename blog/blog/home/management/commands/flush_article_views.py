@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import time
+from django.core.management.base import BaseCommand
+from home.counters import flush_article_views
+
+
+class Command(BaseCommand):
+    """将redis中缓冲的文章浏览量批量写回数据库"""
+    help = '将redis中缓冲的文章浏览量批量写回数据库'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='循环刷新的间隔(秒)，默认只刷新一次')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='每条UPDATE语句更新的文章数')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            total = flush_article_views(batch_size=options['batch_size'])
+            self.stdout.write('写回浏览量: %d' % total)
+            if not interval:
+                break
+            time.sleep(interval)
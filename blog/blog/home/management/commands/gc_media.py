@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from utils.storage import collect_garbage, recount_references
+
+
+class Command(BaseCommand):
+    """删除没有被文章和用户引用的上传文件(按内容保存的文件)"""
+    help = '回收没有被引用的上传文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=settings.MEDIA_GC_GRACE,
+                            help='引用计数为0的文件保留的时间(秒)')
+        parser.add_argument('--recount', action='store_true',
+                            help='回收前根据文章和用户的图片字段重新统计引用计数')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='只统计可以回收的文件，不删除')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write('修正引用计数的文件: %d' % recount_references())
+        count, size = collect_garbage(grace=timedelta(seconds=options['grace']), dry_run=options['dry_run'])
+        self.stdout.write('%s文件: %d, 释放空间: %.1f KB' % (
+            '可回收' if options['dry_run'] else '已回收', count, size / 1024))
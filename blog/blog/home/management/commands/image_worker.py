@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from utils.image_queue import Worker, recover_processing
+
+
+class Command(BaseCommand):
+    """从redis队列中取出图片处理任务，在进程池中生成衍生图"""
+    help = '后台生成上传图片的衍生图(从redis队列中取出任务)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.IMAGE_WORKER_CONCURRENCY,
+                            help='同时处理图片的进程数')
+        parser.add_argument('--recover', action='store_true',
+                            help='启动前将上次异常退出时未完成的任务放回队列(只运行一个worker时使用)')
+
+    def handle(self, *args, **options):
+        if options['recover']:
+            self.stdout.write('恢复任务: %d' % recover_processing())
+        worker = Worker(concurrency=options['concurrency'])
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from django.core.management.base import BaseCommand
+from home import leaderboard
+
+
+class Command(BaseCommand):
+    """根据数据库重建redis中的热门文章排行榜(redis数据被清空后使用)"""
+    help = '根据数据库重建redis中的热门文章排行榜'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='每批写入排行榜的文章数')
+
+    def handle(self, *args, **options):
+        total = leaderboard.rebuild(batch_size=options['batch_size'])
+        self.stdout.write('排行榜文章数: %d' % total)
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from django.core.management.base import BaseCommand
+from home import search
+
+
+class Command(BaseCommand):
+    """重建redis中的文章搜索索引(redis数据被清空或修改分词规则后使用)，完成后再切换，重建期间搜索不中断"""
+    help = '重建文章搜索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='每批索引的文章数')
+
+    def handle(self, *args, **options):
+        total = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write('索引文章数: %d' % total)
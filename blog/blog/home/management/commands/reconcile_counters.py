@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from django.core.management.base import BaseCommand
+from home import page_cache
+from home.caches import invalidate_categories
+from home.counters import reconcile_comments_count, reconcile_article_count
+
+
+class Command(BaseCommand):
+    """根据评论表和文章表重新统计文章的评论数和分类的文章数，修正不一致的计数"""
+    help = '重新统计文章的评论数和分类的文章数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='每批统计的文章数')
+
+    def handle(self, *args, **options):
+        articles = reconcile_comments_count(batch_size=options['batch_size'])
+        self.stdout.write('修正评论数的文章: %d' % articles)
+        categories = reconcile_article_count()
+        self.stdout.write('修正文章数的分类: %d' % categories)
+        # bulk_update 不触发信号，有修正时清除缓存
+        if categories:
+            invalidate_categories()
+        if articles or categories:
+            page_cache.invalidate_all()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from django.core.management.base import BaseCommand
+from home.models import Article
+from home.render import render_article, RENDERED_FIELDS
+
+
+class Command(BaseCommand):
+    """渲染已有文章的正文(新增渲染字段之后回填，或修改渲染规则后重新渲染)"""
+    help = '渲染已有文章的正文'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='重新渲染所有文章，默认只渲染尚未渲染的文章')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='每批渲染并更新的文章数')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        articles = Article.objects.only('id', 'content').order_by('id')
+        if not options['all']:
+            articles = articles.filter(content_html='')
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(articles.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for article in batch:
+                render_article(article)
+            # bulk_update 只更新渲染字段，不触发信号，不修改文章的更新时间
+            Article.objects.bulk_update(batch, RENDERED_FIELDS)
+            total += len(batch)
+            self.stdout.write('已渲染: %d' % total)
+        self.stdout.write('渲染完成: %d' % total)
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:07
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_articles(apps, schema_editor):
+    # 按分类分组统计已有文章数
+    ArticleCategory = apps.get_model('home', 'ArticleCategory')
+    Article = apps.get_model('home', 'Article')
+    counts = Article.objects.filter(category__isnull=False).values('category').annotate(n=Count('id'))
+    for row in counts:
+        ArticleCategory.objects.filter(id=row['category']).update(article_count=row['n'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0004_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articlecategory',
+            name='article_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_articles, migrations.RunPython.noop),
+    ]
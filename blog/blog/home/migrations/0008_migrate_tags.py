@@ -0,0 +1,46 @@
+import re
+
+from django.db import migrations
+
+TAG_SPLIT_RE = re.compile(r'[,，;；、\s]+')
+
+
+def split_tags(apps, schema_editor):
+    # 将文章 tags 字段中的标签拆分到标签表和关联表，并统计标签的文章数
+    Article = apps.get_model('home', 'Article')
+    Tag = apps.get_model('home', 'Tag')
+    ArticleTag = apps.get_model('home', 'ArticleTag')
+
+    tags = {}
+    links = []
+    for article_id, value, created in Article.objects.exclude(tags='').values_list('id', 'tags', 'created').iterator():
+        seen = set()
+        for name in TAG_SPLIT_RE.split(value):
+            name = name[:20]
+            if not name or name.lower() in seen:
+                continue
+            seen.add(name.lower())
+            tag = tags.get(name.lower())
+            if tag is None:
+                tag = tags[name.lower()] = Tag.objects.create(name=name)
+            tag.article_count += 1
+            links.append(ArticleTag(article_id=article_id, tag=tag, created=created))
+
+    ArticleTag.objects.bulk_create(links, batch_size=1000)
+    Tag.objects.bulk_update(tags.values(), ['article_count'], batch_size=1000)
+
+
+def clear_tags(apps, schema_editor):
+    apps.get_model('home', 'ArticleTag').objects.all().delete()
+    apps.get_model('home', 'Tag').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_tags, clear_tags),
+    ]
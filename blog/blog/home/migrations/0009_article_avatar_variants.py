@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0008_migrate_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
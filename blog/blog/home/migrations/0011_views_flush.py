@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_media_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewsFlush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.PositiveBigIntegerField(unique=True)),
+                ('last_id', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': '浏览量刷新',
+                'verbose_name_plural': '浏览量刷新',
+                'db_table': 'tb_views_flush',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0011_views_flush'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='tags',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
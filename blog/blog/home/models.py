@@ -10,6 +10,8 @@ class ArticleCategory(models.Model):
     title = models.CharField(max_length=100, blank=True)
     # 分类的创建时间
     created = models.DateTimeField(default=timezone.now)
+    # 分类下的文章数(由信号维护，manage.py reconcile_counters 校正)
+    article_count = models.PositiveIntegerField(default=0)
 
     # admin站点显示,调试查看对象方便
     def __str__(self):
@@ -21,6 +23,28 @@ class ArticleCategory(models.Model):
         verbose_name_plural = verbose_name
 
 
+class Tag(models.Model):
+    """文章标签"""
+    # 标签名
+    name = models.CharField(max_length=20, unique=True)
+    # 使用该标签的文章数(由信号维护，标签云直接按该字段排序)
+    article_count = models.PositiveIntegerField(default=0)
+    # 标签的创建时间
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        db_table = 'tb_tag'
+        verbose_name = '标签管理'
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 标签云: 按文章数倒序
+            models.Index(fields=['-article_count'], name='tag_article_count_idx'),
+        ]
+
+
 class Article(models.Model):
     """
     作者
@@ -41,6 +65,8 @@ class Article(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     # 文章标题图
     avatar = models.ImageField(upload_to='article/%Y%m%d/', blank=True)
+    # 标题图的衍生图(不同宽度的JPEG/WebP和模糊占位图，manage.py image_worker 在后台生成)
+    avatar_variants = models.JSONField(default=dict, blank=True)
     # 文章标题
     title = models.CharField(max_length=100, blank=False)
     # 分类(文章栏目的 “一对多” 外键)
@@ -51,15 +77,23 @@ class Article(models.Model):
         on_delete=models.CASCADE,
         related_name='article'
     )
-    # 文章标签
-    tags = models.CharField(max_length=20, blank=True)
+    # 文章标签(多个标签用逗号或空格分隔，保存时同步到 tag_list，单个标签最长20个字)
+    tags = models.CharField(max_length=200, blank=True)
+    # 规范化的标签(多对多，通过 ArticleTag 关联)
+    tag_list = models.ManyToManyField(Tag, through='ArticleTag', related_name='articles', blank=True)
     # 摘要信息(概要)
     sumary = models.CharField(max_length=200, null=False, blank=False)
     # 文章正文
     content = models.TextField()
+    # 渲染后的正文(过滤后带标题锚点)、目录、字数、阅读时间(分钟)
+    # 保存文章时正文有修改则重新渲染(home.render)，详情页直接输出
+    content_html = models.TextField(blank=True)
+    toc = models.TextField(blank=True)
+    word_count = models.PositiveIntegerField(default=0)
+    reading_time = models.PositiveIntegerField(default=0)
     # 浏览量
     total_views = models.PositiveIntegerField(default=0)
-    # 评论量(文章评论数)
+    # 评论量(文章评论数，发表评论时在数据库中原子递增，manage.py reconcile_counters 校正)
     comments_count = models.PositiveIntegerField(default=0)
     # 文章的创建时间
     # 参数 default=timezone.now 指定其在创建数据时将默认写入当前的时间
@@ -77,6 +111,13 @@ class Article(models.Model):
         db_table = 'tb_article'
         verbose_name = '文章管理'
         verbose_name_plural = verbose_name
+        # 索引与热点查询的访问路径一致
+        indexes = [
+            # 首页: 按分类查询文章，按创建时间倒序(游标分页按 created, id)
+            models.Index(fields=['category', '-created', '-id'], name='article_category_created_idx'),
+            # 热门文章: 按浏览量倒序
+            models.Index(fields=['-total_views'], name='article_total_views_idx'),
+        ]
 
     # 函数 __str__ 定义当调用对象的 str() 方法时的返回值内容
     # 它最常见的就是在Django管理后台中做为对象的显示值。因此应该总是为 __str__ 返回一个友好易读的字符串
@@ -84,6 +125,60 @@ class Article(models.Model):
         # 将文章标题返回
         return self.title
 
+    # 保存时需要与修改前比较的字段(分类、正文、标签、创建时间、标题图，由信号处理)
+    TRACKED_FIELDS = ('category_id', 'content', 'tags', 'created', 'avatar')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # 记录从数据库加载时的值，保存时不再查询修改前的值(延迟加载的字段不记录)
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {name: value for name, value in zip(field_names, values)
+                                   if name in cls.TRACKED_FIELDS}
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        self.remember_values(fields)
+
+    def remember_values(self, fields=None):
+        """
+        把当前的值记录为修改前的值(保存或重新加载后调用)
+        :param fields: 只记录这些字段，默认所有已加载的字段
+        """
+        names = self.TRACKED_FIELDS
+        if fields is not None:
+            fields = {self._meta.get_field(field).attname for field in fields}
+            names = [name for name in names if name in fields]
+        values = getattr(self, '_loaded_values', {}).copy()
+        for name in names:
+            if name in self.__dict__:
+                values[name] = self.avatar.name if name == 'avatar' else self.__dict__[name]
+        self._loaded_values = values
+
+    @property
+    def tag_names(self):
+        """标签名列表(解析 tags 字段，不查询数据库)"""
+        from home.tags import parse_tags
+        return parse_tags(self.tags)
+
+
+class ArticleTag(models.Model):
+    """文章和标签的关联"""
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    # 文章的创建时间(冗余字段，标签页按 (tag, created, id) 的索引进行游标分页)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'tb_article_tag'
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'article'], name='article_tag_unique'),
+        ]
+        indexes = [
+            # 标签页: 按标签查询文章，按文章的创建时间倒序
+            models.Index(fields=['tag', '-created', '-id'], name='article_tag_created_idx'),
+        ]
+
 
 class Comment(models.Model):
     """
@@ -112,3 +207,55 @@ class Comment(models.Model):
         db_table = 'tb_comment'
         verbose_name = '评论管理'
         verbose_name_plural = verbose_name
+        indexes = [
+            # 详情页: 按文章查询评论，按评论时间倒序
+            models.Index(fields=['article', '-created'], name='comment_article_created_idx'),
+        ]
+
+
+class MediaFile(models.Model):
+    """
+    按内容保存的上传文件(utils.storage.ContentAddressedStorage)
+    相同内容的文件只保存一份，引用计数为0且超过保留时间的文件由 manage.py gc_media 删除
+    """
+    # 文件名(cas/sha256前两位/3-4位/sha256.扩展名)
+    name = models.CharField(max_length=255, unique=True)
+    # 文件大小(字节)
+    size = models.BigIntegerField(default=0)
+    # 引用该文件的文章和用户数(由信号维护，manage.py gc_media --recount 校正)
+    refcount = models.PositiveIntegerField(default=0)
+    # 文件的创建时间
+    created = models.DateTimeField(auto_now_add=True)
+    # 最后一次上传或释放的时间(回收时保留一段时间，避免删除刚上传还没有保存到模型的文件)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        db_table = 'tb_media_file'
+        verbose_name = '文件管理'
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 回收: 按引用计数和最后修改时间查询
+            models.Index(fields=['refcount', 'updated'], name='media_file_gc_idx'),
+        ]
+
+
+class ViewsFlush(models.Model):
+    """
+    浏览量写回数据库的进度(home.counters.flush_article_views)
+    与文章的UPDATE在同一个事务中保存，刷新中断后重新执行时跳过已经写回的文章，同一个增量不会写回两次
+    """
+    # 刷新批次号(redis中增量hash每次改名为刷新hash时加1)
+    generation = models.PositiveBigIntegerField(unique=True)
+    # 该批次已经写回的最大文章id(按文章id从小到大写回，与文章id同为BIGINT)
+    last_id = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return '%s:%s' % (self.generation, self.last_id)
+
+    class Meta:
+        db_table = 'tb_views_flush'
+        verbose_name = '浏览量刷新'
+        verbose_name_plural = verbose_name
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 首页的整页缓存(页面对所有用户相同，登录用户的导航栏由js根据cookie显示)
+# 缓存键中包含版本号，文章或分类修改时更新版本号，旧版本的页面自然失效
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+
+# 所有首页的版本号(分类修改时更新，导航栏会变化)
+GLOBAL_VERSION_KEY = 'page:index:version'
+# 某个分类下首页的版本号(该分类的文章修改时更新)
+CATEGORY_VERSION_KEY = 'page:index:version:%s'
+PAGE_KEY = 'page:index:%s:%s:%s:%s'
+
+
+def page_key(cat_id, page_size, page_num=None):
+    """
+    生成首页的缓存键(渲染之前生成，渲染期间文章被修改时不会把旧页面缓存到新版本下)
+    游标分页只缓存第一页: 游标可以任意构造，按游标缓存会产生无限多的缓存
+    :param cat_id: 分类id
+    :param page_size: 每页数量
+    :param page_num: 页码(整数，使用页码分页时)，None 表示游标分页的第一页
+    """
+    versions = cache.get_many([GLOBAL_VERSION_KEY, CATEGORY_VERSION_KEY % cat_id])
+    version = '%s.%s' % (versions.get(GLOBAL_VERSION_KEY, 0), versions.get(CATEGORY_VERSION_KEY % cat_id, 0))
+    return PAGE_KEY % (version, cat_id, page_size, '' if page_num is None else page_num)
+
+
+def get_page(key):
+    """
+    获取缓存的首页
+    :return: HttpResponse，没有缓存时返回None
+    """
+    content = cache.get(key)
+    if content is None:
+        return None
+    return HttpResponse(content)
+
+
+def set_page(key, response):
+    """缓存首页(只缓存正常响应)"""
+    if response.status_code != 200:
+        return
+    cache.set(key, response.content, settings.INDEX_PAGE_CACHE_TIMEOUT)
+
+
+def invalidate_category(*cat_ids):
+    """使分类下的首页缓存失效"""
+    version = time.time_ns()
+    cache.set_many({CATEGORY_VERSION_KEY % cat_id: version for cat_id in cat_ids if cat_id}, None)
+
+
+def invalidate_all():
+    """使所有首页缓存失效"""
+    cache.set(GLOBAL_VERSION_KEY, time.time_ns(), None)
+
+
+def set_cache_control(response):
+    """
+    首页可以被共享缓存(反向代理)保存 INDEX_PAGE_SHARED_MAX_AGE 秒，
+    浏览器每次重新请求(发表文章后跳转到首页时能看到新文章)
+    """
+    patch_cache_control(response, public=True, max_age=0, s_maxage=settings.INDEX_PAGE_SHARED_MAX_AGE)
+    return response
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 分页工具
+# 游标(keyset)分页: 以 (created, id) 作为游标，上一页/下一页都只需一次索引范围查询，
+# 不需要 COUNT(*)，也不会随着页码变深而变慢
+import base64
+import binascii
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+# 游标中id的上限(BIGINT)
+MAX_ID = 2 ** 63
+
+
+def clamp_page_size(value, default=10):
+    """
+    将页面大小限制在 1 ~ settings.PAGE_SIZE_MAX 之间，避免一次请求查询过多数据
+    :param value: 请求中的 page_size 参数
+    :param default: 参数缺失或非法时使用的默认值
+    """
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, settings.PAGE_SIZE_MAX))
+
+
+def encode_cursor(obj):
+    """根据对象的 (created, id) 生成游标字符串"""
+    raw = '%s|%d' % (obj.created.isoformat(), obj.id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标字符串
+    :return: (created, id)
+    :raise ValueError: 游标不合法
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        created, pk = datetime.fromisoformat(created), int(pk)
+        # 游标由 encode_cursor 生成，时间总是带时区；转换为UTC，超出范围的时间在这里报错而不是查询时
+        if created.tzinfo is None:
+            raise ValueError('时间没有时区')
+        created = created.astimezone(timezone.utc)
+    except (TypeError, UnicodeDecodeError, binascii.Error, OverflowError) as e:
+        raise ValueError('非法的游标: %s' % e)
+    if not 0 < pk < MAX_ID:
+        raise ValueError('非法的游标: id超出范围')
+    return created, pk
+
+
+class KeysetPage(object):
+    """游标分页的一页数据"""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1]) if self.object_list else ''
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0]) if self.object_list else ''
+
+
+def keyset_paginate(queryset, page_size, after=None, before=None):
+    """
+    按 (created, id) 倒序进行游标分页
+    :param queryset: 查询集
+    :param page_size: 每页数量
+    :param after: 下一页游标(上一页最后一条数据的游标)
+    :param before: 上一页游标(下一页第一条数据的游标)
+    :return: KeysetPage
+    :raise ValueError: 游标不合法
+    """
+    if before:
+        created, pk = decode_cursor(before)
+        rows = list(queryset.filter(Q(created__gt=created) | Q(created=created, id__gt=pk))
+                    .order_by('created', 'id')[:page_size + 1])
+        has_previous = len(rows) > page_size
+        object_list = rows[:page_size][::-1]
+        return KeysetPage(object_list, has_next=True, has_previous=has_previous)
+
+    queryset = queryset.order_by('-created', '-id')
+    if after:
+        created, pk = decode_cursor(after)
+        queryset = queryset.filter(Q(created__lt=created) | Q(created=created, id__lt=pk))
+    rows = list(queryset[:page_size + 1])
+    return KeysetPage(rows[:page_size], has_next=len(rows) > page_size, has_previous=bool(after))
+
+
+class CountedPaginator(Paginator):
+    """使用已知的总数(如反规范化的计数字段)的分页器，不执行 COUNT 查询"""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @property
+    def count(self):
+        return self._count
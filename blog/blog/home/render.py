@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 文章正文的渲染
+# 发布(修改)文章时渲染一次并保存结果，详情页直接输出，不在每次请求中处理
+#   按白名单过滤CKEditor提交的HTML(防止XSS)
+#   给标题添加锚点，生成目录
+#   统计字数，估算阅读时间
+import math
+import re
+from collections import namedtuple
+from html import escape
+from html.parser import HTMLParser
+from django.utils.text import slugify
+
+# 允许的标签
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'code', 'del', 'div', 'em', 'figcaption', 'figure',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'ins', 'kbd', 'li', 'ol', 'p', 'pre', 's',
+    'small', 'span', 'strike', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead',
+    'tr', 'u', 'ul',
+}
+# 没有结束标签的元素
+VOID_TAGS = {'br', 'hr', 'img'}
+# 连同内容一起删除的标签
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'noscript', 'textarea', 'template', 'title'}
+# 允许的属性(所有标签 + 各个标签)
+ALLOWED_ATTRS = {'class', 'title', 'style'}
+TAG_ATTRS = {
+    'a': {'href', 'target'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'ol': {'start'},
+    'table': {'border', 'cellpadding', 'cellspacing'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+}
+URL_ATTRS = {'href', 'src'}
+ALLOWED_SCHEMES = {'http', 'https', 'mailto'}
+# style 属性中允许的样式
+ALLOWED_STYLES = {
+    'color', 'background-color', 'text-align', 'text-decoration', 'font-weight', 'font-style',
+    'font-size', 'width', 'height', 'float', 'margin', 'margin-left', 'margin-right',
+}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+SCHEME_RE = re.compile(r'^([a-z][a-z0-9+.\-]*):')
+# 中日韩文字每个字算一个字，其他文字按单词计算
+CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['’.\-][A-Za-z0-9]+)*")
+# 每分钟阅读的中文字数和英文单词数
+CJK_PER_MINUTE = 400
+WORDS_PER_MINUTE = 200
+
+# 渲染结果  html: 过滤后带锚点的正文  toc: 目录HTML  word_count: 字数  reading_time: 阅读时间(分钟)
+RenderResult = namedtuple('RenderResult', ['html', 'toc', 'word_count', 'reading_time'])
+# 渲染结果保存的字段(使用 update_fields 保存正文时需要一并保存)
+RENDERED_FIELDS = ['content_html', 'toc', 'word_count', 'reading_time']
+
+
+def safe_url(value):
+    """只允许 http, https, mailto 和相对地址"""
+    # 浏览器会忽略地址中的空白和控制字符(如 java\tscript:)
+    normalized = re.sub(r'[\x00-\x20]', '', value).lower()
+    match = SCHEME_RE.match(normalized)
+    return match is None or match.group(1) in ALLOWED_SCHEMES
+
+
+def safe_style(value):
+    """只保留白名单中的样式，不允许 url() 和 expression()"""
+    declarations = []
+    for declaration in value.split(';'):
+        name, _, style = declaration.partition(':')
+        name, style = name.strip().lower(), style.strip()
+        if name in ALLOWED_STYLES and style and not re.search(r'url\(|expression|\\|/\*', style, re.I):
+            declarations.append('%s: %s' % (name, style))
+    return '; '.join(declarations)
+
+
+class Renderer(HTMLParser):
+    """单次遍历HTML，过滤标签和属性，同时收集标题和正文文字"""
+
+    def __init__(self, anchors=True):
+        super().__init__(convert_charrefs=True)
+        self.anchors = anchors
+        self.out = []
+        # 已经打开的标签
+        self.stack = []
+        # 正在删除内容的标签层数
+        self.dropping = 0
+        self.text = []
+        # [(级别, id, 标题文字)]
+        self.headings = []
+        self.heading_ids = set()
+        # 正在处理的标题 (在out中的位置, 标签层数, 标题文字)
+        self.heading = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRS | TAG_ATTRS.get(tag, set())
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRS and not safe_url(value):
+                continue
+            if name == 'style':
+                value = safe_style(value)
+                if not value:
+                    continue
+            parts.append('%s="%s"' % (name, escape(value)))
+        if tag == 'a' and 'target="_blank"' in parts:
+            # 新窗口打开的链接不能访问 window.opener
+            parts.append('rel="noopener noreferrer"')
+        self.out.append('<%s>' % ' '.join(parts))
+        if tag in VOID_TAGS:
+            return
+        self.stack.append(tag)
+        if tag in HEADING_TAGS and self.anchors and self.heading is None:
+            self.heading = (len(self.out) - 1, len(self.stack), [])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.stack:
+            return
+        # 关闭中间没有结束的标签
+        while self.stack:
+            depth = len(self.stack)
+            current = self.stack.pop()
+            if self.heading is not None and self.heading[1] == depth:
+                self.close_heading(current)
+            self.out.append('</%s>' % current)
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.out.append(escape(data, quote=False))
+        self.text.append(data)
+        if self.heading is not None:
+            self.heading[2].append(data)
+
+    def close_heading(self, tag):
+        index, _, text = self.heading
+        self.heading = None
+        title = ' '.join(''.join(text).split())
+        slug = 'toc-' + (slugify(title, allow_unicode=True) or 'section')
+        anchor, n = slug, 1
+        while anchor in self.heading_ids:
+            n += 1
+            anchor = '%s-%d' % (slug, n)
+        self.heading_ids.add(anchor)
+        self.headings.append((int(tag[1]), anchor, title))
+        # 给标题加上id和锚点
+        self.out[index] = self.out[index][:-1] + ' id="%s">' % anchor
+        self.out.append('<a class="heading-anchor" href="#%s">#</a>' % anchor)
+
+    def close(self):
+        super().close()
+        while self.stack:
+            self.handle_endtag(self.stack[-1])
+        return ''.join(self.out)
+
+
+def build_toc(headings):
+    """根据标题生成目录，按标题级别缩进"""
+    if not headings:
+        return ''
+    top = min(level for level, _, _ in headings)
+    items = ['<li class="toc-level-%d"><a href="#%s">%s</a></li>' % (level - top, anchor, escape(title))
+             for level, anchor, title in headings]
+    return '<ul class="toc">%s</ul>' % ''.join(items)
+
+
+def count_words(text):
+    """
+    统计字数
+    :return: (中日韩文字数, 其他文字的单词数)
+    """
+    return len(CJK_RE.findall(text)), len(WORD_RE.findall(text))
+
+
+def sanitize(html):
+    """按白名单过滤HTML(评论等不需要目录的内容)"""
+    renderer = Renderer(anchors=False)
+    renderer.feed(html or '')
+    return renderer.close()
+
+
+def render(html):
+    """
+    渲染文章正文
+    :param html: 编辑器提交的HTML
+    :return: RenderResult
+    """
+    renderer = Renderer()
+    renderer.feed(html or '')
+    content_html = renderer.close()
+    cjk, words = count_words(''.join(renderer.text))
+    minutes = cjk / CJK_PER_MINUTE + words / WORDS_PER_MINUTE
+    reading_time = max(1, math.ceil(minutes)) if cjk or words else 0
+    return RenderResult(content_html, build_toc(renderer.headings), cjk + words, reading_time)
+
+
+def render_article(article):
+    """渲染文章正文，结果保存到文章的 RENDERED_FIELDS 字段中(不保存到数据库)"""
+    result = render(article.content)
+    article.content_html = result.html
+    article.toc = result.toc
+    article.word_count = result.word_count
+    article.reading_time = result.reading_time
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 文章全文搜索
+# redis中的倒排索引: 中日韩文字按相邻两个字(bigram)切分，其他文字按单词切分
+# 标题、标签、摘要、正文按不同权重计算词频，每个词的倒排列表是有序集合，分数为写入时计算好的BM25词项得分，
+# 查询时由redis按每个词的IDF加权合并(ZUNIONSTORE)并排序，只取回当前页，不在python中遍历倒排列表
+# 索引带版本号，重建时写入新版本，完成后再切换，重建期间搜索使用旧版本
+import hashlib
+import math
+import re
+from collections import Counter
+from html import unescape
+from django.utils.html import strip_tags
+from django_redis import get_redis_connection
+from home.models import Article
+
+# 当前使用的索引版本
+VERSION_KEY = 'search:version'
+# 正在重建的索引版本(重建期间文章的修改同时写入)
+BUILDING_KEY = 'search:building'
+# 分配索引版本号
+VERSION_SEQ_KEY = 'search:versions'
+# 索引的修改次数(查询结果的缓存key包含修改次数，索引修改后不使用旧的结果)
+CHANGES_KEY = 'search:changes'
+# 重建期间由文章的修改写入(或删除)新版本的文章id  set  重建时不再写入这些文章
+INDEXED_KEY = 'search:%s:indexed'
+# 倒排列表  zset  member: 文章id  score: BM25词项得分
+TERM_KEY = 'search:%s:term:%s'
+# 文章包含的词(更新和删除文章的索引时使用)  set
+DOC_TERMS_KEY = 'search:%s:doc:%s'
+# 文章的加权长度  hash  field: 文章id  value: 长度(HLEN为索引的文章数)
+DOC_LEN_KEY = 'search:%s:doclen'
+# 所有文章的加权长度之和
+TOTAL_LEN_KEY = 'search:%s:totallen'
+# 查询结果(合并后的有序集合，翻页时直接使用)  search:版本:result:修改次数:查询词的md5
+RESULT_KEY = 'search:%s:result:%s:%s'
+RESULT_TIMEOUT = 60
+
+# 字段的权重
+FIELD_WEIGHTS = (('title', 5), ('tags', 3), ('sumary', 2), ('content', 1))
+# BM25参数
+K1 = 1.2
+B = 0.75
+# 查询最多使用的词数
+MAX_QUERY_TERMS = 32
+
+TOKEN_RE = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)|([a-z0-9]+)')
+
+
+def tokenize(text):
+    """
+    分词: 连续的中日韩文字切分为相邻的两个字(只有一个字时为单字)，其他文字按字母和数字切分为单词
+    :return: 词的列表(英文转为小写)
+    """
+    tokens = []
+    for cjk, word in TOKEN_RE.findall(text.lower()):
+        if not cjk:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def document_terms(article):
+    """
+    计算文章的加权词频
+    :return: (Counter {词: 加权词频}, 加权长度)
+    """
+    terms = Counter()
+    length = 0
+    for field, weight in FIELD_WEIGHTS:
+        if field == 'content':
+            # 正文是HTML，只索引文字
+            value = unescape(strip_tags(article.content_html or article.content))
+        else:
+            value = getattr(article, field) or ''
+        tokens = tokenize(value)
+        length += weight * len(tokens)
+        for token in tokens:
+            terms[token] += weight
+    return terms, length
+
+
+def term_score(frequency, length, average_length):
+    """
+    BM25中与文章相关的部分(词频和长度归一化)，写入倒排列表
+    平均长度使用写入时的值，文章数变化较大后可以重建索引
+    """
+    norm = K1 * (1 - B + B * length / (average_length or 1))
+    return frequency * (K1 + 1) / (frequency + norm)
+
+
+def idf(count, document_frequency):
+    """BM25中与词相关的部分，查询时作为合并的权重"""
+    return math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def _versions(redis_conn):
+    """需要写入的索引版本: 当前版本，以及正在重建的版本"""
+    version, building = redis_conn.mget(VERSION_KEY, BUILDING_KEY)
+    versions = [(version or b'0').decode()]
+    if building:
+        versions.append(building.decode())
+    return versions
+
+
+def _add(pipe, version, article_id, terms, length, average_length):
+    """写入文章的倒排列表"""
+    for term, frequency in terms.items():
+        pipe.zadd(TERM_KEY % (version, term), {article_id: term_score(frequency, length, average_length)})
+    pipe.delete(DOC_TERMS_KEY % (version, article_id))
+    if terms:
+        pipe.sadd(DOC_TERMS_KEY % (version, article_id), *terms)
+    pipe.hset(DOC_LEN_KEY % version, article_id, length)
+    pipe.incrby(TOTAL_LEN_KEY % version, length)
+
+
+def _remove(pipe, version, article_id, terms, old_length):
+    """删除文章的倒排列表"""
+    for term in terms:
+        pipe.zrem(TERM_KEY % (version, term), article_id)
+    pipe.delete(DOC_TERMS_KEY % (version, article_id))
+    pipe.hdel(DOC_LEN_KEY % version, article_id)
+    if old_length:
+        pipe.decrby(TOTAL_LEN_KEY % version, int(old_length))
+
+
+def index_article(article):
+    """
+    更新文章的索引(文章保存后调用)
+    读取旧的词表和写入新的倒排列表在 WATCH 事务中完成，同一篇文章并发更新时重试
+    """
+    redis_conn = get_redis_connection('default')
+    terms, length = document_terms(article)
+    versions = _versions(redis_conn)
+    for version in versions:
+        doc_key = DOC_TERMS_KEY % (version, article.id)
+
+        def update(pipe, version=version, building=version != versions[0]):
+            old_terms = {term.decode() for term in pipe.smembers(doc_key)}
+            old_length = pipe.hget(DOC_LEN_KEY % version, article.id)
+            count = pipe.hlen(DOC_LEN_KEY % version)
+            total_length = int(pipe.get(TOTAL_LEN_KEY % version) or 0)
+            # 平均长度包含本文章的新长度
+            if old_length is None:
+                count += 1
+            total_length += length - int(old_length or 0)
+            pipe.multi()
+            # 文章长度变化后所有词的得分都会变化，全部重新写入
+            _remove(pipe, version, article.id, old_terms - set(terms), old_length)
+            _add(pipe, version, article.id, terms, length, total_length / count)
+            if building:
+                pipe.sadd(INDEXED_KEY % version, article.id)
+            pipe.incr(CHANGES_KEY)
+
+        redis_conn.transaction(update, doc_key)
+
+
+def remove_article(article_id):
+    """删除文章的索引(文章删除后调用)"""
+    redis_conn = get_redis_connection('default')
+    versions = _versions(redis_conn)
+    for version in versions:
+        doc_key = DOC_TERMS_KEY % (version, article_id)
+
+        def update(pipe, version=version, building=version != versions[0]):
+            old_terms = [term.decode() for term in pipe.smembers(doc_key)]
+            old_length = pipe.hget(DOC_LEN_KEY % version, article_id)
+            pipe.multi()
+            _remove(pipe, version, article_id, old_terms, old_length)
+            if building:
+                pipe.sadd(INDEXED_KEY % version, article_id)
+            pipe.incr(CHANGES_KEY)
+
+        redis_conn.transaction(update, doc_key)
+
+
+def search(query, offset=0, limit=10):
+    """
+    搜索文章
+        1.对查询分词
+        2.查询缓存的结果，同一个pipeline中取出文章总数和每个词的文章数
+        3.没有缓存时由redis按IDF加权合并所有词的倒排列表(ZUNIONSTORE)，保存一段时间供翻页使用
+        4.取出当前页
+    :return: (匹配的文章数, 当前页的文章id列表(按相关度倒序))
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return 0, []
+    redis_conn = get_redis_connection('default')
+    version, changes = redis_conn.mget(VERSION_KEY, CHANGES_KEY)
+    version = (version or b'0').decode()
+    digest = hashlib.md5(' '.join(terms).encode()).hexdigest()
+    result_key = RESULT_KEY % (version, int(changes or 0), digest)
+    end = offset + limit - 1
+
+    # 2.缓存的结果
+    pl = redis_conn.pipeline(transaction=False)
+    pl.zcard(result_key)
+    pl.zrevrange(result_key, offset, end)
+    pl.hlen(DOC_LEN_KEY % version)
+    for term in terms:
+        pl.zcard(TERM_KEY % (version, term))
+    total, page, count, *frequencies = pl.execute()
+    if not total:
+        # 3.合并倒排列表
+        weights = {
+            TERM_KEY % (version, term): idf(count, frequency)
+            for term, frequency in zip(terms, frequencies) if frequency
+        }
+        if not weights:
+            return 0, []
+        pl = redis_conn.pipeline(transaction=False)
+        pl.zunionstore(result_key, weights)
+        pl.expire(result_key, RESULT_TIMEOUT)
+        pl.zrevrange(result_key, offset, end)
+        total, _, page = pl.execute()
+    # 4.当前页
+    return total, [int(article_id) for article_id in page]
+
+
+def _delete_version(redis_conn, version):
+    """删除一个版本的索引"""
+    keys = []
+    for key in redis_conn.scan_iter('search:%s:*' % version, count=1000):
+        keys.append(key)
+        if len(keys) >= 500:
+            redis_conn.delete(*keys)
+            keys = []
+    if keys:
+        redis_conn.delete(*keys)
+
+
+def rebuild(batch_size=200):
+    """
+    重建所有文章的索引
+        1.分配新的版本号，重建期间文章的修改同时写入新版本
+        2.计算所有文章的平均长度
+        3.分批写入新版本的倒排列表，跳过重建期间已经由文章的修改写入(或删除)的文章
+        4.切换到新版本，删除旧版本(重建期间搜索使用旧版本)
+    :return: 索引的文章数
+    """
+    redis_conn = get_redis_connection('default')
+    old_version = _versions(redis_conn)[0]
+    version = redis_conn.incr(VERSION_SEQ_KEY)
+    redis_conn.set(BUILDING_KEY, version)
+
+    articles = Article.objects.only('id', 'title', 'tags', 'sumary', 'content', 'content_html').order_by('id')
+
+    def batches():
+        last_id = 0
+        while True:
+            batch = list(articles.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            yield batch
+
+    try:
+        # 2.平均长度(需要分词两次，重建是离线任务)
+        total = 0
+        total_length = 0
+        for batch in batches():
+            total += len(batch)
+            total_length += sum(document_terms(article)[1] for article in batch)
+        average_length = total_length / total if total else 1
+
+        # 3.写入倒排列表(读取的文章可能已经过期，与文章的修改写入新版本冲突时重试)
+        indexed_key = INDEXED_KEY % version
+        for batch in batches():
+            documents = [(article.id, document_terms(article)) for article in batch]
+
+            def add(pipe, documents=documents):
+                indexed = pipe.smembers(indexed_key)
+                pipe.multi()
+                for article_id, (terms, length) in documents:
+                    if str(article_id).encode() not in indexed:
+                        _add(pipe, version, article_id, terms, length, average_length)
+
+            redis_conn.transaction(add, indexed_key)
+    except Exception:
+        redis_conn.delete(BUILDING_KEY)
+        _delete_version(redis_conn, version)
+        raise
+
+    # 4.切换版本
+    pl = redis_conn.pipeline()
+    pl.set(VERSION_KEY, version)
+    pl.delete(BUILDING_KEY, INDEXED_KEY % version)
+    pl.incr(CHANGES_KEY)
+    pl.execute()
+    _delete_version(redis_conn, old_version)
+    return total
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 文章相关的信号处理(缓存失效等)
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from home.models import ArticleCategory, Article
+from home import leaderboard, page_cache, search
+from home.caches import invalidate_categories, invalidate_tag_cloud
+from home.render import render_article
+from home.tags import sync_article_tags, release_article_tags
+from utils import storage
+from utils.image_queue import variants_saved
+
+
+@receiver(pre_save, sender=Article)
+def article_saving(sender, instance, update_fields=None, **kwargs):
+    # 修改前的值: 从数据库加载的文章使用加载时记录的值(Article.from_db)，不再查询
+    old = getattr(instance, '_loaded_values', None)
+    if old is None and instance.pk:
+        # 指定主键直接构造的文章只查询较小的字段，正文按有修改处理
+        old = Article.objects.filter(pk=instance.pk).values('category_id', 'tags', 'created', 'avatar').first()
+
+    def changed(name):
+        # 未加载的字段不会保存，视为没有修改
+        return name in instance.__dict__ and (name not in old or old[name] != instance.__dict__[name])
+
+    if instance.pk:
+        # 记录修改前的分类，文章换了分类时两个分类的首页缓存都要失效
+        instance._old_category_id = old.get('category_id', instance.category_id) if old else None
+    # 记录修改前的标题图，保存后修改图片的引用计数
+    instance._old_avatar = old.get('avatar', instance.avatar.name) if old else None
+    # 标签或创建时间有修改时需要同步标签
+    instance._tags_changed = old is None or changed('tags') or changed('created')
+    # 新文章或正文有修改时渲染正文(只指定保存其他字段时不渲染)
+    if update_fields is None and 'content' in instance.__dict__ and \
+            (old is None or changed('content') or not instance.content_html):
+        render_article(instance)
+
+
+def adjust_article_count(category_id, delta):
+    """在数据库中原子修改分类的文章数"""
+    if not category_id:
+        return
+    categories = ArticleCategory.objects.filter(id=category_id)
+    if delta < 0:
+        categories = categories.filter(article_count__gte=-delta)
+    categories.update(article_count=F('article_count') + delta)
+
+
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, created, update_fields=None, **kwargs):
+    # 同步标签，标签的文章数变化时标签云缓存失效
+    if getattr(instance, '_tags_changed', True) and sync_article_tags(instance):
+        transaction.on_commit(invalidate_tag_cloud)
+    # 维护标题图的引用计数
+    old_avatar = getattr(instance, '_old_avatar', None)
+    if old_avatar != instance.avatar.name:
+        storage.release(old_avatar)
+        storage.retain(instance.avatar.name)
+    # 维护分类的文章数
+    old_category_id = getattr(instance, '_old_category_id', None)
+    if created:
+        adjust_article_count(instance.category_id, 1)
+    elif old_category_id != instance.category_id:
+        adjust_article_count(old_category_id, -1)
+        adjust_article_count(instance.category_id, 1)
+    # 标题可能被修改，清除排行榜的标题缓存
+    if not created:
+        leaderboard.invalidate_title(instance.id)
+    # 首页缓存失效
+    cat_ids = {instance.category_id, getattr(instance, '_old_category_id', None)}
+    transaction.on_commit(lambda: page_cache.invalidate_category(*cat_ids))
+    # 事务提交后更新搜索索引
+    transaction.on_commit(lambda: search.index_article(instance))
+    # 保存后的值作为下次保存时修改前的值
+    instance.remember_values(update_fields)
+
+
+@receiver(pre_delete, sender=Article)
+def article_deleting(sender, instance, **kwargs):
+    # 关联表的数据会被级联删除，删除前减少标签的文章数
+    if release_article_tags(instance):
+        transaction.on_commit(invalidate_tag_cloud)
+
+
+@receiver(post_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    adjust_article_count(instance.category_id, -1)
+    storage.release(instance.avatar.name)
+    # 从热门文章排行榜中移除
+    leaderboard.remove_article(instance.id)
+    # 首页缓存失效
+    category_id = instance.category_id
+    transaction.on_commit(lambda: page_cache.invalidate_category(category_id))
+    # 从搜索索引中删除
+    article_id = instance.id
+    transaction.on_commit(lambda: search.remove_article(article_id))
+
+
+@receiver(variants_saved, sender=Article)
+def article_variants_saved(sender, pk, **kwargs):
+    # 标题图的衍生图生成后，首页改为输出 srcset
+    category_id = Article.objects.filter(pk=pk).values_list('category_id', flat=True).first()
+    page_cache.invalidate_category(category_id)
+
+
+@receiver(post_save, sender=ArticleCategory)
+@receiver(post_delete, sender=ArticleCategory)
+def category_changed(sender, **kwargs):
+    # 事务提交后再清除缓存，避免其他进程在提交前重新缓存了旧数据
+    transaction.on_commit(invalidate_categories)
+    # 导航栏中的分类变化，所有首页缓存失效
+    transaction.on_commit(page_cache.invalidate_all)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 文章标签
+# 文章的 tags 字段(逗号或空格分隔的文本)在保存时同步到标签表和关联表，
+# 标签的文章数在数据库中原子增减，标签云直接按文章数排序，不需要分组统计
+import re
+from django.db import transaction
+from functools import reduce
+from operator import or_
+from django.db.models import F, Q
+from home.models import Article, Tag, ArticleTag
+
+TAG_SPLIT_RE = re.compile(r'[,，;；、\s]+')
+TAG_MAX_LENGTH = 20
+
+
+def parse_tags(value):
+    """
+    解析标签文本
+    :return: 标签名列表(去掉重复的标签，英文不区分大小写)
+    """
+    names = []
+    seen = set()
+    for name in TAG_SPLIT_RE.split(value or ''):
+        name = name[:TAG_MAX_LENGTH]
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return names
+
+
+def filter_tags(names):
+    """按标签名查询标签(不区分大小写)"""
+    return Tag.objects.filter(reduce(or_, (Q(name__iexact=name) for name in names)))
+
+
+def get_or_create_tags(names):
+    """
+    批量获取标签，不存在的标签批量创建
+    :return: {标签名(小写): Tag}
+    """
+    tags = {tag.name.lower(): tag for tag in filter_tags(names)}
+    missing = [name for name in names if name.lower() not in tags]
+    if missing:
+        # 并发创建同名标签时忽略冲突，再查询一次
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        tags.update({tag.name.lower(): tag for tag in filter_tags(missing)})
+    return tags
+
+
+def sync_article_tags(article):
+    """
+    将文章的 tags 字段同步到关联表，并修改标签的文章数
+        1.锁定文章，同一篇文章并发保存时依次同步
+        2.删除去掉的标签的关联，减少文章数
+        3.添加新标签的关联，只增加实际插入了关联的标签的文章数
+    :return: 是否有标签被添加或删除
+    """
+    names = parse_tags(article.tags)
+    with transaction.atomic():
+        list(Article.objects.select_for_update().filter(id=article.id).values_list('id', flat=True))
+        links = {link.tag.name.lower(): link
+                 for link in ArticleTag.objects.filter(article=article).select_related('tag')}
+        removed = [link for key, link in links.items() if key not in {name.lower() for name in names}]
+        added = [name for name in names if name.lower() not in links]
+
+        if removed:
+            ArticleTag.objects.filter(id__in=[link.id for link in removed]).delete()
+            Tag.objects.filter(id__in=[link.tag_id for link in removed], article_count__gt=0) \
+                .update(article_count=F('article_count') - 1)
+        if added:
+            tags = get_or_create_tags(added)
+            tag_ids = [tags[name.lower()].id for name in added if name.lower() in tags]
+            # 忽略冲突的插入不返回插入了哪些行，插入前后各查询一次关联
+            linked = ArticleTag.objects.filter(article=article, tag_id__in=tag_ids)
+            existing = set(linked.values_list('tag_id', flat=True))
+            ArticleTag.objects.bulk_create([
+                ArticleTag(article=article, tag_id=tag_id, created=article.created)
+                for tag_id in tag_ids if tag_id not in existing
+            ], ignore_conflicts=True)
+            inserted = set(linked.values_list('tag_id', flat=True)) - existing
+            if inserted:
+                Tag.objects.filter(id__in=inserted).update(article_count=F('article_count') + 1)
+        # 文章的创建时间被修改时同步冗余字段
+        if links:
+            ArticleTag.objects.filter(article=article).exclude(created=article.created) \
+                .update(created=article.created)
+    return bool(removed or added)
+
+
+def release_article_tags(article):
+    """文章删除前减少其标签的文章数(关联会被级联删除)"""
+    tag_ids = list(ArticleTag.objects.filter(article=article).values_list('tag_id', flat=True))
+    if tag_ids:
+        Tag.objects.filter(id__in=tag_ids, article_count__gt=0).update(article_count=F('article_count') - 1)
+    return bool(tag_ids)
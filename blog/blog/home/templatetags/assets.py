@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 静态文件模板标签
+# {% load assets %}
+# {% bundle 'index' %}
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from utils.assets import bundle_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(name):
+    """
+    输出页面的js
+    已经运行过 manage.py build_assets 且不是 DEBUG 时输出合并文件(带哈希值)，否则分别输出原文件
+    """
+    path = bundle_name(name)
+    if not settings.DEBUG and path in getattr(staticfiles_storage, 'hashed_files', {}):
+        return format_html('<script type="text/javascript" src="{}"></script>', static(path))
+    return format_html_join('\n', '<script type="text/javascript" src="{}"></script>',
+                            ((static(source),) for source in settings.ASSET_BUNDLES[name]))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 图片模板标签
+# {% load images %}
+# {% picture article.avatar.url article.avatar_variants sizes='25vw' alt='avatar' style='max-width:100%' %}
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+from utils.images import srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(url, variants, sizes='100vw', alt='', style=''):
+    """
+    输出响应式图片
+    有衍生图时输出 <picture>: 支持WebP的浏览器使用WebP，其他使用JPEG，按 sizes 选择合适的宽度，
+    加载前显示模糊占位图；还没有衍生图时输出原图
+    """
+    sources = (variants or {}).get('sources')
+    if not sources:
+        return format_html('<img src="{}" alt="{}" style="{}">', url, alt, style)
+
+    jpeg = sources.get('jpeg') or []
+    fallback = default_storage.url(jpeg[-1][1]) if jpeg else url
+    webp = format_html('<source type="image/webp" srcset="{}" sizes="{}">', srcset(variants, 'webp'), sizes) \
+        if sources.get('webp') else ''
+    background = 'background: url(%s) center / cover no-repeat' % variants['placeholder'] \
+        if variants.get('placeholder') else ''
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" '
+        'loading="lazy" decoding="async" style="{}; height: auto; {}"></picture>',
+        webp, fallback, srcset(variants, 'jpeg'), sizes, variants['width'], variants['height'], alt, style,
+        background,
+    )
@@ -1,3 +1,755 @@
+import base64
+import io
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F
+from django.template import Context, Template
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
+from home.models import ArticleCategory, Article, ArticleTag, Comment, Tag, MediaFile, ViewsFlush
+from home.caches import get_categories, invalidate_categories, get_tag_cloud, invalidate_tag_cloud
+from home import counters, leaderboard, page_cache, search, tags
+from home.render import render
+from home.pagination import encode_cursor, decode_cursor, keyset_paginate
+from home.counters import reconcile_comments_count, reconcile_article_count, get_pending_views, \
+    incr_article_views, flush_article_views
+from users.models import User
+from utils.images import build_variants
+from utils.image_queue import make_job, save_variants
+from utils.assets import build_bundle
+from utils.storage import S3ContentAddressedStorage, collect_garbage, recount_references
 
 # Create your tests here.
+
+
+class QueryCountTest(TestCase):
+    """固定列表页和详情页的查询次数，避免 N+1 查询"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ArticleCategory.objects.create(title='Python')
+        users = [
+            User.objects.create_user(username='user%d' % i, mobile='1380000000%d' % i, password='12345678')
+            for i in range(5)
+        ]
+        cls.articles = [
+            Article.objects.create(author=users[i % 5], category=cls.category, avatar='article/test.jpg',
+                                   title='文章%d' % i, sumary='摘要', content='正文')
+            for i in range(10)
+        ]
+        for i in range(10):
+            Comment.objects.create(content='评论%d' % i, article=cls.articles[0], user=users[i % 5])
+        reconcile_comments_count()
+
+    def setUp(self):
+        # 分类数据走两级缓存，先预热，常规请求中不再查询分类
+        invalidate_categories()
+        get_categories()
+        page_cache.invalidate_all()
+
+    def test_index_keyset(self):
+        # 文章列表(join 作者和分类)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home:index'), {'cat_id': self.category.id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_index_page_num(self):
+        # 文章总数、文章列表(join 作者和分类)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('home:index'), {'cat_id': self.category.id, 'page_num': 1})
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch('home.views.get_hot_articles', return_value=[])
+    def test_detail(self, get_hot_articles):
+        # 文章(join 作者和分类)、评论列表(join 用户)，评论总数使用文章的评论数字段
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('home:detail'), {'id': self.articles[0].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['comments']), 10)
+
+    @mock.patch('home.views.get_hot_articles', return_value=[])
+    def test_detail_conditional(self, get_hot_articles):
+        url = reverse('home:detail')
+        article = self.articles[0]
+        response = self.client.get(url, {'id': article.id})
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        views = get_pending_views([article.id])[article.id]
+        # 只查询文章，不查询评论、不渲染模板，浏览量照常增加
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'id': article.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(get_pending_views([article.id])[article.id], views + 1)
+        self.assertEqual(self.client.get(url, {'id': article.id}, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # 评论分页不同
+        response = self.client.get(url, {'id': article.id, 'page_size': 5}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # 评论数变化
+        Article.objects.filter(id=article.id).update(comments_count=F('comments_count') + 1)
+        self.assertEqual(self.client.get(url, {'id': article.id}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @mock.patch('home.views.get_hot_articles', return_value=[])
+    def test_detail_shared(self, get_hot_articles):
+        # 登录用户和匿名用户得到相同的页面，可以被共享缓存
+        url = reverse('home:detail')
+        params = {'id': self.articles[0].id}
+        anonymous = self.client.get(url, params)
+        self.client.force_login(self.articles[0].author)
+        response = self.client.get(url, params)
+        self.assertEqual(response['ETag'], anonymous['ETag'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertNotContains(response, 'csrfmiddlewaretoken" value=')
+
+    def test_index_page_cache(self):
+        url = reverse('home:index')
+        params = {'cat_id': self.category.id}
+        self.client.get(url, params)
+        # 再次访问直接返回缓存的页面(登录用户也使用缓存)
+        self.client.force_login(self.articles[0].author)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, params)
+        self.assertContains(response, '文章9')
+        self.assertIn('s-maxage', response['Cache-Control'])
+
+        # 文章修改后缓存失效
+        with self.captureOnCommitCallbacks(execute=True):
+            self.articles[9].title = '修改后的标题'
+            self.articles[9].save()
+        response = self.client.get(url, params)
+        self.assertContains(response, '修改后的标题')
+
+    def test_index_page_cache_keys(self):
+        url = reverse('home:index')
+        self.client.get(url, {'cat_id': self.category.id, 'page_num': '1'})
+        # 页码转换为整数后生成缓存键
+        with self.assertNumQueries(0):
+            self.client.get(url, {'cat_id': self.category.id, 'page_num': '01'})
+        self.assertEqual(self.client.get(url, {'cat_id': self.category.id, 'page_num': 'x'}).status_code, 404)
+
+        # 游标分页只缓存第一页
+        cursor = self.client.get(url, {'cat_id': self.category.id}).context['articles'].next_cursor
+        self.client.get(url, {'cat_id': self.category.id, 'after': cursor})
+        with self.assertNumQueries(1):
+            self.client.get(url, {'cat_id': self.category.id, 'after': cursor})
+
+
+class CategoryCacheTest(TestCase):
+
+    def test_invalidate_on_save(self):
+        category = ArticleCategory.objects.create(title='Python')
+        invalidate_categories()
+        self.assertEqual([c.title for c in get_categories()], ['Python'])
+        with self.captureOnCommitCallbacks(execute=True):
+            category.title = 'Django'
+            category.save()
+        with self.assertNumQueries(1):
+            self.assertEqual([c.title for c in get_categories()], ['Django'])
+
+
+class CounterTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+        self.category = ArticleCategory.objects.create(title='Python')
+        self.article = Article.objects.create(author=self.user, category=self.category, avatar='article/test.jpg',
+                                              title='文章', sumary='摘要', content='正文')
+
+    def test_post_comment(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('home:detail'), {'id': self.article.id, 'content': '评论'})
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.comments_count, 1)
+
+    def test_article_count(self):
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.article_count, 1)
+        other = ArticleCategory.objects.create(title='Django')
+        self.article.category = other
+        self.article.save()
+        self.article.delete()
+        self.assertEqual(list(ArticleCategory.objects.order_by('id').values_list('article_count', flat=True)),
+                         [0, 0])
+
+    def test_reconcile(self):
+        Comment.objects.create(content='评论', article=self.article, user=self.user)
+        ArticleCategory.objects.update(article_count=5)
+        self.assertEqual(reconcile_comments_count(), 1)
+        self.assertEqual(reconcile_article_count(), 1)
+        self.article.refresh_from_db()
+        self.category.refresh_from_db()
+        self.assertEqual((self.article.comments_count, self.category.article_count), (1, 1))
+        self.assertEqual(reconcile_comments_count() + reconcile_article_count(), 0)
+
+
+class FlushViewsTest(TestCase):
+
+    def setUp(self):
+        self.redis_conn = get_redis_connection('default')
+        self.redis_conn.delete(counters.VIEWS_KEY, counters.FLUSHING_KEY, counters.FLUSH_GENERATION_KEY)
+        user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+        category = ArticleCategory.objects.create(title='Python')
+        self.articles = [
+            Article.objects.create(author=user, category=category, avatar='article/test.jpg',
+                                   title='文章%d' % i, sumary='摘要', content='正文')
+            for i in range(3)
+        ]
+
+    def views(self):
+        return list(Article.objects.order_by('id').values_list('total_views', flat=True))
+
+    def update_count(self, queries):
+        # 不同数据库的引号不同(MySQL为反引号)
+        return sum(1 for query in queries if re.match(r'^UPDATE [`"]?tb_article[`"]? ', query['sql']))
+
+    def test_flush(self):
+        for article, count in zip(self.articles, (3, 1, 2)):
+            for _ in range(count):
+                incr_article_views(article.id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_article_views(), 6)
+        # 所有文章的增量用一条UPDATE写回
+        self.assertEqual(self.update_count(queries), 1)
+        self.assertEqual(self.views(), [3, 1, 2])
+        self.assertFalse(self.redis_conn.exists(counters.VIEWS_KEY, counters.FLUSHING_KEY))
+        self.assertEqual(flush_article_views(), 0)
+
+    def test_incr_during_flush(self):
+        article = self.articles[0]
+        incr_article_views(article.id)
+        select_for_update = ViewsFlush.objects.select_for_update
+
+        def during_flush():
+            # 刷新过程中的浏览量写入新的增量hash
+            incr_article_views(article.id)
+            return select_for_update()
+
+        with mock.patch.object(ViewsFlush.objects, 'select_for_update', side_effect=during_flush):
+            self.assertEqual(flush_article_views(), 1)
+        self.assertEqual(self.views()[0], 1)
+        self.assertEqual(get_pending_views([article.id]), {article.id: 1})
+        self.assertEqual(flush_article_views(), 1)
+        self.assertEqual(self.views()[0], 2)
+
+    def test_leftover_flushing_hash(self):
+        # 上次刷新中断: 第一篇文章已经写回数据库，但还没有从刷新hash中删除
+        first, second, third = self.articles
+        self.redis_conn.set(counters.FLUSH_GENERATION_KEY, 7)
+        self.redis_conn.hset(counters.FLUSHING_KEY, mapping={first.id: 5, second.id: 3})
+        ViewsFlush.objects.create(generation=7, last_id=first.id)
+        self.redis_conn.hset(counters.VIEWS_KEY, third.id, 4)
+        # 先处理遗留的刷新hash，已经写回的增量不再写回
+        self.assertEqual(flush_article_views(), 3)
+        self.assertEqual(self.views(), [0, 3, 0])
+        self.assertEqual(flush_article_views(), 4)
+        self.assertEqual(self.views(), [0, 3, 4])
+        self.assertEqual(list(ViewsFlush.objects.values_list('generation', flat=True)), [8])
+
+    def test_batches(self):
+        for article in self.articles:
+            incr_article_views(article.id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_article_views(batch_size=2), 3)
+        self.assertEqual(self.update_count(queries), 2)
+        self.assertEqual(self.views(), [1, 1, 1])
+        self.assertEqual(ViewsFlush.objects.get().last_id, self.articles[-1].id)
+
+
+class PaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ArticleCategory.objects.create(title='Python')
+        user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+        cls.articles = [
+            Article.objects.create(author=user, category=cls.category, avatar='article/test.jpg',
+                                   title='文章%d' % i, sumary='摘要', content='正文')
+            for i in range(5)
+        ]
+        # 前三篇文章的创建时间相同，按id区分
+        now = timezone.now()
+        Article.objects.filter(id__in=[a.id for a in cls.articles[:3]]).update(created=now)
+        Article.objects.filter(id__in=[a.id for a in cls.articles[3:]]).update(created=now - timedelta(days=1))
+        for article in cls.articles:
+            article.refresh_from_db()
+
+    def test_cursor_round_trip(self):
+        for article in self.articles:
+            self.assertEqual(decode_cursor(encode_cursor(article)), (article.created, article.id))
+
+    def test_paging(self):
+        a0, a1, a2, a3, a4 = self.articles
+        queryset = Article.objects.all()
+
+        def ids(page):
+            return [article.id for article in page]
+
+        first = keyset_paginate(queryset, 2)
+        self.assertEqual((ids(first), first.has_next, first.has_previous), ([a2.id, a1.id], True, False))
+        second = keyset_paginate(queryset, 2, after=first.next_cursor)
+        self.assertEqual((ids(second), second.has_next, second.has_previous), ([a0.id, a4.id], True, True))
+        last = keyset_paginate(queryset, 2, after=second.next_cursor)
+        self.assertEqual((ids(last), last.has_next, last.has_previous), ([a3.id], False, True))
+
+        # 向前翻页
+        page = keyset_paginate(queryset, 2, before=last.previous_cursor)
+        self.assertEqual((ids(page), page.has_next, page.has_previous), ([a0.id, a4.id], True, True))
+        page = keyset_paginate(queryset, 2, before=page.previous_cursor)
+        self.assertEqual((ids(page), page.has_next, page.has_previous), ([a2.id, a1.id], True, False))
+
+    def test_malformed_cursor(self):
+        def cursor(raw):
+            return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+        cursors = [
+            '!!!', 'YQ', encode_cursor(self.articles[0])[:7], cursor('abc'), cursor('bad|1'),
+            cursor('2021-01-01T00:00:00+00:00|abc'),
+            # 没有时区、超出范围的时间和id
+            cursor('2021-01-01T00:00:00|1'),
+            cursor('9999-12-31T23:59:59-14:00|1'),
+            cursor('2021-01-01T00:00:00+00:00|99999999999999999999999'),
+            cursor('2021-01-01T00:00:00+00:00|-1'),
+        ]
+        for value in cursors:
+            for name in ('after', 'before'):
+                response = self.client.get(reverse('home:index'), {'cat_id': self.category.id, name: value})
+                self.assertEqual(response.status_code, 404, (name, value))
+
+
+class LeaderboardTest(TestCase):
+
+    def setUp(self):
+        self.redis_conn = get_redis_connection('default')
+        self.redis_conn.delete(leaderboard.HOT_KEY, counters.VIEWS_KEY, counters.FLUSHING_KEY)
+        user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+        self.articles = [
+            Article.objects.create(author=user, avatar='article/test.jpg', title='文章%d' % i,
+                                   sumary='摘要', content='正文')
+            for i in range(3)
+        ]
+        cache.delete_many([leaderboard.TITLE_KEY % article.id for article in self.articles])
+
+    def test_hot_articles(self):
+        a0, a1, a2 = self.articles
+        for article, count in ((a0, 2), (a1, 1), (a2, 3)):
+            for _ in range(count):
+                incr_article_views(article.id)
+        self.assertEqual(self.redis_conn.zscore(leaderboard.HOT_KEY, a2.id), 3)
+        expected = [{'id': a2.id, 'title': '文章2'}, {'id': a0.id, 'title': '文章0'}]
+        self.assertEqual(leaderboard.get_hot_articles(2), expected)
+        # 标题已经缓存，不查询数据库
+        with self.assertNumQueries(0):
+            self.assertEqual(leaderboard.get_hot_articles(2), expected)
+
+        # 修改标题和删除文章后缓存失效
+        a2.title = '新标题'
+        a2.save()
+        a0.delete()
+        self.assertEqual(leaderboard.get_hot_articles(2), [{'id': a2.id, 'title': '新标题'},
+                                                          {'id': a1.id, 'title': '文章1'}])
+
+    def test_empty_leaderboard(self):
+        # 排行榜为空时按数据库中的浏览量查询
+        Article.objects.filter(id=self.articles[1].id).update(total_views=10)
+        self.assertEqual(leaderboard.get_hot_articles(1), [{'id': self.articles[1].id, 'title': '文章1'}])
+
+    def test_rebuild(self):
+        a0, a1, a2 = self.articles
+        Article.objects.filter(id=a0.id).update(total_views=5)
+        self.redis_conn.hset(counters.VIEWS_KEY, a1.id, 7)
+        self.redis_conn.zadd(leaderboard.HOT_KEY, {999: 100})
+        # 分数为数据库中的浏览量加上尚未写回的增量
+        self.assertEqual(leaderboard.rebuild(batch_size=2), 3)
+        self.assertEqual(self.redis_conn.zrevrange(leaderboard.HOT_KEY, 0, -1, withscores=True),
+                         [(str(a1.id).encode(), 7), (str(a0.id).encode(), 5), (str(a2.id).encode(), 0)])
+
+
+class RenderTest(TestCase):
+
+    def test_render(self):
+        result = render('<h2>简介</h2><p onclick="x()">你好 world</p><script>alert(1)</script>'
+                        '<a href="javascript:alert(1)">链接</a><h3>Usage</h3><img src="a.jpg" onerror="x()">')
+        self.assertEqual(result.html, '<h2 id="toc-简介">简介<a class="heading-anchor" href="#toc-简介">#</a></h2>'
+                                      '<p>你好 world</p><a>链接</a>'
+                                      '<h3 id="toc-usage">Usage<a class="heading-anchor" href="#toc-usage">#</a></h3>'
+                                      '<img src="a.jpg">')
+        self.assertIn('<li class="toc-level-1"><a href="#toc-usage">Usage</a></li>', result.toc)
+        # 简介你好链接 6个字 + world, Usage 2个单词
+        self.assertEqual((result.word_count, result.reading_time), (8, 1))
+
+    def test_render_on_save(self):
+        user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+        article = Article.objects.create(author=user, avatar='article/test.jpg', title='文章', sumary='摘要',
+                                         content='<h2>标题</h2><script>x</script>')
+        self.assertEqual(article.content_html, '<h2 id="toc-标题">标题<a class="heading-anchor" href="#toc-标题">#</a></h2>')
+        article.content = '<p>修改后</p>'
+        article.save()
+        article.refresh_from_db()
+        self.assertEqual((article.content_html, article.toc, article.word_count), ('<p>修改后</p>', '', 3))
+
+        # 与加载时的值比较，保存时不再查询正文
+        article = Article.objects.get(id=article.id)
+        article.title = '新标题'
+        with mock.patch('home.signals.render_article') as render_article, \
+                CaptureQueriesContext(connection) as queries:
+            article.save()
+        render_article.assert_not_called()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT') and 'content' in query['sql']])
+        article.content = '<p>再次修改</p>'
+        article.save()
+        article.refresh_from_db()
+        self.assertEqual(article.content_html, '<p>再次修改</p>')
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        # 清空索引
+        search.rebuild()
+        self.user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+
+    def create_article(self, title, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Article.objects.create(author=self.user, avatar='article/test.jpg', title=title,
+                                          sumary='摘要', content=content)
+
+    def test_search(self):
+        in_title = self.create_article('机器学习入门', '<p>介绍</p>')
+        in_content = self.create_article('Python', '<p>一些机器学习的例子</p>')
+        self.create_article('Django', '<p>Web框架</p>')
+        # 标题的权重更高
+        self.assertEqual(search.search('机器学习'), (2, [in_title.id, in_content.id]))
+        self.assertEqual(search.search('python'), (1, [in_content.id]))
+
+        # 修改和删除文章后更新索引
+        with self.captureOnCommitCallbacks(execute=True):
+            in_title.title = '深度学习'
+            in_title.save()
+        self.assertEqual(search.search('机器'), (1, [in_content.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            in_content.delete()
+        self.assertEqual(search.search('机器'), (0, []))
+        self.assertEqual(search.search('学习'), (1, [in_title.id]))
+
+    def test_rebuild(self):
+        article = self.create_article('机器学习入门', '<p>介绍</p>')
+        document_terms = search.document_terms
+        results = []
+
+        def building(article):
+            # 重建期间搜索使用旧版本的索引
+            results.append(search.search('机器学习'))
+            return document_terms(article)
+
+        with mock.patch('home.search.document_terms', side_effect=building):
+            self.assertEqual(search.rebuild(), 1)
+        self.assertEqual(results, [(1, [article.id])] * 2)
+        self.assertEqual(search.search('机器学习'), (1, [article.id]))
+        # 旧版本的索引已经删除
+        redis_conn = get_redis_connection('default')
+        version = redis_conn.get(search.VERSION_KEY).decode()
+        self.assertEqual([key.decode() for key in redis_conn.scan_iter('search:*:doclen')],
+                         [search.DOC_LEN_KEY % version])
+
+    def test_rebuild_concurrent_changes(self):
+        changed = self.create_article('机器学习入门', '<p>介绍</p>')
+        deleted = self.create_article('机器学习进阶', '<p>介绍</p>')
+        document_terms = search.document_terms
+        calls = []
+
+        def building(article):
+            # 写入倒排列表前修改和删除文章(重建读取的是修改前的文章)
+            calls.append(article.id)
+            if len(calls) == 3:
+                with self.captureOnCommitCallbacks(execute=True):
+                    changed.title = '深度学习'
+                    changed.save()
+                    deleted.delete()
+            return document_terms(article)
+
+        with mock.patch('home.search.document_terms', side_effect=building):
+            self.assertEqual(search.rebuild(), 2)
+        self.assertEqual(search.search('机器'), (0, []))
+        self.assertEqual(search.search('深度'), (1, [changed.id]))
+        redis_conn = get_redis_connection('default')
+        version = redis_conn.get(search.VERSION_KEY).decode()
+        # 文章只写入一次
+        changed.refresh_from_db()
+        self.assertEqual(int(redis_conn.get(search.TOTAL_LEN_KEY % version)), document_terms(changed)[1])
+        self.assertFalse(redis_conn.exists(search.INDEXED_KEY % version))
+
+    def test_view(self):
+        for i in range(3):
+            self.create_article('机器学习%d' % i, '<p>正文</p>')
+        invalidate_categories()
+        get_categories()
+        # 当前页的文章(join 作者和分类)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home:search'), {'q': '机器学习', 'page_size': 2, 'page_num': 2})
+        self.assertEqual(response.context['total_count'], 3)
+        self.assertEqual(len(response.context['articles']), 1)
+
+
+class TagTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+
+    def create_article(self, tags):
+        return Article.objects.create(author=self.user, avatar='article/test.jpg', title='文章',
+                                      sumary='摘要', content='正文', tags=tags)
+
+    def tag_counts(self):
+        return dict(Tag.objects.values_list('name', 'article_count'))
+
+    def test_sync(self):
+        article = self.create_article('Python, Django')
+        self.create_article('python 入门')
+        self.assertEqual(self.tag_counts(), {'Python': 2, 'Django': 1, '入门': 1})
+        article.tags = '入门'
+        article.save()
+        self.assertEqual(self.tag_counts(), {'Python': 1, 'Django': 0, '入门': 2})
+        article.delete()
+        self.assertEqual(self.tag_counts(), {'Python': 1, 'Django': 0, '入门': 1})
+        invalidate_tag_cloud()
+        self.assertEqual([tag.name for tag in get_tag_cloud()], ['Python', '入门'])
+
+    def test_concurrent_sync(self):
+        article = self.create_article('Python')
+        get_or_create_tags = tags.get_or_create_tags
+
+        def linked_first(names):
+            # 读取关联之后，其他保存已经插入了相同的关联
+            result = get_or_create_tags(names)
+            ArticleTag.objects.create(article=article, tag=result['django'], created=article.created)
+            return result
+
+        article.tags = 'Python, Django, 入门'
+        with mock.patch('home.tags.get_or_create_tags', side_effect=linked_first):
+            article.save()
+        self.assertEqual(self.tag_counts(), {'Python': 1, 'Django': 0, '入门': 1})
+        self.assertEqual(ArticleTag.objects.filter(article=article).count(), 3)
+
+    def test_view(self):
+        articles = [self.create_article('Python') for _ in range(3)]
+        invalidate_categories()
+        get_categories()
+        invalidate_tag_cloud()
+        get_tag_cloud()
+        url = reverse('home:tag')
+        # 标签、当前页的文章(关联表 join 文章、作者和分类)
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'name': 'Python', 'page_size': 2})
+        page = response.context['page']
+        self.assertEqual(response.context['articles'], articles[:0:-1])
+        response = self.client.get(url, {'name': 'Python', 'page_size': 2, 'after': page.next_cursor})
+        self.assertEqual(response.context['articles'], articles[:1])
+
+
+class ImageTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root, IMAGE_WIDTHS=(320, 640, 1280))
+        self.settings.enable()
+        buffer = io.BytesIO()
+        Image.new('RGBA', (1000, 500), (255, 0, 0, 128)).save(buffer, 'PNG')
+        self.name = default_storage.save('article/20200101/a.png', ContentFile(buffer.getvalue()))
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_build_variants(self):
+        variants = build_variants(self.name)
+        self.assertEqual((variants['width'], variants['height']), (1000, 500))
+        # 比原图宽的不生成
+        self.assertEqual([width for width, _ in variants['sources']['webp']], [320, 640])
+        # 衍生图与原图保存在一起: cas/ab/cd/<sha256>@640w.jpg
+        stem = self.name[:-len('.png')]
+        self.assertEqual(variants['sources']['jpeg'][1][1], stem + '@640w.jpg')
+        with default_storage.open(stem + '@320w.jpg') as f:
+            self.assertEqual(Image.open(f).size, (320, 160))
+        self.assertTrue(variants['placeholder'].startswith('data:image/jpeg;base64,'))
+
+    def test_save_and_render(self):
+        user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+        article = Article.objects.create(author=user, avatar=self.name, title='文章', sumary='摘要', content='正文')
+        job = make_job(article)
+        self.assertTrue(save_variants(job, build_variants(self.name)))
+        article.refresh_from_db()
+        html = Template('{% load images %}{% picture a.avatar.url a.avatar_variants sizes="25vw" %}').render(
+            Context({'a': article}))
+        stem = '/media/' + self.name[:-len('.png')]
+        # url中的'@'被编码为'%40'
+        self.assertIn('<source type="image/webp" srcset="%s%%40320w.webp 320w, ' % stem, html)
+        self.assertIn('src="%s%%40640w.jpg"' % stem, html)
+        # 图片已被替换时不保存
+        Article.objects.filter(id=article.id).update(avatar='article/20200101/b.png')
+        self.assertFalse(save_variants(job, build_variants(self.name)))
+
+
+class FakeS3Client(object):
+    """测试用的S3客户端(只实现存储用到的接口)"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, fileobj, bucket, key):
+        self.objects[key] = fileobj.read()
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[Key])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def list_objects_v2(self, Bucket, Prefix, MaxKeys=1000, Delimiter=None, **kwargs):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        if Delimiter:
+            keys = [key for key in keys if Delimiter not in key[len(Prefix):]]
+        return {'Contents': [{'Key': key} for key in keys[:MaxKeys]], 'IsTruncated': False}
+
+
+class StorageTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.user = User.objects.create_user(username='user', mobile='13800000000', password='12345678')
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_dedupe_and_gc(self):
+        name = default_storage.save('article/20200101/a.jpg', ContentFile(b'image'))
+        self.assertEqual(default_storage.save('article/20200102/b.JPG', ContentFile(b'image')), name)
+        self.assertTrue(name.startswith('cas/') and name.endswith('.jpg'))
+        default_storage.save(name[:-4] + '@320w.webp', ContentFile(b'small'))
+
+        articles = [Article.objects.create(author=self.user, avatar=name, title='文章', sumary='摘要', content='正文')
+                    for _ in range(2)]
+        self.assertEqual(MediaFile.objects.get(name=name).refcount, 2)
+        articles[0].delete()
+        articles[1].avatar = 'article/test.jpg'
+        articles[1].save()
+        self.assertEqual(MediaFile.objects.get(name=name).refcount, 0)
+
+        # 计数错误时重新统计
+        MediaFile.objects.filter(name=name).update(refcount=3)
+        self.assertEqual(recount_references(), 1)
+        self.assertEqual(collect_garbage(grace=timedelta(seconds=0)), (1, 5))
+        self.assertFalse(MediaFile.objects.exists())
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(name))), [])
+
+    def test_gc_during_save(self):
+        name = default_storage.save('a.jpg', ContentFile(b'image'))
+        MediaFile.objects.filter(name=name).update(updated=timezone.now() - timedelta(days=1))
+        exists = default_storage.exists
+
+        def exists_then_gc(path):
+            # 检查文件存在之后立即回收
+            result = exists(path)
+            collect_garbage(grace=timedelta(hours=1))
+            return result
+
+        with mock.patch.object(default_storage, 'exists', exists_then_gc):
+            self.assertEqual(default_storage.save('b.jpg', ContentFile(b'image')), name)
+        self.assertTrue(os.path.exists(default_storage.path(name)))
+        self.assertTrue(MediaFile.objects.filter(name=name).exists())
+
+    def test_upload(self):
+        self.client.force_login(self.user)
+        for _ in range(2):
+            self.client.post(reverse('users:center'), {'avatar': ContentFile(b'avatar', name='a.png')})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.startswith('cas/'))
+        self.assertEqual(MediaFile.objects.get().refcount, 1)
+
+    def test_s3(self):
+        client = FakeS3Client()
+        storage = S3ContentAddressedStorage(bucket='media', client=client, base_url='/media/')
+        name = storage.save('a.png', ContentFile(b'image'))
+        self.assertEqual(storage.save('b.png', ContentFile(b'image')), name)
+        storage.save(name[:-4] + '@320w.webp', ContentFile(b'small'))
+        self.assertEqual(len(client.objects), 2)
+        self.assertEqual(storage.open(name).read(), b'image')
+        self.assertEqual(storage.size(name), 5)
+        self.assertEqual(MediaFile.objects.get(name=name).size, 5)
+        self.assertEqual(collect_garbage(storage, grace=timedelta(seconds=-1)), (1, 5))
+        self.assertEqual(client.objects, {})
+
+
+class MediaTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SERVE_MODE='python')
+        self.settings.enable()
+        self.name = default_storage.save('a.jpg', ContentFile(b'0123456789'))
+        self.url = '/media/' + self.name
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_conditional(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        etag = response['ETag']
+        self.assertEqual(etag, '"%s"' % os.path.basename(self.name)[:-4])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/media/../blog/settings.py').status_code, 404)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=10-').status_code, 416)
+        # If-Range 与文件不一致时返回整个文件
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel')
+    def test_accel(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/internal-media/' + self.name)
+        self.assertEqual(response.content, b'')
+
+
+class AssetTest(TestCase):
+
+    def test_bundle(self):
+        content, total = build_bundle('login', ['js/host.js', 'js/common.js'])
+        self.assertLess(content.index('/* js/host.js */'), content.index('/* js/common.js */'))
+        self.assertGreater(total, 0)
+        # 没有运行 build_assets 时分别加载原文件
+        html = Template("{% load assets %}{% bundle 'login' %}").render(Context())
+        self.assertEqual(html.count('<script'), len(settings.ASSET_BUNDLES['login']))
+        self.assertIn('src="/static/js/login.js"', html)
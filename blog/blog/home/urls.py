@@ -1,7 +1,7 @@
 #!/usr/bin/env python 
 # -*- coding:utf-8 -*-
 from django.urls import path
-from home.views import IndexView, DetailView
+from home.views import IndexView, DetailView, SearchView, TagView
 
 urlpatterns = [
     # 首页的路由
@@ -9,4 +9,10 @@ urlpatterns = [
 
     # 详情视图的路由
     path('detail/', DetailView.as_view(), name='detail'),
+
+    # 搜索视图的路由
+    path('search/', SearchView.as_view(), name='search'),
+
+    # 标签页的路由
+    path('tag/', TagView.as_view(), name='tag'),
 ]
@@ -1,10 +1,24 @@
+import hashlib
+from calendar import timegm
 from django.shortcuts import render, redirect
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views import View
-from home.models import ArticleCategory, Article
+from home.models import ArticleCategory, Article, ArticleTag
 from django.http import HttpResponseNotFound
 from django.core.paginator import Paginator, EmptyPage
+from django.db import transaction
+from django.db.models import F
 from home.models import Comment
 from django.urls import reverse
+from home.counters import incr_article_views, apply_pending_views
+from home.leaderboard import get_hot_articles
+from home.pagination import clamp_page_size, keyset_paginate, CountedPaginator
+from home.caches import get_categories, get_category, get_tag_cloud
+from home.render import sanitize
+from home.tags import filter_tags
+from home import page_cache, search
 # Create your views here.
 
 
@@ -23,49 +37,112 @@ class IndexView(View):
             :param request:
             :return:
         """
-        # 1.获取博客所有分类信息
-        categories = ArticleCategory.objects.all()
+        # 1.获取博客所有分类信息(两级缓存)
+        categories = get_categories()
 
         # 2.接收用户点击的分类id
         cat_id = request.GET.get('cat_id', 1)
 
         # 3.判断分类id(根据分类id进行分类的查询)
         try:
-            category = ArticleCategory.objects.get(id=cat_id)
+            category = get_category(cat_id)
         except ArticleCategory.DoesNotExist:
             return HttpResponseNotFound('没有此分类')
 
         # 4.获取分页参数
-        page_num = request.GET.get('page_num', 1)
-        page_size = request.GET.get('page_size', 10)
+        page_size = clamp_page_size(request.GET.get('page_size'))
 
-        # 5.根据分类信息查询文章数据
-        articles = Article.objects.filter(category=category)
+        # 页码转换为整数(01 和 1 是同一页)
+        page_num = None
+        if 'page_num' in request.GET:
+            try:
+                page_num = int(request.GET['page_num'])
+            except ValueError:
+                return HttpResponseNotFound('empty page')
+
+        # 首页对所有用户相同(与登录用户相关的部分由js根据cookie显示)，使用整页缓存
+        # 游标分页只缓存第一页
+        cache_key = None
+        if page_num is not None or not (request.GET.get('after') or request.GET.get('before')):
+            cache_key = page_cache.page_key(category.id, page_size, page_num)
+            response = page_cache.get_page(cache_key)
+            if response is not None:
+                return page_cache.set_cache_control(response)
+
+        # 5.根据分类信息查询文章数据(作者和分类通过join一并查询，避免模板中逐条查询)
+        articles = Article.objects.filter(category=category).select_related('author', 'category')
+
+        # 带 page_num 参数的旧链接使用页码分页，否则使用游标分页
+        if page_num is None:
+            try:
+                page_articles = keyset_paginate(articles, page_size,
+                                                after=request.GET.get('after'),
+                                                before=request.GET.get('before'))
+            except ValueError:
+                return HttpResponseNotFound('empty page')
+
+            # 浏览量显示为 数据库中的值 + redis中尚未写回的增量
+            apply_pending_views(page_articles)
+
+            context = {
+                'categories': categories,
+                'category': category,
+                'articles': page_articles,
+                'page_size': page_size,
+                'keyset': True,
+            }
+        else:
+            # 6.创建分页器
+            paginator = Paginator(articles, per_page=page_size)
 
-        # 6.创建分页器
-        paginator = Paginator(articles, per_page=page_size)
+            # 7.进行分页处理
+            try:
+                page_articles = paginator.page(page_num)
+            except EmptyPage:
+                return HttpResponseNotFound('empty page')
+
+            # 浏览量显示为 数据库中的值 + redis中尚未写回的增量
+            apply_pending_views(page_articles)
+
+            # 总页数
+            total_page = paginator.num_pages
+
+            # 8.组织数据传递给模板
+            context = {
+                'categories': categories,
+                'category': category,
+                'articles': page_articles,
+                'page_size': page_size,
+                'total_page': total_page,
+                'page_num': page_num
+            }
 
-        # 7.进行分页处理
-        try:
-            page_articles = paginator.page(page_num)
-        except EmptyPage:
-            return HttpResponseNotFound('empty page')
+        # 提供首页广告界面
+        response = render(request, 'index.html', context=context)
+        if cache_key is not None:
+            page_cache.set_page(cache_key, response)
+        return page_cache.set_cache_control(response)
 
-        # 总页数
-        total_page = paginator.num_pages
 
-        # 8.组织数据传递给模板
-        context = {
-            'categories': categories,
-            'category': category,
-            'articles': page_articles,
-            'page_size': page_size,
-            'total_page': total_page,
-            'page_num': page_num
-        }
+def detail_etag(request, article):
+    """
+    详情页的ETag(弱ETag，浏览量等不参与比较，页面内容不是逐字节相同)
+    由文章的更新时间、评论数和评论分页参数计算，不需要渲染页面(页面对所有用户相同)
+    """
+    value = '%s:%s:%s:%s:%s' % (article.id, article.updated.timestamp(), article.comments_count,
+                                request.GET.get('page_num', ''), request.GET.get('page_size', ''))
+    return 'W/"%s"' % hashlib.md5(value.encode()).hexdigest()
 
-        # 提供首页广告界面
-        return render(request, 'index.html', context=context)
+
+def set_detail_validators(response, etag, article):
+    """
+    设置ETag和Last-Modified
+    页面对所有用户相同，可以被共享缓存(反向代理)保存，但每次使用前都要重新验证，浏览量照常计数
+    """
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(timegm(article.updated.utctimetuple()))
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
 
 
 class DetailView(View):
@@ -90,34 +167,44 @@ class DetailView(View):
 
         # 2.根据文章id进行文章数据的查询
         try:
-            article = Article.objects.get(id=id)
+            # 页面输出渲染后的正文，不查询原始正文
+            article = Article.objects.select_related('author', 'category').defer('content').get(id=id)
         except Article.DoesNotExist:
             return render(request, '404.html')
         else:
-            # 让浏览量+1
-            article.total_views += 1
-            article.save()
+            # 让浏览量+1(先累加到redis中，由刷新任务批量写回数据库)
+            # 显示的浏览量为 数据库中的值 + 尚未写回的增量
+            # 返回304时同样计入浏览量
+            article.total_views += incr_article_views(article.id)
+
+        # 2.1 条件请求: 文章、评论数和评论分页都没有变化时返回304，不查询评论、不渲染模板
+        # (浏览量、热门文章不参与比较，浏览器重新验证时可能显示稍旧的值)
+        etag = detail_etag(request, article)
+        response = get_conditional_response(request, etag=etag, last_modified=timegm(article.updated.utctimetuple()))
+        if response is not None:
+            return set_detail_validators(response, etag, article)
 
         #  3.查询分类数据
-        # 获取博客分类信息
-        categories = ArticleCategory.objects.all()
+        # 获取博客分类信息(两级缓存)
+        categories = get_categories()
 
-        # 获取热点数据(查询浏览量前10的文章数据)
-        hot_articles = Article.objects.order_by('-total_views')[:9]
+        # 获取热点数据(从redis排行榜中获取浏览量前9的文章)
+        hot_articles = get_hot_articles(9)
 
         # 4.获取分页请求参数
-        page_size = request.GET.get('page_size', 10)
+        page_size = clamp_page_size(request.GET.get('page_size'))
         page_num = request.GET.get('page_num', 1)
 
         # 5.根据文章信息查询评论数据
-        comments = Comment.objects.filter(article=article).order_by('-created')
-
-        # 获取评论总数
-        total_count = comments.count()
+        # 评论的用户通过join一并查询，避免模板中逐条查询
+        comments = Comment.objects.filter(article=article).select_related('user').order_by('-created')
 
         # 6.创建分页器
-        from django.core.paginator import Paginator, EmptyPage
-        paginator = Paginator(comments, page_size)
+        # 评论总数使用文章的评论数字段，不再执行 COUNT 查询
+        paginator = CountedPaginator(comments, page_size, article.comments_count)
+
+        # 获取评论总数
+        total_count = paginator.count
 
         # 7.进行分页处理
         try:
@@ -141,7 +228,8 @@ class DetailView(View):
             'page_num': page_num
         }
 
-        return render(request, 'detail.html', context=context)
+        response = render(request, 'detail.html', context=context)
+        return set_detail_validators(response, etag, article)
 
     def post(self, request):
         """
@@ -172,16 +260,23 @@ class DetailView(View):
             except Article.DoesNotExist:
                 return HttpResponseNotFound('没有此文章')
 
-            # 3.3 保存评论数据
-            Comment.objects.create(
-                content=content,
-                article=article,
-                user=user
-            )
+            # 3.3 保存评论数据和 3.4 修改文章的评论数量在同一个事务中完成
+            with transaction.atomic():
+                Comment.objects.create(
+                    # 评论内容同样按白名单过滤
+                    content=sanitize(content),
+                    article=article,
+                    user=user
+                )
+
+                # 3.4 修改文章的评论数量(在数据库中原子递增，并发评论时不会丢失更新，也不会重写整行)
+                # 同时修改文章的更新时间，详情页的 Last-Modified 随之变化
+                Article.objects.filter(id=article.id).update(comments_count=F('comments_count') + 1,
+                                                             updated=timezone.now())
 
-            # 3.4 修改文章的评论数量
-            article.comments_count += 1
-            article.save()
+                # update() 不触发信号，首页显示评论数，提交后使该分类的首页缓存失效
+                category_id = article.category_id
+                transaction.on_commit(lambda: page_cache.invalidate_category(category_id))
 
             # 拼接跳转路由(刷新当前页面<页面重定向>)
             path = reverse('home:detail') + '?id={}'.format(article.id)
@@ -191,3 +286,97 @@ class DetailView(View):
             return redirect(reverse('users:login'))
 
 
+class SearchView(View):
+    """文章搜索"""
+    def get(self, request):
+        """
+            1.接收查询关键字和分页参数
+            2.查询倒排索引，按相关度排序并分页
+            3.查询当前页的文章数据
+            4.组织数据传递给模板
+            :param request:
+            :return:
+        """
+        # search/?q=xxx&page_num=xxx&page_size=xxx
+        # 1.接收查询关键字和分页参数
+        query = request.GET.get('q', '').strip()[:100]
+        page_size = clamp_page_size(request.GET.get('page_size'))
+        try:
+            page_num = max(1, int(request.GET.get('page_num', 1)))
+        except ValueError:
+            page_num = 1
+
+        # 2.查询倒排索引，按相关度排序并分页
+        total_count, article_ids = search.search(query, (page_num - 1) * page_size, page_size)
+
+        # 3.查询当前页的文章数据(一次查询，按相关度的顺序排列)
+        articles = Article.objects.select_related('author', 'category') \
+            .defer('content', 'content_html', 'toc').in_bulk(article_ids)
+        page_articles = [articles[article_id] for article_id in article_ids if article_id in articles]
+        # 显示的浏览量加上尚未写回数据库的增量
+        apply_pending_views(page_articles)
+
+        # 4.组织数据传递给模板
+        context = {
+            'categories': get_categories(),
+            'query': query,
+            'articles': page_articles,
+            'total_count': total_count,
+            'page_size': page_size,
+            'total_page': max(1, (total_count + page_size - 1) // page_size),
+            'page_num': page_num,
+        }
+        return render(request, 'search.html', context=context)
+
+
+class TagView(View):
+    """标签页"""
+    def get(self, request):
+        """
+            1.获取标签云
+            2.接收标签名，没有标签名时只显示标签云
+            3.根据标签名查询标签
+            4.按标签查询文章，进行游标分页
+            5.组织数据传递给模板
+            :param request:
+            :return:
+        """
+        # tag/?name=xxx&page_size=xxx&after=xxx
+        # 1.获取标签云(按维护的文章数排序，两级缓存)
+        context = {
+            'categories': get_categories(),
+            'tag_cloud': get_tag_cloud(),
+        }
+
+        # 2.接收标签名
+        name = request.GET.get('name')
+        if not name:
+            return render(request, 'tag.html', context=context)
+
+        # 3.根据标签名查询标签(不区分大小写)
+        tag = filter_tags([name]).first()
+        if tag is None:
+            return HttpResponseNotFound('没有此标签')
+
+        # 4.按标签查询文章(关联表上 (tag, created, id) 的索引)，文章的作者和分类通过join一并查询
+        page_size = clamp_page_size(request.GET.get('page_size'))
+        links = ArticleTag.objects.filter(tag=tag).select_related('article__author', 'article__category') \
+            .defer('article__content', 'article__content_html', 'article__toc')
+        try:
+            page = keyset_paginate(links, page_size,
+                                   after=request.GET.get('after'),
+                                   before=request.GET.get('before'))
+        except ValueError:
+            return HttpResponseNotFound('empty page')
+        articles = [link.article for link in page]
+        # 浏览量显示为 数据库中的值 + redis中尚未写回的增量
+        apply_pending_views(articles)
+
+        # 5.组织数据传递给模板
+        context.update({
+            'tag': tag,
+            'page': page,
+            'articles': articles,
+            'page_size': page_size,
+        })
+        return render(request, 'tag.html', context=context)
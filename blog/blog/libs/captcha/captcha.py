@@ -5,7 +5,10 @@
 
 import random
 import string
+import os
 import os.path
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 
 from PIL import Image
@@ -54,6 +57,51 @@ class Bezier:
             return result
 
 
+# process-wide caches, filled lazily:
+#   _fonts:  (font path, size) -> FreeTypeFont
+#   _glyphs: (font path, size, char) -> cropped 'L' mask of the rendered char
+# FreeType faces are not safe to use from several threads at once, so
+# cache misses are rendered under a lock; cached glyphs are only read.
+_fonts = {}
+_glyphs = {}
+_glyph_lock = threading.Lock()
+
+
+def load_font(name, size):
+    """ Returns the cached FreeTypeFont for (name, size)
+    """
+    key = (name, size)
+    try:
+        return _fonts[key]
+    except KeyError:
+        font = _fonts[key] = truetype(name, size)
+        return font
+
+
+def load_glyph(name, size, c):
+    """ Returns the cached, cropped coverage mask of char `c`
+    """
+    key = (name, size, c)
+    try:
+        return _glyphs[key]
+    except KeyError:
+        pass
+    with _glyph_lock:
+        if key not in _glyphs:
+            font = load_font(name, size)
+            _, _, right, bottom = font.getbbox(c)
+            glyph = Image.new('L', (right, bottom), 0)
+            Draw(glyph).text((0, 0), c, font=font, fill=255)
+            _glyphs[key] = glyph.crop(glyph.getbbox())
+        return _glyphs[key]
+
+
+def clear_cache():
+    with _glyph_lock:
+        _fonts.clear()
+        _glyphs.clear()
+
+
 class Captcha(object):
     def __init__(self):
         self._bezier = Bezier()
@@ -66,11 +114,18 @@ class Captcha(object):
             Captcha._instance = Captcha()
         return Captcha._instance
 
+    def random_text(self):
+        return random.sample(string.ascii_uppercase + string.ascii_uppercase + '3456789', 4)
+
+    def default_fonts(self):
+        return [os.path.join(self._dir, 'fonts', font) for font in ['Arial.ttf', 'Georgia.ttf', 'actionj.ttf']]
+
     def initialize(self, width=200, height=75, color=None, text=None, fonts=None):
+        # NOTE: stores per-captcha state on the (shared) instance, use
+        # render() / generate() when called from concurrent requests
         # self.image = Image.new('RGB', (width, height), (255, 255, 255))
-        self._text = text if text else random.sample(string.ascii_uppercase + string.ascii_uppercase + '3456789', 4)
-        self.fonts = fonts if fonts else \
-            [os.path.join(self._dir, 'fonts', font) for font in ['Arial.ttf', 'Georgia.ttf', 'actionj.ttf']]
+        self._text = text if text else self.random_text()
+        self.fonts = fonts if fonts else self.default_fonts()
         self.width = width
         self.height = height
         self._color = color if color else self.random_color(0, 200, random.randint(220, 255))
@@ -120,20 +175,20 @@ class Captcha(object):
             draw.line(((x, y), (x + level, y)), fill=color if color else self._color, width=level)
         return image
 
-    def text(self, image, fonts, font_sizes=None, drawings=None, squeeze_factor=0.75, color=None):
+    def text(self, image, fonts, font_sizes=None, drawings=None, squeeze_factor=0.75, color=None, chars=None):
         color = color if color else self._color
-        fonts = tuple([truetype(name, size)
+        chars = chars if chars else self._text
+        fonts = tuple([(name, size)
                        for name in fonts
                        for size in font_sizes or (65, 70, 75)])
-        draw = Draw(image)
         char_images = []
-        for c in self._text:
-            font = random.choice(fonts)
-            c_width, c_height = draw.textsize(c, font=font)
-            char_image = Image.new('RGB', (c_width, c_height), (0, 0, 0))
-            char_draw = Draw(char_image)
-            char_draw.text((0, 0), c, font=font, fill=color)
-            char_image = char_image.crop(char_image.getbbox())
+        for c in chars:
+            name, size = random.choice(fonts)
+            # the rasterised glyph is cached, only colouring and the random
+            # warp / rotate / offset are done per captcha
+            glyph = load_glyph(name, size, c)
+            char_image = Image.new('RGB', glyph.size, (0, 0, 0))
+            char_image.paste(color, mask=glyph)
             for drawing in drawings:
                 d = getattr(self, drawing)
                 char_image = d(char_image)
@@ -210,11 +265,64 @@ class Captcha(object):
         image.save(out, format=fmt)
         return text, out.getvalue()
 
+    def render(self, width=200, height=75, color=None, text=None, fonts=None, fmt='JPEG'):
+        """Create a captcha without touching any per-instance state.
+
+        Safe to call from several threads on the shared instance.
+        Returns:
+            A tuple, (text, bytes).
+        """
+        chars = text if text else self.random_text()
+        fonts = fonts if fonts else self.default_fonts()
+        color = color if color else self.random_color(0, 200, random.randint(220, 255))
+        image = Image.new('RGB', (width, height), (255, 255, 255))
+        image = self.background(image)
+        image = self.text(image, fonts, drawings=['warp', 'rotate', 'offset'], color=color, chars=chars)
+        image = self.curve(image, color=color)
+        image = self.noise(image, color=color)
+        image = self.smooth(image)
+        out = BytesIO()
+        image.save(out, format=fmt)
+        return "".join(chars), out.getvalue()
+
     def generate_captcha(self):
-        self.initialize()
-        return self.captcha("")
+        return self.render()
 
 captcha = Captcha.instance()
 
+
+def generate(width=200, height=75, color=None, text=None, fonts=None, fmt='JPEG'):
+    """Stateless entry point, see Captcha.render."""
+    return captcha.render(width=width, height=height, color=color, text=text, fonts=fonts, fmt=fmt)
+
+
+def _generate_many(count):
+    return [captcha.render() for _ in range(count)]
+
+
+def generate_batch(n, processes=None, executor=None):
+    """Create `n` captchas spread across a process pool.
+
+    Args:
+        n: number of captchas.
+        processes: pool size (number of chunks), default os.cpu_count().
+        executor: an existing ProcessPoolExecutor with `processes` workers to reuse.
+    Returns:
+        A list of (text, bytes).
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or n <= 1:
+        return _generate_many(n)
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            return generate_batch(n, processes, executor)
+    chunk = -(-n // processes)
+    counts = [min(chunk, n - i) for i in range(0, n, chunk)]
+    result = []
+    for captchas in executor.map(_generate_many, counts):
+        result.extend(captchas)
+    return result
+
+
 if __name__ == '__main__':
     print(captcha.generate_captcha())
@@ -13,9 +13,11 @@
 from hashlib import md5
 import base64
 import datetime
+import threading
 from urllib import request as urllib2
 import json
-from .xmltojson import xmltojson
+from .xmltojson import to_dict, to_dict2
+from .connection import HttpClient
 
 
 class REST:
@@ -28,8 +30,11 @@ class REST:
     ServerPort = ''
     SoftVersion = ''
     Iflog = False  # 是否打印日志
-    Batch = ''  # 时间戳
     BodyType = 'xml'  # 包体格式，可填值：json 、xml
+    ConnectTimeout = 3  # 连接超时(秒)
+    ReadTimeout = 10  # 读取超时(秒)
+    PoolSize = 4  # 保持的keep-alive连接数
+    Client = None  # HTTP客户端(连接池 + 熔断器)，第一次请求时创建(加锁，多个线程同时发送时只创建一个)
 
     # 初始化
     # @param serverIP       必选参数    服务器地址
@@ -40,6 +45,7 @@ class REST:
         self.ServerIP = ServerIP
         self.ServerPort = ServerPort
         self.SoftVersion = SoftVersion
+        self.ClientLock = threading.Lock()
 
     # 设置主帐号
     # @param AccountSid  必选参数    主帐号
@@ -65,6 +71,27 @@ class REST:
     def setAppId(self, AppId):
         self.AppId = AppId
 
+    # 设置超时时间
+    # @param ConnectTimeout  必选参数    连接超时(秒)
+    # @param ReadTimeout  必选参数    读取超时(秒)
+
+    def setTimeout(self, ConnectTimeout, ReadTimeout):
+        self.ConnectTimeout = ConnectTimeout
+        self.ReadTimeout = ReadTimeout
+        self.Client = None
+
+    # 通过连接池发送请求(替代 urllib 的 urlopen，复用连接，带超时和熔断)
+    def urlopen(self, req):
+        client = self.Client
+        if client is None:
+            with self.ClientLock:
+                if self.Client is None:
+                    self.Client = HttpClient(maxsize=self.PoolSize,
+                                             connect_timeout=self.ConnectTimeout,
+                                             read_timeout=self.ReadTimeout)
+                client = self.Client
+        return client.urlopen(req)
+
     def log(self, url, body, data):
         print('这是请求的URL：')
         print(url)
@@ -80,14 +107,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/SubAccounts?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
         self.setHttpHeader(req)
@@ -104,7 +131,7 @@ class REST:
         data = ''
         req.data = body.encode()
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -113,8 +140,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -130,14 +156,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/GetSubAccounts?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         # auth = base64.encodestring(src).strip()
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
@@ -155,7 +181,7 @@ class REST:
         data = ''
         req.data = body.encode()
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -164,8 +190,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -181,14 +206,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/QuerySubAccountByName?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         # auth = base64.encodestring(src).strip()
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
@@ -206,7 +231,7 @@ class REST:
         data = ''
         req.data = body.encode()
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -215,8 +240,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -233,14 +257,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/SMS/TemplateSMS?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         # auth = base64.encodestring(src).strip()
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
@@ -264,7 +288,7 @@ class REST:
         req.data = body.encode()
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -273,8 +297,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -302,14 +325,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/Calls/LandingCalls?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         # auth = base64.encodestring(src).strip()
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
@@ -331,7 +354,7 @@ class REST:
         req.data = body.encode()
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -340,8 +363,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -363,14 +385,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/Calls/VoiceVerify?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         # auth = base64.encodestring(src).strip()
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
@@ -390,7 +412,7 @@ class REST:
         req.data = body.encode()
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -399,8 +421,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -418,14 +439,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
+        signature = self.AccountSid + self.AccountToken + batch;
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/ivr/dial?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
         req.add_header("Accept", "application/xml")
@@ -442,11 +463,10 @@ class REST:
         req.data = body.encode()
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
-            xtj = xmltojson()
-            locations = xtj.main(data)
+            locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -462,14 +482,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/BillRecords?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
         self.setHttpHeader(req)
@@ -486,7 +506,7 @@ class REST:
         req.data = body.encode()
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
 
             res.close()
@@ -496,8 +516,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -512,14 +531,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/AccountInfo?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
         self.setHttpHeader(req)
@@ -527,7 +546,7 @@ class REST:
         req.add_header("Authorization", auth)
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -536,8 +555,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -553,14 +571,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/SMS/QuerySMSTemplate?sig=" + sig
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
         self.setHttpHeader(req)
@@ -577,7 +595,7 @@ class REST:
         req.data = body.encode()
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -586,8 +604,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main2(data)
+                locations = to_dict2(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -603,14 +620,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/CallResult?sig=" + sig + "&callsid=" + callSid
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
         self.setHttpHeader(req)
@@ -618,7 +635,7 @@ class REST:
         req.add_header("Authorization", auth)
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
             res.close()
 
@@ -627,8 +644,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -644,14 +660,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/ivr/call?sig=" + sig + "&callid=" + callid
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
         self.setHttpHeader(req)
@@ -668,7 +684,7 @@ class REST:
         req.data = body.encode()
         data = ''
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
 
             res.close()
@@ -678,8 +694,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
@@ -695,14 +710,14 @@ class REST:
 
         self.accAuth()
         nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
+        batch = nowdate.strftime("%Y%m%d%H%M%S")
         # 生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch
+        signature = self.AccountSid + self.AccountToken + batch
         sig = md5(signature.encode()).hexdigest().upper()
         # 拼接URL
         url = "https://" + self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/Calls/MediaFileUpload?sig=" + sig + "&appid=" + self.AppId + "&filename=" + filename
         # 生成auth
-        src = self.AccountSid + ":" + self.Batch
+        src = self.AccountSid + ":" + batch
         auth = base64.encodebytes(src.encode()).decode().strip()
         req = urllib2.Request(url)
         req.add_header("Authorization", auth)
@@ -718,7 +733,7 @@ class REST:
         req.data = body.encode()
 
         try:
-            res = urllib2.urlopen(req)
+            res = self.urlopen(req)
             data = res.read()
 
             res.close()
@@ -728,8 +743,7 @@ class REST:
                 locations = json.loads(data)
             else:
                 # xml格式
-                xtj = xmltojson()
-                locations = xtj.main(data)
+                locations = to_dict(data)
             if self.Iflog:
                 self.log(url, body, data)
             return locations
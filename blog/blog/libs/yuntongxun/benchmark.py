@@ -0,0 +1,134 @@
+# -*- coding: UTF-8 -*-
+# 短信SDK的基准测试: 在本地启动一个HTTPS桩服务器，对比
+#   每次请求新建连接的 urllib.request.urlopen
+#   复用keep-alive连接的 HttpClient
+# 用法: python -m libs.yuntongxun.benchmark -n 200
+#       python -m libs.yuntongxun.benchmark --parser -n 100000  (只测试响应解析)
+import argparse
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urllib2
+
+from .CCPRestSDK import REST
+from .connection import HttpClient
+from .xmltojson import to_dict
+
+RESPONSE = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Response>'
+            b'<statusCode>000000</statusCode><TemplateSMS><dateCreated>20210829120000</dateCreated>'
+            b'<smsMessageSid>ff8080813c373cab013c94b0f0512345</smsMessageSid></TemplateSMS></Response>')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写入，keep-alive连接上需要关闭Nagle算法
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_certificate(directory):
+    """使用 openssl 生成自签名证书"""
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-keyout', key, '-out', cert],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def start_server(cert, key):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class UrllibREST(REST):
+    """旧的实现: 每次请求都通过 urlopen 新建连接"""
+    context = None
+
+    def urlopen(self, req):
+        return urllib2.urlopen(req, context=self.context)
+
+
+def make_rest(cls, port, context):
+    rest = cls('127.0.0.1', str(port), '2013-12-26')
+    rest.setAccount('accountSid', 'accountToken')
+    rest.setAppId('appId')
+    if cls is UrllibREST:
+        rest.context = context
+    else:
+        rest.Client = HttpClient(context=context)
+    return rest
+
+
+def run(rest, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        result = rest.sendTemplateSMS('13800000000', ['123456', 5], 1)
+        assert result.get('statusCode') == '000000', result
+    return time.perf_counter() - start
+
+
+def run_parser(number):
+    """解析 number 次响应，返回 (耗时, 解析前后的内存增长字节数)"""
+    to_dict(RESPONSE)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for _ in range(number):
+        to_dict(RESPONSE)
+    elapsed = time.perf_counter() - start
+    growth = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return elapsed, growth
+
+
+def main():
+    parser = argparse.ArgumentParser(description='短信SDK连接复用的基准测试')
+    parser.add_argument('-n', '--number', type=int, default=200, help='发送的短信数')
+    parser.add_argument('--parser', action='store_true', help='只测试响应的解析')
+    args = parser.parse_args()
+
+    if args.parser:
+        elapsed, growth = run_parser(args.number)
+        print('to_dict  %d 次  %.3fs  %.2fus/次  内存增长 %d 字节' % (
+            args.number, elapsed, elapsed * 1000000 / args.number, growth))
+        return
+
+    directory = tempfile.mkdtemp()
+    try:
+        cert, key = make_certificate(directory)
+        server = start_server(cert, key)
+        port = server.server_address[1]
+        # 桩服务器使用自签名证书，不验证证书
+        context = ssl._create_unverified_context()
+
+        for name, cls in (('urllib (新建连接)', UrllibREST), ('HttpClient (连接池)', REST)):
+            elapsed = run(make_rest(cls, port, context), args.number)
+            print('%-20s %d 条  %.3fs  %.2fms/条' % (name, args.number, elapsed, elapsed * 1000 / args.number))
+        server.shutdown()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+# -*- coding: UTF-8 -*-
+# 云通讯REST SDK使用的HTTP连接池和熔断器
+# 复用keep-alive连接(避免每条短信都重新进行TCP+TLS握手)，并设置连接/读取超时
+import logging
+import select
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from http import client as http_client
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 幂等的请求方法: 请求发出后连接断开时可以重试(POST可能已经被服务器处理，重试会重复发送短信)
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+def is_connection_dropped(conn):
+    """空闲连接是否已经被服务器关闭(空闲时可读，说明收到了FIN或者不应出现的数据)"""
+    if conn.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求直接失败"""
+
+
+class GatewayError(Exception):
+    """网关返回了错误的HTTP状态码"""
+
+
+class CircuitBreaker(object):
+    """
+    熔断器
+        关闭: 正常请求，记录最近 window 次请求的结果
+        打开: 最近的失败率超过 failure_threshold 时打开，reset_timeout 秒内的请求直接失败
+        半开: 打开 reset_timeout 秒后放行一个试探请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold=0.5, window=20, min_requests=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self._results = deque(maxlen=window)
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_request(self):
+        """请求前调用，熔断器打开时抛出 CircuitOpenError"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._trial or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError('短信网关错误率过高，暂停请求')
+            # 半开: 只放行一个试探请求
+            self._trial = True
+
+    def record(self, success):
+        """请求结束后调用，记录请求结果"""
+        with self._lock:
+            if self._trial:
+                self._trial = False
+                if success:
+                    self._opened_at = None
+                    self._results.clear()
+                    logger.info('短信网关恢复，熔断器关闭')
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._results.append(success)
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_requests and \
+                    failures / len(self._results) >= self.failure_threshold:
+                logger.error('短信网关错误率 %d/%d，熔断器打开 %d 秒' % (
+                    failures, len(self._results), self.reset_timeout))
+                self._opened_at = time.monotonic()
+                self._results.clear()
+
+
+class Response(object):
+    """与 urlopen 返回值接口相同的响应对象(内容已经读取完毕)"""
+
+    def __init__(self, status, data):
+        self.status = status
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def close(self):
+        pass
+
+
+class ConnectionPool(object):
+    """一个主机的keep-alive连接池"""
+
+    def __init__(self, scheme, host, port, maxsize=4, connect_timeout=3, read_timeout=10, context=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.context = context
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            conn = http_client.HTTPSConnection(self.host, self.port, timeout=self.connect_timeout,
+                                               context=self.context or ssl.create_default_context())
+        else:
+            conn = http_client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        # 连接建立后改为读取超时
+        conn.sock.settimeout(self.read_timeout)
+        # 连接会被复用，关闭Nagle算法，避免小包等待延迟确认
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def _get_connection(self):
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                # 跳过已经被服务器关闭的空闲连接
+                if not is_connection_dropped(conn):
+                    return conn, True
+                conn.close()
+        return self._new_connection(), False
+
+    def _put_connection(self, conn):
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        发送请求
+        :return: (状态码, 响应内容)
+        """
+        conn, reused = self._get_connection()
+        sent = False
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            sent = True
+            response = conn.getresponse()
+            data = response.read()
+        except (http_client.HTTPException, ConnectionError) as e:
+            conn.close()
+            if not reused or not self._can_retry(method, sent, e):
+                raise
+            # 复用的连接已经被服务器关闭，使用新连接重试一次
+            conn = self._new_connection()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._put_connection(conn)
+        return response.status, data
+
+    @staticmethod
+    def _can_retry(method, sent, error):
+        """
+        复用的连接出错后能否重试
+            请求没有写出去: 服务器没有收到请求，可以重试
+            请求已经发出: 只有幂等的请求在没有收到任何响应数据(RemoteDisconnected)时重试，
+            POST可能已经被处理，不重试
+        """
+        if not sent:
+            return True
+        return method in IDEMPOTENT_METHODS and isinstance(error, http_client.RemoteDisconnected)
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+class HttpClient(object):
+    """
+    替代 urllib.request.urlopen 的HTTP客户端
+    按 (scheme, host, port) 复用连接池，所有请求经过熔断器
+    """
+
+    def __init__(self, maxsize=4, connect_timeout=3, read_timeout=10, context=None, breaker=None):
+        self.maxsize = maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.context = context
+        self.breaker = breaker or CircuitBreaker()
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, scheme, host, port):
+        key = (scheme, host, port)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = ConnectionPool(scheme, host, port, self.maxsize,
+                                                         self.connect_timeout, self.read_timeout,
+                                                         self.context)
+            return pool
+
+    def urlopen(self, req):
+        """
+        发送 urllib.request.Request 请求
+        :raise CircuitOpenError: 熔断器打开
+        :raise GatewayError: HTTP状态码不是2xx
+        """
+        self.breaker.before_request()
+        parts = urlsplit(req.full_url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        pool = self._get_pool(parts.scheme, parts.hostname, parts.port)
+        try:
+            status, data = pool.request(req.get_method(), path, req.data, dict(req.header_items()))
+            if not 200 <= status < 300:
+                raise GatewayError('HTTP %d' % status)
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        return Response(status, data)
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
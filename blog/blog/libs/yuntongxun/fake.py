@@ -0,0 +1,28 @@
+# -*- coding:utf-8 -*-
+# 本地的假短信网关，测试和开发环境中代替云通讯
+import time
+
+
+class FakeCCP(object):
+    """
+    与 CCP 接口相同的假短信网关
+    发送的短信记录在 sent 中，可以模拟网关失败和网关延迟
+    """
+
+    def __init__(self, fail_times=0, delay=0):
+        """
+        :param fail_times: 前几次发送返回失败
+        :param delay: 每次发送的延迟(秒)
+        """
+        self.fail_times = fail_times
+        self.delay = delay
+        self.sent = []
+
+    def send_template_sms(self, to, datas, temp_id):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            return -1
+        self.sent.append((to, list(datas), temp_id))
+        return 0
@@ -20,6 +20,10 @@ _serverPort = "8883"
 # 说明：REST API版本号保持不变
 _softVersion = '2013-12-26'
 
+# 说明：连接超时和读取超时(秒)，网关无响应时不会一直占用worker
+_connectTimeout = 3
+_readTimeout = 10
+
 # 云通讯官方提供的发送短信代码实例
 # # 发送模板短信
 # # @param to 手机号码
@@ -52,6 +56,7 @@ class CCP(object):
             cls._instance.rest = REST(_serverIP, _serverPort, _softVersion)
             cls._instance.rest.setAccount(_accountSid, _accountToken)
             cls._instance.rest.setAppId(_appId)
+            cls._instance.rest.setTimeout(_connectTimeout, _readTimeout)
         return cls._instance
 
     def send_template_sms(self, to, datas, temp_id):
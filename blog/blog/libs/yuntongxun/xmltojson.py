@@ -12,8 +12,6 @@ class xmltojson:
     SHOW_LOG = True
     # XML file
     XML_PATH = None
-    a = {}
-    m = []
 
     def get_root(self, path):
         '''parse the XML file,and get the tree of the XML file
@@ -89,82 +87,65 @@ class xmltojson:
             print('the elements is None!')
 
     def main(self, xml):
-        # root
-        root = self.get_root(xml)
-
-        # children
-        children = self.get_element_children(root)
-
-        children_tags = self.get_elements_tag(children)
-
-        children_attribs = self.get_elements_attrib(children)
-
-        i = 0
-
-        # 获取二级元素的每一个子节点的名称和值
-        for c in children:
-            p = 0
-            c_children = self.get_element_children(c)
-            dict_text = self.get_elements_text(c_children)
-            if dict_text:
-                # print (children_tags[i])
-                if children_tags[i] == 'TemplateSMS':
-                    self.a['templateSMS'] = dict_text
-                else:
-                    if children_tags[i] == 'SubAccount':
-                        k = 0
-
-                        for x in children:
-                            if children_tags[k] == 'totalCount':
-                                self.m.append(dict_text)
-                                self.a['SubAccount'] = self.m
-                                p = 1
-                            k = k + 1
-                        if p == 0:
-                            self.a[children_tags[i]] = dict_text
-                    else:
-                        self.a[children_tags[i]] = dict_text
-
-
-            else:
-                self.a[children_tags[i]] = c.text
-            i = i + 1
-        return self.a
+        # 兼容旧接口，每次调用返回新的dict
+        return to_dict(xml)
 
     def main2(self, xml):
-        # root
-        root = self.get_root(xml)
-
-        # children
-        children = self.get_element_children(root)
-
-        children_tags = self.get_elements_tag(children)
-
-        children_attribs = self.get_elements_attrib(children)
-
-        i = 0
-
-        # 获取二级元素的每一个子节点的名称和值
-        for c in children:
-            p = 0
-            c_children = self.get_element_children(c)
-            dict_text = self.get_elements_text(c_children)
-            if dict_text:
-                if children_tags[i] == 'TemplateSMS':
-                    k = 0
-
-                    for x in children:
-                        if children_tags[k] == 'totalCount':
-                            self.m.append(dict_text)
-                            self.a['TemplateSMS'] = self.m
-                            p = 1
-                        k = k + 1
-                    if p == 0:
-                        self.a[children_tags[i]] = dict_text
-                else:
-                    self.a[children_tags[i]] = dict_text
-
-            else:
-                self.a[children_tags[i]] = c.text
-            i = i + 1
-        return self.a
+        return to_dict2(xml)
+
+
+def _parse(xml, list_tag, rename):
+    """
+    单次遍历解析网关的响应(XMLPullParser 的 start/end 事件)，不使用共享状态，每次返回新的dict
+        二级元素没有子元素: {tag: text}
+        二级元素有子元素: {tag: {子元素tag: 子元素text}}
+        存在 totalCount 时 list_tag 的多个元素放入列表
+    :param xml: 响应内容(bytes或str)
+    :param list_tag: 存在 totalCount 时作为列表返回的元素
+    :param rename: 有子元素时需要改名的元素 {tag: 新的key}
+    """
+    parser = ET.XMLPullParser(('start', 'end'))
+    parser.feed(xml)
+    parser.close()
+    # 二级元素 [(tag, dict或text)]，totalCount可能出现在列表元素之后，解析完再组装
+    entries = []
+    has_total = False
+    depth = 0
+    children = None
+    for event, element in parser.read_events():
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                children = {}
+            continue
+        if depth == 3:
+            children[element.tag] = element.text
+        elif depth == 2:
+            entries.append((element.tag, children or element.text))
+            if element.tag == 'totalCount':
+                has_total = True
+            # 释放已经处理的元素
+            element.clear()
+        depth -= 1
+
+    result = {}
+    for tag, value in entries:
+        if isinstance(value, dict):
+            if tag in rename:
+                result[rename[tag]] = value
+                continue
+            if tag == list_tag and has_total:
+                result.setdefault(tag, []).append(value)
+                continue
+        result[tag] = value
+    return result
+
+
+def to_dict(xml):
+    """解析响应，TemplateSMS 改名为 templateSMS，存在 totalCount 时 SubAccount 为列表(原 main)"""
+    return _parse(xml, 'SubAccount', {'TemplateSMS': 'templateSMS'})
+
+
+def to_dict2(xml):
+    """解析响应，存在 totalCount 时 TemplateSMS 为列表(原 main2)"""
+    return _parse(xml, 'TemplateSMS', {})
@@ -8,10 +8,26 @@ var vm = new Vue({
         data_config:'{"skin": "moono-lisa", "toolbar_Basic": [["Source", "-", "Bold", "Italic"]], "toolbar_Full": [["Styles", "Format", "Bold", "Italic", "Underline", "Strike", "SpellChecker", "Undo", "Redo"], ["Link", "Unlink", "Anchor"], ["Image", "Flash", "Table", "HorizontalRule"], ["TextColor", "BGColor"], ["Smiley", "SpecialChar"], ["Source"]], "toolbar": "Custom", "height": "250px", "width": "auto", "filebrowserWindowWidth": 940, "filebrowserWindowHeight": 725, "tabSpaces": 4, "toolbar_Custom": [["Smiley", "CodeSnippet"], ["Bold", "Italic", "Underline", "RemoveFormat", "Blockquote"], ["TextColor", "BGColor"], ["Link", "Unlink"], ["NumberedList", "BulletedList"], ["Maximize"]], "extraPlugins": "codesnippet,prism,widget,lineutils", "language": "en-us"}',
         username:'',
         is_login:false,
+        csrf_token:'',
     },
     mounted(){
         this.username=getCookie('username');
         this.is_login=getCookie('is_login');
+        // 页面对所有用户相同，登录状态和发表评论需要的CSRF令牌从接口获取(cookie中的登录状态可能已经过期)
+        var url = this.host + '/session/';
+        axios.get(url, {
+            responseType: 'json'
+        })
+            .then(response => {
+                if (response.data.code == '0') {
+                    this.is_login = response.data.is_login;
+                    this.username = response.data.username;
+                    this.csrf_token = response.data.csrf_token;
+                }
+            })
+            .catch(error => {
+                console.log(error.response);
+            })
     },
     methods: {
         //显示下拉菜单
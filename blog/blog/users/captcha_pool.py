@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 预先生成的图片验证码池
+# 后台任务把生成好的验证码放入redis列表，请求中直接弹出一个，不需要在请求中绘制图片
+from django.conf import settings
+from django_redis import get_redis_connection
+from libs.captcha.captcha import generate, generate_batch
+
+# 验证码池  元素: 验证码文字 + SEPARATOR + 图片二进制数据
+POOL_KEY = 'captcha:pool'
+SEPARATOR = b'|'
+
+
+def pop_captcha():
+    """
+    从验证码池中取出一个验证码
+    :return: (text, image)，池为空时返回None
+    """
+    item = get_redis_connection('default').lpop(POOL_KEY)
+    if item is None:
+        return None
+    text, _, image = item.partition(SEPARATOR)
+    return text.decode(), image
+
+
+def generate_captcha():
+    """优先从验证码池中获取，池为空时当场生成"""
+    return pop_captcha() or generate()
+
+
+def pool_size():
+    return get_redis_connection('default').llen(POOL_KEY)
+
+
+def fill_pool(high_watermark=None, batch_size=50, processes=1, executor=None):
+    """
+    把验证码池补充到高水位
+    :param high_watermark: 验证码池的目标数量，默认 settings.CAPTCHA_POOL_HIGH_WATERMARK
+    :param batch_size: 每批生成并写入redis的数量
+    :param processes: 生成验证码的进程数
+    :param executor: 复用的进程池(ProcessPoolExecutor)，进程数为 processes
+    :return: 新生成的验证码数量
+    """
+    if high_watermark is None:
+        high_watermark = settings.CAPTCHA_POOL_HIGH_WATERMARK
+    redis_conn = get_redis_connection('default')
+    total = 0
+    missing = high_watermark - redis_conn.llen(POOL_KEY)
+    while missing > 0:
+        count = min(missing, batch_size)
+        items = [text.encode() + SEPARATOR + image
+                 for text, image in generate_batch(count, processes, executor)]
+        redis_conn.rpush(POOL_KEY, *items)
+        total += count
+        missing -= count
+    return total
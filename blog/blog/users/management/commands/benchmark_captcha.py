@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import time
+from django.core.management.base import BaseCommand
+from libs.captcha import captcha as captcha_module
+
+
+class Command(BaseCommand):
+    """对比 不使用/使用 字体和字形缓存时每秒生成的验证码数量"""
+    help = '图片验证码生成速度的基准测试'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=200, help='生成的验证码数量')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        captcha = captcha_module.captcha
+
+        # 不使用缓存: 每次生成前清空缓存(相当于每次都加载字体、绘制字形)
+        start = time.perf_counter()
+        for _ in range(number):
+            captcha_module.clear_cache()
+            captcha.generate_captcha()
+        uncached = number / (time.perf_counter() - start)
+
+        # 使用缓存
+        captcha.generate_captcha()
+        start = time.perf_counter()
+        for _ in range(number):
+            captcha.generate_captcha()
+        cached = number / (time.perf_counter() - start)
+
+        self.stdout.write('不使用缓存: %.1f 个/秒' % uncached)
+        self.stdout.write('使用缓存:   %.1f 个/秒 (%.1fx)' % (cached, cached / uncached))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from users import captcha_pool
+
+
+class Command(BaseCommand):
+    """
+    后台生成图片验证码，保持redis中的验证码池数量
+        验证码池低于低水位时补充到高水位
+    """
+    help = '预先生成图片验证码，保持redis中的验证码池数量'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--low', type=int, default=settings.CAPTCHA_POOL_LOW_WATERMARK,
+                            help='低水位，验证码池数量低于该值时开始补充')
+        parser.add_argument('--high', type=int, default=settings.CAPTCHA_POOL_HIGH_WATERMARK,
+                            help='高水位，每次补充到该数量')
+        parser.add_argument('--interval', type=float, default=1,
+                            help='检查验证码池的间隔(秒)')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='生成验证码的进程数')
+        parser.add_argument('--once', action='store_true', help='只补充一次')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        executor = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+        try:
+            while True:
+                if options['once'] or captcha_pool.pool_size() < options['low']:
+                    total = captcha_pool.fill_pool(options['high'], processes=processes, executor=executor)
+                    self.stdout.write('生成验证码: %d' % total)
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            if executor is not None:
+                executor.shutdown()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from users.sms_queue import Worker, recover_processing
+
+
+class Command(BaseCommand):
+    """从redis队列中取出短信发送任务并发送"""
+    help = '后台发送短信(从redis队列中取出任务)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.SMS_WORKER_CONCURRENCY,
+                            help='同时发送的短信数')
+        parser.add_argument('--recover', action='store_true',
+                            help='启动前将上次异常退出时未完成的任务放回队列(只运行一个worker时使用)')
+
+    def handle(self, *args, **options):
+        if options['recover']:
+            self.stdout.write('恢复任务: %d' % recover_processing())
+        worker = Worker(concurrency=options['concurrency'])
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
@@ -13,6 +13,8 @@ class User(AbstractUser):
     # 头像信息 以年月日保存到avatar
     # upload_to为保存到响应的子目录中
     avatar = models.ImageField(upload_to='avatar/%Y%m%d/', blank=True)
+    # 头像的衍生图(不同宽度的JPEG/WebP和模糊占位图，manage.py image_worker 在后台生成)
+    avatar_variants = models.JSONField(default=dict, blank=True)
 
     # 个人简介信息
     user_desc = models.CharField(max_length=500, blank=True)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 用户相关的信号处理(头像文件的引用计数)
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from users.models import User
+from utils import storage
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    # 记录修改前的头像，保存后修改图片的引用计数(登录时只保存 last_login，不需要查询)
+    if update_fields is not None and 'avatar' not in update_fields:
+        instance._old_avatar = instance.avatar.name
+    elif instance.pk:
+        instance._old_avatar = User.objects.filter(pk=instance.pk).values_list('avatar', flat=True).first()
+    else:
+        instance._old_avatar = None
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    old_avatar = getattr(instance, '_old_avatar', None)
+    if old_avatar != instance.avatar.name:
+        storage.release(old_avatar)
+        storage.retain(instance.avatar.name)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    storage.release(instance.avatar.name)
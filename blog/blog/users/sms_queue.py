@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 短信发送队列
+# 视图只把发送任务放入redis队列，由 manage.py sms_worker 在后台发送，
+# 发送失败按指数退避重试，超过最大次数后放入死信列表
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+
+logger = logging.getLogger('django')
+
+# 待发送的任务
+QUEUE_KEY = 'sms:queue'
+# 正在发送的任务(worker异常退出时可以恢复)
+PROCESSING_KEY = 'sms:processing'
+# 等待重试的任务  score: 重试时间
+RETRY_KEY = 'sms:retry'
+# 超过最大重试次数的任务
+DEAD_KEY = 'sms:dead'
+
+
+def get_gateway():
+    """根据 settings.SMS_GATEWAY 创建短信网关对象"""
+    return import_string(settings.SMS_GATEWAY)()
+
+
+def enqueue_sms(mobile, datas, temp_id):
+    """
+    将短信发送任务放入队列
+    :param mobile: 手机号
+    :param datas: 模板数据
+    :param temp_id: 模板id
+    """
+    job = {
+        'id': uuid.uuid4().hex,
+        'mobile': mobile,
+        'datas': datas,
+        'temp_id': temp_id,
+        'attempts': 0,
+    }
+    get_redis_connection('default').lpush(QUEUE_KEY, json.dumps(job))
+
+
+def retry_delay(attempts):
+    """第 attempts 次失败后的重试间隔(秒): base, base*2, base*4 ..."""
+    return settings.SMS_RETRY_BASE_DELAY * 2 ** (attempts - 1)
+
+
+def process_job(raw, gateway):
+    """
+    发送一条短信
+        1.调用短信网关发送
+        2.发送失败时，未超过最大次数则放入重试集合，否则放入死信列表
+        3.从正在发送的列表中删除任务
+    :param raw: 队列中的任务数据
+    :param gateway: 短信网关
+    :return: 是否发送成功
+    """
+    redis_conn = get_redis_connection('default')
+    job = json.loads(raw)
+    try:
+        success = gateway.send_template_sms(job['mobile'], job['datas'], job['temp_id']) == 0
+    except Exception as e:
+        logger.error(e)
+        success = False
+
+    pl = redis_conn.pipeline()
+    if not success:
+        job['attempts'] += 1
+        if job['attempts'] >= settings.SMS_MAX_ATTEMPTS:
+            logger.error('短信发送失败: %s' % job['mobile'])
+            pl.lpush(DEAD_KEY, json.dumps(job))
+        else:
+            pl.zadd(RETRY_KEY, {json.dumps(job): time.time() + retry_delay(job['attempts'])})
+    pl.lrem(PROCESSING_KEY, 1, raw)
+    pl.execute()
+    return success
+
+
+def move_due_retries():
+    """将到达重试时间的任务放回队列"""
+    redis_conn = get_redis_connection('default')
+    for raw in redis_conn.zrangebyscore(RETRY_KEY, '-inf', time.time()):
+        # zrem 成功的worker才放回队列，避免多个worker重复放入
+        if redis_conn.zrem(RETRY_KEY, raw):
+            redis_conn.lpush(QUEUE_KEY, raw)
+
+
+def recover_processing():
+    """将上次异常退出时正在发送的任务放回队列(只在没有其他worker运行时调用)"""
+    redis_conn = get_redis_connection('default')
+    count = 0
+    while redis_conn.rpoplpush(PROCESSING_KEY, QUEUE_KEY):
+        count += 1
+    return count
+
+
+class Worker(object):
+    """从队列中取出任务，使用线程池并发发送短信"""
+
+    def __init__(self, concurrency=None, gateway=None):
+        self.concurrency = concurrency or settings.SMS_WORKER_CONCURRENCY
+        self.gateway = gateway or get_gateway()
+        # 限制同时发送的任务数，线程都在忙时不再从队列中取任务
+        self._slots = threading.Semaphore(self.concurrency)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self, poll_timeout=1):
+        redis_conn = get_redis_connection('default')
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not self._stopped.is_set():
+                move_due_retries()
+                self._slots.acquire()
+                raw = redis_conn.brpoplpush(QUEUE_KEY, PROCESSING_KEY, timeout=poll_timeout)
+                if raw is None:
+                    self._slots.release()
+                    continue
+                future = executor.submit(process_job, raw, self.gateway)
+                future.add_done_callback(lambda f: self._slots.release())
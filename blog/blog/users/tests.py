@@ -1,3 +1,451 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import random
+import socket
+import threading
+import time
+import tracemalloc
+from hashlib import md5
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django_redis import get_redis_connection
+from libs.captcha import captcha
+from libs.yuntongxun.CCPRestSDK import REST
+from http import client as http_client
+from libs.yuntongxun.connection import CircuitBreaker, CircuitOpenError, ConnectionPool
+from libs.yuntongxun.fake import FakeCCP
+from libs.yuntongxun.xmltojson import to_dict, to_dict2
+from users import captcha_pool, sms_queue, verification
+from users.models import User
+from utils import throttling
+from utils.response_code import RETCODE
 
 # Create your tests here.
+
+
+@override_settings(SMS_GATEWAY='libs.yuntongxun.fake.FakeCCP', SMS_RETRY_BASE_DELAY=0, SMS_MAX_ATTEMPTS=3)
+class SmsQueueTest(TestCase):
+
+    def setUp(self):
+        self.redis_conn = get_redis_connection('default')
+        self.redis_conn.delete(sms_queue.QUEUE_KEY, sms_queue.PROCESSING_KEY,
+                               sms_queue.RETRY_KEY, sms_queue.DEAD_KEY)
+        self.redis_conn.delete(throttling.BUCKET_KEY % 'sms:mobile:13800000000',
+                               throttling.BUCKET_KEY % 'sms:ip:127.0.0.1')
+
+    def take_job(self):
+        return self.redis_conn.rpoplpush(sms_queue.QUEUE_KEY, sms_queue.PROCESSING_KEY)
+
+    def test_view_enqueues(self):
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        response = self.client.get(reverse('users:smscode'),
+                                   {'mobile': '13800000000', 'image_code': 'abcd', 'uuid': 'test-uuid'})
+        self.assertEqual(response.json()['code'], RETCODE.OK)
+        job = json.loads(self.take_job())
+        self.assertEqual(job['mobile'], '13800000000')
+        self.assertEqual(job['datas'][0], self.redis_conn.get('sms:13800000000').decode())
+
+    def test_view_throttled(self):
+        params = {'mobile': '13800000000', 'image_code': 'abcd', 'uuid': 'test-uuid'}
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        self.assertEqual(self.client.get(reverse('users:smscode'), params).json()['code'], RETCODE.OK)
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        self.assertEqual(self.client.get(reverse('users:smscode'), params).json()['code'], RETCODE.THROTTLINGERR)
+        # 被限流的请求不消耗图片验证码，也不发送短信
+        self.assertTrue(self.redis_conn.exists('img:test-uuid'))
+        self.assertEqual(self.redis_conn.llen(sms_queue.QUEUE_KEY), 1)
+
+    def test_wrong_image_code_keeps_mobile_token(self):
+        # 图片验证码错误时不扣减令牌，不能用错误的图片验证码阻止别人接收短信
+        params = {'mobile': '13800000000', 'image_code': 'wxyz', 'uuid': 'test-uuid'}
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        self.assertEqual(self.client.get(reverse('users:smscode'), params).json()['code'], RETCODE.IMAGECODEERR)
+        self.assertFalse(self.redis_conn.exists(throttling.BUCKET_KEY % 'sms:mobile:13800000000',
+                                                throttling.BUCKET_KEY % 'sms:ip:127.0.0.1'))
+
+        params['image_code'] = 'abcd'
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        self.assertEqual(self.client.get(reverse('users:smscode'), params).json()['code'], RETCODE.OK)
+
+    def test_retry(self):
+        gateway = FakeCCP(fail_times=1)
+        sms_queue.enqueue_sms('13800000000', ['123456', 5], 1)
+        self.assertFalse(sms_queue.process_job(self.take_job(), gateway))
+        self.assertEqual(self.redis_conn.zcard(sms_queue.RETRY_KEY), 1)
+
+        sms_queue.move_due_retries()
+        self.assertTrue(sms_queue.process_job(self.take_job(), gateway))
+        self.assertEqual(gateway.sent, [('13800000000', ['123456', 5], 1)])
+        self.assertEqual(self.redis_conn.llen(sms_queue.PROCESSING_KEY), 0)
+
+    def test_dead_letter(self):
+        gateway = FakeCCP(fail_times=10)
+        sms_queue.enqueue_sms('13800000000', ['123456', 5], 1)
+        for _ in range(3):
+            sms_queue.move_due_retries()
+            sms_queue.process_job(self.take_job(), gateway)
+        self.assertEqual(self.redis_conn.zcard(sms_queue.RETRY_KEY), 0)
+        self.assertEqual(json.loads(self.redis_conn.lpop(sms_queue.DEAD_KEY))['attempts'], 3)
+
+
+class VerificationTest(TestCase):
+
+    def setUp(self):
+        self.redis_conn = get_redis_connection('default')
+        self.redis_conn.delete('img:test-uuid', 'sms:13800000000')
+
+    def test_image_code(self):
+        self.assertEqual(verification.check_image_code('test-uuid', 'abcd', '13800000000', '123456'),
+                         (verification.EXPIRED, 0))
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        self.assertEqual(verification.check_image_code('test-uuid', 'abce', '13800000000', '123456'),
+                         (verification.WRONG, 0))
+        # 错误的图片验证码也被删除，不保存短信验证码
+        self.assertFalse(self.redis_conn.exists('img:test-uuid', 'sms:13800000000'))
+
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        self.assertEqual(verification.check_image_code('test-uuid', 'aBcD', '13800000000', '123456'),
+                         (verification.OK, 0))
+        self.assertEqual(self.redis_conn.get('sms:13800000000'), b'123456')
+        self.assertLessEqual(self.redis_conn.ttl('sms:13800000000'), 300)
+
+    def test_image_code_throttled(self):
+        self.redis_conn.delete(throttling.BUCKET_KEY % 'a', throttling.BUCKET_KEY % 'b')
+        buckets = [('a', 2, 60), ('b', 1, 60)]
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        self.assertEqual(verification.check_image_code('test-uuid', 'abcd', '13800000000', '123456',
+                                                       buckets=buckets, now=1000.0)[0], verification.OK)
+        self.redis_conn.delete('sms:13800000000')
+        self.redis_conn.setex('img:test-uuid', 300, 'ABCD')
+        result, wait = verification.check_image_code('test-uuid', 'abcd', '13800000000', '654321',
+                                                     buckets=buckets, now=1010.0)
+        self.assertEqual(result, verification.THROTTLED)
+        self.assertAlmostEqual(wait, 50)
+        # 令牌不足时不使用图片验证码，也不扣减其他令牌桶的令牌
+        self.assertTrue(self.redis_conn.exists('img:test-uuid'))
+        self.assertFalse(self.redis_conn.exists('sms:13800000000'))
+        self.assertEqual(throttling.consume([('a', 2, 60)], 1010.0), (True, 0))
+
+    def test_sms_code_used_once(self):
+        self.redis_conn.setex('sms:13800000000', 300, '123456')
+        self.assertEqual(verification.consume_sms_code('13800000000', '654321'), verification.WRONG)
+        self.assertEqual(verification.consume_sms_code('13800000000', '123456'), verification.OK)
+        self.assertEqual(verification.consume_sms_code('13800000000', '123456'), verification.EXPIRED)
+
+
+class ThrottlingTest(TestCase):
+
+    def setUp(self):
+        redis_conn = get_redis_connection('default')
+        redis_conn.delete(throttling.BUCKET_KEY % 'a', throttling.BUCKET_KEY % 'b')
+
+    def test_token_bucket(self):
+        now = 1000.0
+        self.assertEqual(throttling.consume([('a', 2, 10)], now), (True, 0))
+        self.assertEqual(throttling.consume([('a', 2, 10)], now + 1), (True, 0))
+        allowed, wait = throttling.consume([('a', 2, 10)], now + 2)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 8)
+        # 补充一个令牌后允许
+        self.assertTrue(throttling.consume([('a', 2, 10)], now + 11)[0])
+
+    def test_all_or_nothing(self):
+        now = 1000.0
+        throttling.consume([('a', 1, 60)], now)
+        # 'a' 的令牌不足，'b' 的令牌也不扣减
+        self.assertFalse(throttling.consume([('b', 1, 60), ('a', 1, 60)], now)[0])
+        self.assertTrue(throttling.consume([('b', 1, 60)], now)[0])
+
+
+class XmlToJsonTest(SimpleTestCase):
+    SEND = (b'<?xml version="1.0" encoding="UTF-8"?><Response><statusCode>000000</statusCode>'
+            b'<TemplateSMS><dateCreated>20210829120000</dateCreated><smsMessageSid>ff80</smsMessageSid>'
+            b'</TemplateSMS></Response>')
+    SUB_ACCOUNTS = (b'<Response><statusCode>000000</statusCode><totalCount>2</totalCount>'
+                    b'<SubAccount><subAccountSid>a1</subAccountSid></SubAccount>'
+                    b'<SubAccount><subAccountSid>a2</subAccountSid></SubAccount></Response>')
+    TEMPLATES = (b'<Response><statusCode>000000</statusCode><TemplateSMS><id>1</id></TemplateSMS>'
+                 b'<TemplateSMS><id>2</id></TemplateSMS><totalCount>2</totalCount></Response>')
+
+    def test_shapes(self):
+        self.assertEqual(to_dict(self.SEND), {
+            'statusCode': '000000',
+            'templateSMS': {'dateCreated': '20210829120000', 'smsMessageSid': 'ff80'},
+        })
+        self.assertEqual(to_dict('<Response><statusCode>160040</statusCode><statusMsg>超出</statusMsg></Response>'),
+                         {'statusCode': '160040', 'statusMsg': '超出'})
+        self.assertEqual(to_dict(self.SUB_ACCOUNTS), {
+            'statusCode': '000000', 'totalCount': '2',
+            'SubAccount': [{'subAccountSid': 'a1'}, {'subAccountSid': 'a2'}],
+        })
+        self.assertEqual(to_dict2(self.TEMPLATES), {
+            'statusCode': '000000', 'totalCount': '2',
+            'TemplateSMS': [{'id': '1'}, {'id': '2'}],
+        })
+        self.assertEqual(to_dict2(self.SEND)['TemplateSMS']['smsMessageSid'], 'ff80')
+
+    def test_memory_stable(self):
+        to_dict(self.SUB_ACCOUNTS)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            for _ in range(2000):
+                result = to_dict(self.SUB_ACCOUNTS)
+            growth = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        # 每次返回新的结果，不会累积之前的解析结果
+        self.assertEqual(len(result['SubAccount']), 2)
+        self.assertLess(growth, 64 * 1024)
+
+
+class SessionTest(TestCase):
+
+    def test_session(self):
+        # 页面对所有用户相同，登录状态和CSRF令牌由js请求获取
+        data = self.client.get(reverse('users:session')).json()
+        self.assertEqual(data['code'], RETCODE.OK)
+        self.assertFalse(data['is_login'])
+        self.assertTrue(data['csrf_token'])
+
+        user = User.objects.create_user(username='session', mobile='13800000009', password='12345678')
+        self.client.force_login(user)
+        response = self.client.get(reverse('users:session'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertTrue(response.json()['is_login'])
+        self.assertEqual(response.json()['username'], 'session')
+
+
+class RestTest(SimpleTestCase):
+
+    def test_overlapping_sends(self):
+        # 两个线程共用一个REST对象，发送跨过整秒时，每个请求的sig和Authorization使用同一个时间戳
+        rest = REST('127.0.0.1', '8883', '2013-12-26')
+        rest.setAccount('sid', 'token')
+        rest.setAppId('app')
+        requests = []
+        hashes = []
+
+        def overlapping_md5(data):
+            # 第一个请求计算sig之后、生成Authorization之前，另一个线程开始发送
+            hashes.append(data)
+            if len(hashes) == 1:
+                rest.sendTemplateSMS('13800000001', ['1'], 1)
+            return md5(data)
+
+        def urlopen(req):
+            requests.append(req)
+            return io.BytesIO(XmlToJsonTest.SEND)
+
+        times = [datetime.datetime(2021, 8, 29, 12, 0, 0), datetime.datetime(2021, 8, 29, 12, 0, 1)]
+        with mock.patch('libs.yuntongxun.CCPRestSDK.datetime') as mock_datetime, \
+                mock.patch('libs.yuntongxun.CCPRestSDK.md5', overlapping_md5), \
+                mock.patch.object(rest, 'urlopen', side_effect=urlopen):
+            mock_datetime.datetime.now.side_effect = times
+            rest.sendTemplateSMS('13800000000', ['1'], 1)
+
+        self.assertEqual(len(requests), 2)
+        for req in requests:
+            batch = base64.b64decode(req.get_header('Authorization')).decode().split(':')[1]
+            sig = md5(('sid' + 'token' + batch).encode()).hexdigest().upper()
+            self.assertTrue(req.full_url.endswith('sig=' + sig))
+
+    def test_single_client(self):
+        # 多个线程同时第一次发送时只创建一个连接池(熔断器的失败次数不会被分散)
+        rest = REST('127.0.0.1', '8883', '2013-12-26')
+        rest.setTimeout(3, 10)
+
+        def slow_client(**kwargs):
+            time.sleep(0.05)
+            return mock.Mock()
+
+        with mock.patch('libs.yuntongxun.CCPRestSDK.HttpClient', side_effect=slow_client) as client_class:
+            threads = [threading.Thread(target=rest.urlopen, args=(None,)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(client_class.call_count, 1)
+        self.assertEqual(rest.Client.urlopen.call_count, 8)
+
+
+@mock.patch('libs.yuntongxun.connection.time')
+class CircuitBreakerTest(SimpleTestCase):
+
+    def open_breaker(self, breaker):
+        for success in (True, True, False, False):
+            breaker.before_request()
+            breaker.record(success)
+
+    def test_open_at_threshold(self, mock_time):
+        mock_time.monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=0.5, window=4, min_requests=4, reset_timeout=30)
+        for success in (True, True, False):
+            breaker.record(success)
+        # 请求数不足 min_requests 时不打开
+        self.assertFalse(breaker.is_open)
+        breaker.record(False)
+        self.assertTrue(breaker.is_open)
+        # 打开期间直接失败
+        mock_time.monotonic.return_value = 129
+        self.assertRaises(CircuitOpenError, breaker.before_request)
+
+    def test_trial_success(self, mock_time):
+        mock_time.monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=0.5, window=4, min_requests=4, reset_timeout=30)
+        self.open_breaker(breaker)
+        # 半开: 只放行一个试探请求
+        mock_time.monotonic.return_value = 130
+        breaker.before_request()
+        self.assertRaises(CircuitOpenError, breaker.before_request)
+        breaker.record(True)
+        self.assertFalse(breaker.is_open)
+        # 关闭后重新统计，一次失败不会再次打开
+        breaker.before_request()
+        breaker.record(False)
+        self.assertFalse(breaker.is_open)
+
+    def test_trial_failure(self, mock_time):
+        mock_time.monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=0.5, window=4, min_requests=4, reset_timeout=30)
+        self.open_breaker(breaker)
+        mock_time.monotonic.return_value = 130
+        breaker.before_request()
+        breaker.record(False)
+        # 试探失败后重新打开 reset_timeout 秒
+        self.assertTrue(breaker.is_open)
+        mock_time.monotonic.return_value = 159
+        self.assertRaises(CircuitOpenError, breaker.before_request)
+        mock_time.monotonic.return_value = 160
+        breaker.before_request()
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """
+    本地的HTTP服务器，behaviors 为每个请求的处理方式:
+        'ok' 返回响应并保持连接  'drop' 读取完请求后不响应直接断开  'close_idle' 返回响应后关闭连接(不通知客户端)
+    """
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.bodies = []
+        self.connections = 0
+
+    def tearDown(self):
+        self.server.close()
+
+    def serve(self, behaviors):
+        def run():
+            behaviors_iter = iter(behaviors)
+            while True:
+                try:
+                    conn, _ = self.server.accept()
+                except OSError:
+                    return
+                self.connections += 1
+                with conn, conn.makefile('rb') as reader:
+                    for behavior in behaviors_iter:
+                        headers = b''
+                        while not headers.endswith(b'\r\n\r\n'):
+                            line = reader.readline()
+                            if not line:
+                                break
+                            headers += line
+                        if not headers:
+                            break
+                        length = int(headers.lower().split(b'content-length:')[1].split(b'\r\n')[0])
+                        self.bodies.append(reader.read(length))
+                        if behavior == 'drop':
+                            break
+                        conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+                        if behavior == 'close_idle':
+                            break
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def test_post_not_resent_after_delivery(self):
+        # 服务器收到请求后断开连接: POST可能已经被处理，不能重试(否则用户收到两条短信)
+        self.serve(['ok', 'drop'])
+        pool = ConnectionPool('http', '127.0.0.1', self.port)
+        self.assertEqual(pool.request('POST', '/', b'first'), (200, b'ok'))
+        with self.assertRaises(http_client.RemoteDisconnected):
+            pool.request('POST', '/', b'second')
+        self.assertEqual(self.bodies, [b'first', b'second'])
+        self.assertEqual(self.connections, 1)
+
+    def test_stale_connection_skipped(self):
+        # 空闲连接已经被服务器关闭时使用新连接，请求只发送一次
+        self.serve(['close_idle', 'ok'])
+        pool = ConnectionPool('http', '127.0.0.1', self.port)
+        self.assertEqual(pool.request('POST', '/', b'first'), (200, b'ok'))
+        time.sleep(0.05)
+        self.assertEqual(pool.request('POST', '/', b'second'), (200, b'ok'))
+        self.assertEqual(self.bodies, [b'first', b'second'])
+        self.assertEqual(self.connections, 2)
+
+
+class CaptchaTest(SimpleTestCase):
+
+    def render(self, seed):
+        random.seed(seed)
+        return captcha.generate(text='ABCD')
+
+    def test_glyph_cache(self):
+        captcha.clear_cache()
+        first = self.render(1)
+        self.assertTrue(captcha._glyphs)
+        # 第二次绘制使用缓存的字形，不再加载字体，结果与第一次相同
+        with mock.patch('libs.captcha.captcha.truetype') as truetype:
+            second = self.render(1)
+        truetype.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual(first[0], 'ABCD')
+
+    def test_generate_batch(self):
+        # 单进程和多进程(按进程数分块)生成的数量和格式相同
+        for processes in (1, 2):
+            captchas = captcha.generate_batch(3, processes)
+            self.assertEqual(len(captchas), 3)
+            for text, image in captchas:
+                self.assertIsInstance(text, str)
+                self.assertEqual(len(text), 4)
+                self.assertTrue(image.startswith(b'\xff\xd8'))
+
+
+class CaptchaPoolTest(TestCase):
+
+    def setUp(self):
+        self.redis_conn = get_redis_connection('default')
+        self.redis_conn.delete(captcha_pool.POOL_KEY, 'img:test-uuid')
+
+    def test_fill_and_pop(self):
+        self.assertEqual(captcha_pool.fill_pool(high_watermark=3, batch_size=2), 3)
+        self.assertEqual(captcha_pool.pool_size(), 3)
+        # 已经达到高水位时不再生成
+        self.assertEqual(captcha_pool.fill_pool(high_watermark=3), 0)
+        text, image = captcha_pool.pop_captcha()
+        self.assertEqual(len(text), 4)
+        self.assertTrue(image.startswith(b'\xff\xd8'))
+        self.assertEqual(captcha_pool.pool_size(), 2)
+
+    def test_view(self):
+        captcha_pool.fill_pool(high_watermark=1)
+        text, image = self.redis_conn.lindex(captcha_pool.POOL_KEY, 0).split(captcha_pool.SEPARATOR, 1)
+        response = self.client.get(reverse('users:imagecode'), {'uuid': 'test-uuid'})
+        self.assertEqual(response.content, image)
+        self.assertEqual(self.redis_conn.get('img:test-uuid'), text)
+
+        # 验证码池为空时当场生成
+        with mock.patch('users.captcha_pool.generate', wraps=captcha.generate) as generate:
+            response = self.client.get(reverse('users:imagecode'), {'uuid': 'test-uuid'})
+        generate.assert_called_once_with()
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(len(self.redis_conn.get('img:test-uuid')), 4)
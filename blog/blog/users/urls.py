@@ -5,7 +5,7 @@ from django.urls import path
 from users.views import RegisterView, ImageCodeView
 from users.views import SmsCodeView, LoginView
 from users.views import LogoutView, ForgetPasswordView
-from users.views import UserCenterView, WriteBlogView
+from users.views import UserCenterView, WriteBlogView, SessionView
 
 urlpatterns = [
     # path的第一个参数: 路由
@@ -32,4 +32,7 @@ urlpatterns = [
 
     # 写博客的路由
     path('writeblog/', WriteBlogView.as_view(), name='writeblog'),
+
+    # 登录状态和CSRF令牌(页面可以被共享缓存，与用户相关的数据由js获取)
+    path('session/', SessionView.as_view(), name='session'),
 ]
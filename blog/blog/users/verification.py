@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 图片验证码和短信验证码的校验
+# 校验和删除在同一个lua脚本中完成，并发请求时一个验证码只能使用一次，每次校验只需要一次往返
+from django_redis import get_redis_connection
+from utils.throttling import TOKEN_BUCKET_LUA, bucket_args
+
+IMAGE_CODE_KEY = 'img:%s'
+SMS_CODE_KEY = 'sms:%s'
+
+# 校验结果
+OK = 1
+WRONG = 0
+EXPIRED = -1
+THROTTLED = -2
+
+# 限流、校验并删除图片验证码(不区分大小写)，正确时扣减令牌并保存短信验证码
+#   1.任何一个令牌桶的令牌不足时直接返回，不使用图片验证码
+#   2.图片验证码过期或错误时不扣减令牌，不能用错误的图片验证码耗尽别人手机号的令牌
+# KEYS[1]: 图片验证码的key  KEYS[2]: 短信验证码的key  KEYS[3..]: 令牌桶(见 utils.throttling)
+# ARGV[1]: 用户输入的图片验证码(小写)  ARGV[2]: 短信验证码  ARGV[3]: 短信验证码的有效期(秒)
+# ARGV[4..]: 当前时间，每个令牌桶的容量和每秒补充的令牌数
+# 返回 {校验结果, 需要等待的秒数}
+CHECK_IMAGE_CODE_SCRIPT = TOKEN_BUCKET_LUA + """
+local buckets, wait = check_buckets(3, 4)
+if wait > 0 then
+    return {-2, tostring(wait)}
+end
+local image_code = redis.call('GET', KEYS[1])
+if not image_code then
+    return {-1, '0'}
+end
+-- 无论是否正确都删除，避免恶意测试图片验证码
+redis.call('DEL', KEYS[1])
+if string.lower(image_code) ~= ARGV[1] then
+    return {0, '0'}
+end
+take_tokens(buckets, ARGV[4])
+redis.call('SETEX', KEYS[2], ARGV[3], ARGV[2])
+return {1, '0'}
+"""
+
+# 校验短信验证码，正确时删除(只能使用一次)
+# KEYS[1]: 短信验证码的key  ARGV[1]: 用户输入的短信验证码
+CONSUME_SMS_CODE_SCRIPT = """
+local sms_code = redis.call('GET', KEYS[1])
+if not sms_code then
+    return -1
+end
+if sms_code ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+_scripts = {}
+
+
+def _run(source, keys, args):
+    redis_conn = get_redis_connection('default')
+    script = _scripts.get(source)
+    if script is None:
+        # 第一次调用时注册，之后使用 EVALSHA 调用
+        script = _scripts[source] = redis_conn.register_script(source)
+    return script(keys=keys, args=args, client=redis_conn)
+
+
+def check_image_code(uuid, image_code, mobile, sms_code, expires=300, buckets=(), now=None):
+    """
+    限流，校验并删除图片验证码，正确时扣减令牌并保存短信验证码(一次往返)
+    :param buckets: 令牌桶 [(名称, 容量, 补充一个令牌的间隔秒数)]
+    :param now: 当前时间(time.time())
+    :return: (OK, WRONG, EXPIRED 或 THROTTLED, 需要等待的秒数)
+    """
+    keys, args = bucket_args(buckets, now)
+    result, wait = _run(CHECK_IMAGE_CODE_SCRIPT,
+                        [IMAGE_CODE_KEY % uuid, SMS_CODE_KEY % mobile] + keys,
+                        [image_code.lower(), sms_code, expires] + args)
+    return result, float(wait)
+
+
+def consume_sms_code(mobile, sms_code):
+    """
+    校验短信验证码，正确时删除
+    :return: OK, WRONG 或 EXPIRED
+    """
+    return _run(CONSUME_SMS_CODE_SCRIPT, [SMS_CODE_KEY % mobile], [sms_code])
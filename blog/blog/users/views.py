@@ -1,13 +1,17 @@
 from django.shortcuts import render
 from django.views import View
 from django.http.response import HttpResponseBadRequest
-from libs.captcha.captcha import captcha
+from users import captcha_pool
 from django_redis import get_redis_connection
 from django.http import HttpResponse
 from django.http.response import JsonResponse
 from utils.response_code import RETCODE
 from random import randint
-from libs.yuntongxun.sms import CCP
+from django.conf import settings
+from utils import throttling
+from utils.image_queue import enqueue_image
+from users.sms_queue import enqueue_sms
+from users import verification
 from users.models import User
 from django.db import DatabaseError
 from django.shortcuts import redirect
@@ -16,9 +20,13 @@ from django.contrib.auth import login
 from django.contrib.auth import authenticate
 from django.contrib.auth import logout
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.middleware.csrf import get_token
+from django.utils.cache import add_never_cache_headers, patch_cache_control
 from home.models import ArticleCategory, Article
+from home.caches import get_categories, get_category
 # Create your views here.
 import re
+import time
 import logging
 logger = logging.getLogger('django')
 
@@ -62,11 +70,11 @@ class RegisterView(View):
         if password != password2:
             return HttpResponseBadRequest('两次密码不一致')
         #     2.5 短信验证码是否和redis中的一致
-        redis_conn = get_redis_connection('default')
-        redis_sms_code = redis_conn.get('sms:%s' % mobile)
-        if redis_sms_code is None:
+        # 验证码正确时删除，只能使用一次
+        result = verification.consume_sms_code(mobile, smscode)
+        if result == verification.EXPIRED:
             return HttpResponseBadRequest('短信验证码已过期')
-        if smscode != redis_sms_code.decode():  # # 如果用户输入的 != 验证码
+        if result == verification.WRONG:
             return HttpResponseBadRequest('短信验证码错误')
         # 3.保存注册信息(数据)
         # create_user 可以使用系统的方法来对密码进行加密
@@ -116,7 +124,8 @@ class ImageCodeView(View):
         if uuid is None:
             return HttpResponseBadRequest('没有传递uuid')
         # 获取验证码内容和验证码图片二进制数据
-        text, image = captcha.generate_captcha()
+        # 优先从预先生成的验证码池中获取，池为空时当场生成
+        text, image = captcha_pool.generate_captcha()
         # 将图片内容保存到redis中，并设置过期时间
         redis_conn = get_redis_connection('default')
         # key 设置为 uuid
@@ -132,13 +141,13 @@ class SmsCodeView(View):
     1.接收参数
     2.参数的验证
        2.1 验证参数是否齐全
-       2.2 图片验证码的验证
-           连接redis，获取redis中的图片验证码
+       3.生成短信验证码
+       4.限流和图片验证码的验证，正确时保存短信验证码到redis中(在一个lua脚本中完成)
+           客户端IP和手机号的令牌不足时直接返回
            判断图片验证码是否存在
-           如果图片验证码未过期，我们获取到之后就可以删除图片验证码
+           获取到之后就删除图片验证码
            比对图片验证码
-       3.生成短信验证码
-       4.保存短信验证码到redis中
+           正确时才扣减令牌
        5.发送短信
        6.返回响应
            :param request:
@@ -154,36 +163,30 @@ class SmsCodeView(View):
         # 2.1 验证参数是否齐全
         if not all([mobile, image_code, uuid]):
             return JsonResponse({'code': RETCODE.NECESSARYPARAMERR, 'errmsg': '缺少必传的参数'})
-        # 2.2 图片验证码的验证
-        # 创建连接到redis的对象
-        redis_conn = get_redis_connection('default')
-        # 获取redis中的图片验证码
-        redis_image_code = redis_conn.get('img:%s' % uuid)
-        # 判断图片验证码是否存在
-        if redis_image_code is None:
+        # 3.生成短信验证码：生成6位数验证码
+        sms_code = '%06d' % randint(0, 999999)
+        # 4.限流(客户端IP和手机号各一个令牌桶)，校验并删除图片验证码，
+        #   正确时扣减令牌，保存短信验证码到redis中，并设置有效期(一个lua脚本，一次往返)
+        result, wait = verification.check_image_code(uuid, image_code, mobile, sms_code, 300, [
+            ('sms:ip:%s' % throttling.get_client_ip(request),) + settings.SMS_THROTTLE_IP,
+            ('sms:mobile:%s' % mobile,) + settings.SMS_THROTTLE_MOBILE,
+        ], time.time())
+        if result == verification.THROTTLED:
+            return JsonResponse({'code': RETCODE.THROTTLINGERR,
+                                 'errmsg': '发送短信过于频繁，请%d秒后再试' % (int(wait) + 1)})
+        if result == verification.EXPIRED:
             # 图形验证码过期或者不存在
             return JsonResponse({'code': RETCODE.IMAGECODEERR, 'errmsg': '图形验证码已过期'})
-        # 如果图片验证码未过期,我们获取到之后就可以删除图片验证码,
-        # 删除图形验证码,避免恶意测试图形验证码
-        try:
-            redis_conn.delete('img:%s' % uuid)
-        except Exception as e:
-            logger.error(e)
-        # 对比图形验证码,注意大小写的问题,redis的数据是byte类型
-        if redis_image_code.decode().lower() != image_code.lower():  # 转小写后比较
+        if result == verification.WRONG:
             return JsonResponse({'code': RETCODE.IMAGECODEERR, 'errmsg': '图形验证码错误'})
-        # 3.生成短信验证码：生成6位数验证码
-        sms_code = '%06d' % randint(0, 999999)
         # 为了后期比对方便，我们可以将短信验证码记录到日志中
         logger.info(sms_code)
-        # 4.保存短信验证码到redis中，并设置有效期
-        redis_conn.setex('sms:%s' % mobile, 300, sms_code)
-        # 5.发送短信验证码
+        # 5.发送短信验证码(放入队列，由 sms_worker 在后台发送)
         # 参数1  测试手机号
         # 参数2(列表): 您的验证码是{1}，请于{2}分钟内正确输入
         # {1} 短信验证码   {2} 短信验证码的有效期
         # 参数3: 免费开发测试使用的模板ID为1
-        CCP().send_template_sms(mobile, [sms_code, 5], 1)
+        enqueue_sms(mobile, [sms_code, 5], 1)
 
         # 6.返回响应结果
         return JsonResponse({'code': RETCODE.OK, 'errmsg': '发送短信成功'})
@@ -326,11 +329,11 @@ class ForgetPasswordView(View):
             return HttpResponseBadRequest('两次输入的密码不一致')
 
         # 2.5 判断短信验证码是否正确
-        redis_conn = get_redis_connection('default')
-        redis_sms_code = redis_conn.get('sms:%s' % mobile)
-        if redis_sms_code is None:
+        # 验证码正确时删除，只能使用一次
+        result = verification.consume_sms_code(mobile, smscode)
+        if result == verification.EXPIRED:
             return HttpResponseBadRequest('短信验证码已过期')
-        if smscode != redis_sms_code.decode():  # 如果用户输入的 != 验证码
+        if result == verification.WRONG:
             return HttpResponseBadRequest('短信验证码错误')
 
         # 3.根据手机号查询用户信息
@@ -372,6 +375,7 @@ class UserCenterView(LoginRequiredMixin, View):
             'username': user.username,
             'mobile': user.mobile,
             'avatar': user.avatar.url if user.avatar else None,
+            'avatar_variants': user.avatar_variants,
             'user_desc': user.user_desc
         }
         return render(request, 'center.html', context=context)
@@ -398,10 +402,14 @@ class UserCenterView(LoginRequiredMixin, View):
             user.user_desc = user_desc
             if avatar:
                 user.avatar = avatar
+                # 新头像的衍生图在后台生成，生成前页面使用原图
+                user.avatar_variants = {}
             user.save()
         except Exception as e:
             logger.error(e)
             return HttpResponseBadRequest('修改失败，请稍后再试')
+        if avatar:
+            enqueue_image(user)
 
         # 3.更新cookie中的username信息
         # 4.返回响应，刷新当前页面(重定向操作)
@@ -416,8 +424,8 @@ class UserCenterView(LoginRequiredMixin, View):
 class WriteBlogView(LoginRequiredMixin, View):
 
     def get(self, request):
-        # 获取博客分类信息(查询所有分类模型)
-        categories = ArticleCategory.objects.all()
+        # 获取博客分类信息(两级缓存)
+        categories = get_categories()
 
         context = {
             'categories': categories
@@ -450,7 +458,7 @@ class WriteBlogView(LoginRequiredMixin, View):
         # 2.2 判断分类 id
         # 判断文章分类id数据是否正确
         try:
-            article_category = ArticleCategory.objects.get(id=category_id)
+            article_category = get_category(category_id)
         except ArticleCategory.DoesNotExist:
             return HttpResponseBadRequest('没有此分类')
 
@@ -469,8 +477,32 @@ class WriteBlogView(LoginRequiredMixin, View):
         except Exception as e:
             logger.error(e)
             return HttpResponseBadRequest('发布失败，请稍后再试')
+        # 在后台生成标题图的衍生图
+        enqueue_image(article)
 
         # 返回响应，跳转到文章详情页面
         #  4.跳转到指定页面（暂时首页）
         # 暂时先跳转到首页
         return redirect(reverse('home:index'))
+
+
+class SessionView(View):
+    """
+    当前用户的登录状态和CSRF令牌
+    首页、详情页对所有用户相同(可以被共享缓存)，页面中与用户相关的部分由js通过该接口获取
+    """
+
+    def get(self, request):
+        user = request.user
+        response = JsonResponse({
+            'code': RETCODE.OK,
+            'errmsg': 'ok',
+            'is_login': user.is_authenticated,
+            'username': user.username if user.is_authenticated else '',
+            # 同时设置csrftoken的cookie
+            'csrf_token': get_token(request),
+        })
+        # 每个用户不同，不能被任何缓存保存
+        add_never_cache_headers(response)
+        patch_cache_control(response, private=True)
+        return response
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 静态文件构建
+# manage.py build_assets:
+#   1.按 settings.ASSET_BUNDLES 把每个页面的js合并为一个文件并压缩(安装了rjsmin时)
+#   2.collectstatic: 文件名加上内容哈希值(写入manifest)，同时生成 .gz 和 .br(安装了brotli时)
+# 模板中 {% static %} 输出带哈希值的文件名，浏览器可以缓存一年；{% bundle %} 输出页面的合并文件
+import gzip
+import logging
+import os
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('django')
+
+# 合并文件在静态文件中的目录
+BUNDLE_DIR = 'bundles'
+# 预压缩的文件类型
+COMPRESS_EXTENSIONS = {'.js', '.css', '.svg', '.json', '.txt', '.html', '.xml', '.map'}
+# 小于该大小的文件不压缩(字节)
+COMPRESS_MIN_SIZE = 256
+
+
+def bundle_name(name):
+    """合并文件的路径: index -> bundles/index.js"""
+    return '%s/%s.js' % (BUNDLE_DIR, name)
+
+
+def minify(source, path=''):
+    """压缩js(已经压缩过的 .min.js 不再处理，没有安装rjsmin时不压缩)"""
+    if rjsmin is None or path.endswith('.min.js'):
+        return source
+    return rjsmin.jsmin(source)
+
+
+def gzip_bytes(data):
+    # mtime=0: 相同内容每次生成的文件相同
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def brotli_bytes(data):
+    return brotli.compress(data, quality=11) if brotli is not None else None
+
+
+def build_bundle(name, sources):
+    """
+    合并并压缩一个页面的js
+    :param sources: 静态文件路径列表(按加载顺序)
+    :return: (合并后的内容, 原文件的总大小)
+    """
+    parts = []
+    total = 0
+    for path in sources:
+        full_path = finders.find(path)
+        if full_path is None:
+            raise FileNotFoundError('静态文件不存在: %s (bundle %s)' % (path, name))
+        with open(full_path, encoding='utf-8') as f:
+            source = f.read()
+        total += len(source.encode())
+        parts.append('/* %s */\n%s' % (path, minify(source, path).strip()))
+    # 上一个文件结尾没有分号时，下一个文件的 (function(){...}) 会被当成函数调用
+    return ';\n'.join(parts) + ';\n', total
+
+
+def write_bundles(bundles=None, output_dir=None):
+    """
+    生成所有页面的合并文件
+    :return: [(页面名, 原文件的总大小, 合并文件的内容)]
+    """
+    bundles = settings.ASSET_BUNDLES if bundles is None else bundles
+    output_dir = output_dir or settings.ASSET_BUILD_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    for name, sources in bundles.items():
+        content, total = build_bundle(name, sources)
+        data = content.encode()
+        with open(os.path.join(output_dir, '%s.js' % name), 'wb') as f:
+            f.write(data)
+        results.append((name, total, data))
+    return results
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic 时文件名加上内容哈希值，并为文本文件生成 .gz 和 .br
+    (nginx 使用 gzip_static/brotli_static 直接发送，不需要每次请求时压缩)
+    """
+
+    def stored_name(self, name):
+        # 还没有运行 collectstatic(开发环境、测试)时使用原文件名
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1] in COMPRESS_EXTENSIONS and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        """生成压缩文件(压缩后没有变小时不生成)"""
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return
+        for suffix, compressed in (('.gz', gzip_bytes(data)), ('.br', brotli_bytes(data))):
+            if compressed is None or len(compressed) >= len(data):
+                continue
+            path = self.path(name + suffix)
+            with open(path, 'wb') as f:
+                f.write(compressed)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 两级缓存: 进程内LRU缓存(带过期时间) + redis缓存
+# 数据修改后通过redis的发布/订阅通知所有进程删除本地缓存
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from django.core.cache import caches
+from django_redis import get_redis_connection
+
+logger = logging.getLogger('django')
+
+# 缓存失效通知的频道，消息内容为 "缓存名:键"
+INVALIDATE_CHANNEL = 'cache:invalidate'
+
+_MISSING = object()
+
+
+class TwoTierCache(object):
+    """
+    两级缓存
+        1.先查进程内的LRU缓存(不需要网络往返)
+        2.再查redis缓存
+        3.都没有时调用函数获取数据(查询数据库)，写入两级缓存
+    """
+    # 当前进程中所有的两级缓存，收到失效通知时按名字查找
+    registry = {}
+
+    def __init__(self, name, maxsize=128, ttl=60, timeout=3600, alias='default'):
+        """
+        :param name: 缓存名，作为redis缓存键的前缀
+        :param maxsize: 进程内缓存的最大条数
+        :param ttl: 进程内缓存的过期时间(秒)，收不到失效通知时也能保证数据最终一致
+        :param timeout: redis缓存的过期时间(秒)
+        :param alias: settings.CACHES 中的缓存配置名
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timeout = timeout
+        self.alias = alias
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        TwoTierCache.registry[name] = self
+
+    def _key(self, key):
+        return '%s:%s' % (self.name, key)
+
+    def _get_local(self, key):
+        with self._lock:
+            try:
+                expires, value = self._local[key]
+            except KeyError:
+                return _MISSING
+            if expires < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def evict_local(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    def get_or_set(self, key, func):
+        """
+        获取缓存数据，没有缓存时调用 func() 获取并写入缓存
+        """
+        _start_subscriber(self.alias)
+
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+
+        cache = caches[self.alias]
+        value = cache.get(self._key(key), _MISSING)
+        if value is _MISSING:
+            value = func()
+            cache.set(self._key(key), value, self.timeout)
+        self._set_local(key, value)
+        return value
+
+    def delete(self, key):
+        """删除缓存数据，并通知所有进程删除本地缓存"""
+        self.evict_local(key)
+        caches[self.alias].delete(self._key(key))
+        get_redis_connection(self.alias).publish(INVALIDATE_CHANNEL, self._key(key))
+
+
+# 订阅线程所在的进程id(fork出的子进程需要重新启动订阅线程)
+_subscriber_pid = None
+_subscriber_lock = threading.Lock()
+
+
+def _start_subscriber(alias):
+    global _subscriber_pid
+    if _subscriber_pid == os.getpid():
+        return
+    with _subscriber_lock:
+        if _subscriber_pid == os.getpid():
+            return
+        _subscriber_pid = os.getpid()
+        thread = threading.Thread(target=_listen, args=(alias,), name='cache-invalidate', daemon=True)
+        thread.start()
+
+
+def _listen(alias):
+    """接收缓存失效通知，删除本地缓存"""
+    while True:
+        try:
+            pubsub = get_redis_connection(alias).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATE_CHANNEL)
+            for message in pubsub.listen():
+                name, _, key = message['data'].decode().partition(':')
+                cache = TwoTierCache.registry.get(name)
+                if cache is not None:
+                    cache.evict_local(key)
+        except Exception as e:
+            # redis连接断开，稍后重新订阅(期间本地缓存依靠过期时间失效)
+            logger.error(e)
+            time.sleep(1)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 图片处理队列
+# 视图保存上传的图片后只把任务放入redis队列，由 manage.py image_worker 在后台的进程池中生成衍生图，
+# 生成后写入模型的 <字段名>_variants 字段，失败的任务放入死信列表(图片损坏等，重试也不会成功)
+import json
+import uuid
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from django_redis import get_redis_connection
+from utils.images import build_variants, variants_field
+
+logger = logging.getLogger('django')
+
+# 待处理的任务
+QUEUE_KEY = 'image:queue'
+# 正在处理的任务(worker异常退出时可以恢复)
+PROCESSING_KEY = 'image:processing'
+# 处理失败的任务
+DEAD_KEY = 'image:dead'
+
+# 衍生图保存后发送  sender: 模型类  pk: 主键
+variants_saved = Signal()
+
+
+def make_job(instance, field='avatar'):
+    """生成图片处理任务"""
+    return {
+        'id': uuid.uuid4().hex,
+        'model': instance._meta.label,
+        'pk': instance.pk,
+        'field': field,
+        'name': getattr(instance, field).name,
+    }
+
+
+def enqueue_image(instance, field='avatar'):
+    """
+    将图片处理任务放入队列(事务提交后)
+    :param instance: 模型对象(已保存)
+    :param field: 图片字段名
+    """
+    if not getattr(instance, field):
+        return
+    raw = json.dumps(make_job(instance, field))
+    transaction.on_commit(lambda: get_redis_connection('default').lpush(QUEUE_KEY, raw))
+
+
+def save_variants(job, variants):
+    """
+    保存衍生图信息
+    图片在处理期间被替换时不保存(衍生图与原图保存在一起，原图被回收时一并删除)
+    :return: 是否保存
+    """
+    model = apps.get_model(job['model'])
+    updated = model.objects.filter(pk=job['pk'], **{job['field']: job['name']}) \
+        .update(**{variants_field(job['field']): variants})
+    if not updated:
+        return False
+    variants_saved.send(sender=model, pk=job['pk'])
+    return True
+
+
+def finish_job(raw, future):
+    """
+    保存处理结果(在主进程中调用)
+        1.处理成功时保存衍生图信息，失败时放入死信列表
+        2.从正在处理的列表中删除任务
+    """
+    redis_conn = get_redis_connection('default')
+    job = json.loads(raw)
+    try:
+        save_variants(job, future.result())
+    except Exception as e:
+        logger.error('图片处理失败: %s %s' % (job['name'], e))
+        redis_conn.lpush(DEAD_KEY, raw)
+    redis_conn.lrem(PROCESSING_KEY, 1, raw)
+
+
+def recover_processing():
+    """将上次异常退出时正在处理的任务放回队列(只在没有其他worker运行时调用)"""
+    redis_conn = get_redis_connection('default')
+    count = 0
+    while redis_conn.rpoplpush(PROCESSING_KEY, QUEUE_KEY):
+        count += 1
+    return count
+
+
+class Worker(object):
+    """从队列中取出任务，使用进程池生成衍生图(图片编解码是CPU密集型，线程池受GIL限制)"""
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or settings.IMAGE_WORKER_CONCURRENCY
+        # 限制同时处理的任务数，进程都在忙时不再从队列中取任务
+        self._slots = threading.Semaphore(self.concurrency)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _done(self, raw, future):
+        try:
+            finish_job(raw, future)
+        finally:
+            self._slots.release()
+
+    def run(self, poll_timeout=1):
+        redis_conn = get_redis_connection('default')
+        with ProcessPoolExecutor(max_workers=self.concurrency, initializer=django.setup) as executor:
+            while not self._stopped.is_set():
+                self._slots.acquire()
+                raw = redis_conn.brpoplpush(QUEUE_KEY, PROCESSING_KEY, timeout=poll_timeout)
+                if raw is None:
+                    self._slots.release()
+                    continue
+                future = executor.submit(build_variants, json.loads(raw)['name'])
+                future.add_done_callback(lambda f, raw=raw: self._done(raw, f))
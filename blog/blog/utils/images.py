@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 上传图片的衍生图
+# 每张图片只解码一次，按 settings.IMAGE_WIDTHS 从大到小依次缩小，
+# 每个宽度保存 JPEG 和 WebP 两种格式，另外生成一张很小的模糊占位图(base64)
+# 结果保存在模型的 <字段名>_variants 字段中:
+#   {'width': 原图宽, 'height': 原图高, 'placeholder': 'data:image/jpeg;base64,...',
+#    'sources': {'webp': [[宽度, 文件名], ...], 'jpeg': [[宽度, 文件名], ...]}}
+import base64
+import io
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageFilter, ImageOps
+from utils.storage import derived_name
+
+# 格式 -> (Pillow格式名, 扩展名, 保存参数)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'method': 4}),
+}
+
+
+def variants_field(field):
+    """保存衍生图信息的字段名"""
+    return '%s_variants' % field
+
+
+def variant_name(name, width, fmt):
+    """衍生图的文件名: cas/ab/cd/abcd.png -> cas/ab/cd/abcd@640w.webp(与原图保存在一起)"""
+    return derived_name(name, '%dw.%s' % (width, FORMATS[fmt][1]))
+
+
+def _flatten(image):
+    """转换为RGB，透明背景填充为白色(JPEG不支持透明)"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    pil_format, _, options = FORMATS[fmt]
+    image.save(buffer, pil_format, quality=quality, **options)
+    return buffer.getvalue()
+
+
+def _save(name, content):
+    """保存衍生图(按内容保存的存储会覆盖同名的衍生图)"""
+    return default_storage.save(name, ContentFile(content))
+
+
+def placeholder(image, width=None):
+    """生成模糊占位图(几百字节，直接内嵌到页面中)"""
+    width = width or settings.IMAGE_PLACEHOLDER_WIDTH
+    height = max(1, round(image.height * width / image.width))
+    small = image.resize((width, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    return 'data:image/jpeg;base64,' + base64.b64encode(_encode(small, 'jpeg', 40)).decode()
+
+
+def build_variants(name, widths=None, formats=None, quality=None):
+    """
+    生成图片的衍生图(在worker进程中调用，不访问数据库)
+        1.解码原图(JPEG按最大宽度缩小解码)，按EXIF方向旋转
+        2.从大到小依次缩小，每个宽度保存各种格式
+        3.生成模糊占位图
+    :param name: 图片在存储中的文件名
+    :return: 衍生图信息
+    """
+    widths = sorted(widths or settings.IMAGE_WIDTHS, reverse=True)
+    formats = formats or settings.IMAGE_FORMATS
+    quality = quality or settings.IMAGE_QUALITY
+
+    # 1.解码原图
+    with default_storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        # JPEG可以在解码时按 1/2, 1/4, 1/8 缩小，减少解码时间和内存
+        image.draft('RGB', (widths[0], widths[0] * image.height // max(1, image.width)))
+        image = ImageOps.exif_transpose(image)
+        image = _flatten(image)
+    original_width, original_height = image.size
+
+    # 2.依次缩小: 每次从上一个尺寸缩小，不重复处理大图
+    # 原图比所有宽度都小时，只保存一份原始宽度的衍生图
+    targets = [width for width in widths if width < original_width] or [original_width]
+    sources = {fmt: [] for fmt in formats}
+    current = image
+    for width in targets:
+        if width != current.width:
+            height = max(1, round(original_height * width / original_width))
+            current = current.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            saved = _save(variant_name(name, width, fmt), _encode(current, fmt, quality))
+            sources[fmt].append([width, saved])
+    for fmt in formats:
+        sources[fmt].reverse()
+
+    # 3.模糊占位图
+    return {
+        'width': original_width,
+        'height': original_height,
+        'placeholder': placeholder(current),
+        'sources': sources,
+    }
+
+
+def srcset(variants, fmt):
+    """生成 srcset 属性的值"""
+    items = (variants or {}).get('sources', {}).get(fmt) or []
+    return ', '.join('%s %dw' % (default_storage.url(name), width) for width, name in items)
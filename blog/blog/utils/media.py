@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 上传文件(MEDIA_URL)的访问
+# settings.MEDIA_SERVE_MODE:
+#   'x-accel'    只检查文件是否存在，由nginx发送文件(X-Accel-Redirect 到 internal 的 location)
+#   'x-sendfile' 由 Apache(mod_xsendfile)/lighttpd 发送文件
+#   'python'     由python发送: 强ETag、Last-Modified、304、Range，
+#                文件内容交给 wsgi.file_wrapper(gunicorn等会使用sendfile，不经过python读写)
+# 按内容保存的文件(cas/...)内容不会改变，浏览器可以永久缓存(immutable)
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_http_methods
+from utils.storage import CAS_NAME_RE
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# 按内容保存的文件缓存一年
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def media_path(path):
+    """
+    检查请求的文件名
+    :return: (规范化的文件名, 绝对路径)
+    """
+    name = posixpath.normpath(path).lstrip('/')
+    # 不允许访问隐藏文件(如保存上传文件时的临时文件)
+    if not name or name == '.' or any(part.startswith('.') for part in name.split('/')):
+        raise Http404
+    try:
+        return name, safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404
+
+
+def file_etag(name, st):
+    """强ETag: 按内容保存的文件使用sha256，其他文件使用修改时间和大小"""
+    if CAS_NAME_RE.match(name):
+        return '"%s"' % posixpath.splitext(posixpath.basename(name))[0]
+    return '"%x-%x"' % (st.st_mtime_ns, st.st_size)
+
+
+def parse_range(header, size):
+    """
+    解析 Range 请求头(只支持一个范围，多个范围时返回整个文件)
+    :return: (开始, 结束)  None: 返回整个文件  ():  范围无效(416)
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-500: 最后500字节
+        length = int(end)
+        return (max(0, size - length), size - 1) if length and size else ()
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if end < start:
+        return None if start < size else ()
+    return (start, end) if start < size else ()
+
+
+class FileRange(object):
+    """
+    文件的一部分(只能读到范围的结尾)
+    保留 fileno()，wsgi.file_wrapper 从当前位置按 Content-Length 使用sendfile发送
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _set_cache_headers(response, name, etag, mtime):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if CAS_NAME_RE.match(name) \
+        else 'public, max-age=%d' % settings.MEDIA_CACHE_MAX_AGE
+    return response
+
+
+def _range_requested(request, etag, mtime):
+    """If-Range 与当前文件一致时才返回部分内容"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_media(request, path):
+    """
+    访问上传的文件
+        1.检查文件名，查询文件信息
+        2.交给前端服务器发送，或者:
+        3.处理条件请求(304/412)
+        4.处理 Range 请求(206/416)，返回文件内容
+    """
+    # 1.检查文件名，查询文件信息
+    name, full_path = media_path(path)
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+    content_type, encoding = mimetypes.guess_type(name)
+    content_type = content_type or 'application/octet-stream'
+    etag = file_etag(name, st)
+
+    # 2.交给前端服务器发送(条件请求和Range由前端服务器处理)
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'x-accel':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        return _set_cache_headers(response, name, etag, st.st_mtime)
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return _set_cache_headers(response, name, etag, st.st_mtime)
+
+    # 3.条件请求: If-None-Match/If-Modified-Since 返回304，If-Match/If-Unmodified-Since 不满足返回412
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is not None:
+        return _set_cache_headers(response, name, etag, st.st_mtime)
+
+    # 4.Range 请求
+    size = st.st_size
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _range_requested(request, etag, st.st_mtime):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        if byte_range == ():
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return _set_cache_headers(response, name, etag, st.st_mtime)
+
+    start, end = byte_range or (0, size - 1)
+    length = max(0, end - start + 1)
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        file = open(full_path, 'rb')
+        response = FileResponse(FileRange(file, start, length) if byte_range else file, content_type=content_type)
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return _set_cache_headers(response, name, etag, st.st_mtime)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 按内容保存的文件存储
+# 上传的文件逐块写入临时文件同时计算sha256，按哈希值命名(cas/ab/cd/abcd...jpg)，
+# 相同内容的文件只保存一份；文件被文章和用户引用的次数记录在 home.MediaFile 中，
+# 引用计数为0的文件由 manage.py gc_media 回收
+# 衍生文件(缩略图等)的文件名中带有 '@'，按原名保存在原文件旁边，回收原文件时一并删除
+import hashlib
+import os
+import re
+import tempfile
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, Storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import filepath_to_uri
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+CAS_PREFIX = 'cas'
+# 按内容保存的文件名
+CAS_NAME_RE = re.compile(r'^%s/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?$' % CAS_PREFIX)
+# 衍生文件名中的分隔符(上传的文件名经过 get_valid_filename 处理，不会包含'@')
+DERIVED_SEPARATOR = '@'
+# 计算哈希值和复制文件时每次读取的字节数
+CHUNK_SIZE = 64 * 1024
+
+
+def cas_name(digest, name=''):
+    """按内容哈希值生成文件名，保留原文件的扩展名"""
+    ext = os.path.splitext(name)[1].lower()
+    if not re.match(r'^\.[a-z0-9]{1,10}$', ext):
+        ext = ''
+    return '%s/%s/%s/%s%s' % (CAS_PREFIX, digest[:2], digest[2:4], digest, ext)
+
+
+def derived_name(name, suffix):
+    """衍生文件名: cas/ab/cd/abcd.png, 640w.webp -> cas/ab/cd/abcd@640w.webp"""
+    return '%s%s%s' % (os.path.splitext(name)[0], DERIVED_SEPARATOR, suffix)
+
+
+def is_derived(name):
+    return DERIVED_SEPARATOR in os.path.basename(name)
+
+
+def hash_chunks(content, out=None):
+    """
+    逐块计算文件的sha256(不把整个文件读入内存)
+    :param out: 同时写入的文件对象
+    :return: (sha256, 文件大小)
+    """
+    sha = hashlib.sha256()
+    size = 0
+    if hasattr(content, 'seek') and content.seekable():
+        content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        sha.update(chunk)
+        size += len(chunk)
+        if out is not None:
+            out.write(chunk)
+    return sha.hexdigest(), size
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    上传的文件直接逐块写入临时文件(不缓存在内存中)，同时计算sha256
+    保存时存储不需要再读一遍文件，临时文件直接移动到目标位置
+    (FILE_UPLOAD_TEMP_DIR 与 MEDIA_ROOT 在同一个文件系统时只是重命名)
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha.hexdigest()
+        return file
+
+
+def _media_files():
+    return apps.get_model('home', 'MediaFile').objects
+
+
+def record_file(name, size):
+    """
+    记录保存的文件(已存在时更新最后修改时间，避免被回收)
+    更新会锁定记录，在同一个事务中检查文件是否存在，回收时会等待事务结束
+    """
+    MediaFile = apps.get_model('home', 'MediaFile')
+    MediaFile.objects.bulk_create([MediaFile(name=name, size=size)], ignore_conflicts=True)
+    MediaFile.objects.filter(name=name).update(updated=timezone.now())
+
+
+def retain(*names):
+    """增加文件的引用计数(只处理按内容保存的文件)"""
+    names = [name for name in names if name and CAS_NAME_RE.match(name)]
+    if names:
+        _media_files().filter(name__in=names).update(refcount=F('refcount') + 1, updated=timezone.now())
+
+
+def release(*names):
+    """减少文件的引用计数"""
+    names = [name for name in names if name and CAS_NAME_RE.match(name)]
+    if names:
+        _media_files().filter(name__in=names, refcount__gt=0) \
+            .update(refcount=F('refcount') - 1, updated=timezone.now())
+
+
+def delete_with_derived(storage, name):
+    """删除文件和它的衍生文件"""
+    directory, filename = os.path.split(name)
+    prefix = os.path.splitext(filename)[0] + DERIVED_SEPARATOR
+    _, files = storage.listdir(directory)
+    for file in files:
+        if file.startswith(prefix):
+            storage.delete('%s/%s' % (directory, file))
+    storage.delete(name)
+
+
+def collect_garbage(storage=None, grace=None, batch_size=100, dry_run=False):
+    """
+    回收引用计数为0的文件
+        1.查询引用计数为0且超过保留时间的文件
+        2.锁定记录后再次检查引用计数，先删除文件(和衍生文件)再删除记录
+          (删除期间上传相同内容的请求写入记录时会等待锁，之后重新写入记录和文件)
+    :param grace: 保留时间，默认 settings.MEDIA_GC_GRACE
+    :return: (回收的文件数, 释放的字节数)
+    """
+    from django.core.files.storage import default_storage
+    storage = storage or default_storage
+    grace = grace if grace is not None else timedelta(seconds=settings.MEDIA_GC_GRACE)
+    deadline = timezone.now() - grace
+    count = size = 0
+    last_id = 0
+    while True:
+        ids = list(_media_files().filter(refcount=0, updated__lt=deadline, id__gt=last_id)
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        for file_id in ids:
+            with transaction.atomic():
+                media_file = _media_files().select_for_update() \
+                    .filter(id=file_id, refcount=0, updated__lt=deadline).first()
+                if media_file is None:
+                    continue
+                count += 1
+                size += media_file.size
+                if dry_run:
+                    continue
+                delete_with_derived(storage, media_file.name)
+                media_file.delete()
+    return count, size
+
+
+def recount_references(batch_size=500):
+    """
+    根据文章和用户的图片字段重新统计引用计数
+    :return: 修正的文件数
+    """
+    from home.models import Article
+    from users.models import User
+    counts = {}
+    for model in (Article, User):
+        for name in model.objects.filter(avatar__startswith=CAS_PREFIX + '/').values_list('avatar', flat=True):
+            counts[name] = counts.get(name, 0) + 1
+
+    changed = []
+    last_id = 0
+    while True:
+        batch = list(_media_files().filter(id__gt=last_id).order_by('id').only('id', 'name', 'refcount')[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for media_file in batch:
+            refcount = counts.get(media_file.name, 0)
+            if media_file.refcount != refcount:
+                media_file.refcount = refcount
+                changed.append(media_file)
+    _media_files().bulk_update(changed, ['refcount'], batch_size=batch_size)
+    return len(changed)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """按内容保存的本地文件存储"""
+
+    def __init__(self, *args, track=True, **kwargs):
+        """
+        :param track: 是否在 home.MediaFile 中记录保存的文件(基准测试时不记录)
+        """
+        super().__init__(*args, **kwargs)
+        self.track = track
+
+    def get_available_name(self, name, max_length=None):
+        # 文件名由内容决定，相同的文件名就是相同的内容，不需要避免重名
+        return name
+
+    def _temporary_file(self, directory):
+        directory = self.path(directory)
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False)
+
+    def _save(self, name, content):
+        # 衍生文件: 写入临时文件后替换(重新生成时覆盖)
+        if is_derived(name):
+            with self._temporary_file(os.path.dirname(name)) as tmp:
+                hash_chunks(content, tmp)
+            self._move(tmp.name, name, replace=True)
+            return name
+
+        # 1.计算哈希值: 上传时已经计算过的直接使用临时文件，否则边写临时文件边计算
+        digest = getattr(content, 'sha256', None)
+        if digest is not None and hasattr(content, 'temporary_file_path'):
+            source, size, owned = content.temporary_file_path(), content.size, False
+        else:
+            with self._temporary_file(CAS_PREFIX) as tmp:
+                digest, size = hash_chunks(content, tmp)
+            source, owned = tmp.name, True
+
+        # 2.先写入记录锁定，相同内容的文件已经存在时不再保存
+        name = cas_name(digest, name)
+        with transaction.atomic():
+            if self.track:
+                record_file(name, size)
+            if self.exists(name):
+                if owned:
+                    os.remove(source)
+            else:
+                self._move(source, name, replace=False, owned=owned)
+        return name
+
+    def _move(self, source, name, replace, owned=True):
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        try:
+            if owned and replace:
+                os.replace(source, full_path)
+            elif owned:
+                # 硬链接在目标已存在时失败，并发保存相同内容时只有一个成功
+                os.link(source, full_path)
+                os.remove(source)
+            else:
+                file_move_safe(source, full_path, allow_overwrite=False)
+        except FileExistsError:
+            if owned:
+                os.remove(source)
+            return
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+
+@deconstructible
+class S3ContentAddressedStorage(Storage):
+    """
+    按内容保存到S3兼容的对象存储(需要安装boto3)
+    AWS_S3_ENDPOINT_URL 指向 MinIO 等本地服务时可以在开发和测试环境中使用
+    """
+
+    def __init__(self, bucket=None, endpoint_url=None, base_url=None, client=None, track=True):
+        """
+        :param client: S3客户端，默认根据配置创建boto3客户端
+        """
+        self.bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+        self.endpoint_url = endpoint_url or settings.AWS_S3_ENDPOINT_URL
+        self.base_url = base_url or settings.MEDIA_URL
+        self.track = track
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            if boto3 is None:
+                raise ImproperlyConfigured('使用 S3ContentAddressedStorage 需要安装 boto3')
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url)
+        return self._client
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if is_derived(name):
+            if hasattr(content, 'seek') and content.seekable():
+                content.seek(0)
+            self.client.upload_fileobj(content, self.bucket, name)
+            return name
+
+        # 先计算哈希值才能确定对象名，超过1M的文件暂存在磁盘上，不占用内存
+        digest = getattr(content, 'sha256', None)
+        if digest is not None and hasattr(content, 'seek') and content.seekable():
+            body, size = content, content.size
+        else:
+            body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            digest, size = hash_chunks(content, body)
+        try:
+            name = cas_name(digest, name)
+            # 先写入记录锁定，避免检查对象是否存在之后被回收
+            with transaction.atomic():
+                if self.track:
+                    record_file(name, size)
+                if not self.exists(name):
+                    body.seek(0)
+                    # upload_fileobj 对大文件自动使用分段上传
+                    self.client.upload_fileobj(body, self.bucket, name)
+        finally:
+            if body is not content:
+                body.close()
+        return name
+
+    def _open(self, name, mode='rb'):
+        body = self.client.get_object(Bucket=self.bucket, Key=name)['Body']
+        file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+            file.write(chunk)
+        file.seek(0)
+        return File(file, name)
+
+    def exists(self, name):
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=name, MaxKeys=1)
+        return any(item['Key'] == name for item in response.get('Contents', []))
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=name)['ContentLength']
+
+    def url(self, name):
+        return self.base_url + filepath_to_uri(name)
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/' if path else ''
+        directories, files = [], []
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix, 'Delimiter': '/'}
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            directories.extend(item['Prefix'][len(prefix):].rstrip('/')
+                               for item in response.get('CommonPrefixes', []))
+            files.extend(item['Key'][len(prefix):] for item in response.get('Contents', []))
+            if not response.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+        return directories, files
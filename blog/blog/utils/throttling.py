@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# 基于redis令牌桶的限流
+# 多个令牌桶在一个lua脚本中检查和扣减，是原子操作，每次请求只需要一次往返
+from django_redis import get_redis_connection
+
+BUCKET_KEY = 'throttle:%s'
+
+# 令牌桶的lua函数，限流脚本和其他需要在同一个脚本中限流的脚本(如 users.verification)拼接使用
+# check_buckets(first_key, first_arg): KEYS[first_key..] 为令牌桶的key(hash: tokens 剩余令牌数, ts 上次更新的时间)
+#   ARGV[first_arg] 为当前时间(秒)，之后依次为每个令牌桶的容量和每秒补充的令牌数
+#   返回 令牌桶列表 和 需要等待的秒数(任何一个令牌桶的令牌不足时大于0)，不修改令牌桶
+# take_tokens(buckets, now): 各扣减一个令牌
+TOKEN_BUCKET_LUA = """
+local function check_buckets(first_key, first_arg)
+    local now = tonumber(ARGV[first_arg])
+    local buckets = {}
+    local wait = 0
+    for i = first_key, #KEYS do
+        local n = i - first_key
+        local capacity = tonumber(ARGV[first_arg + 1 + n * 2])
+        local rate = tonumber(ARGV[first_arg + 2 + n * 2])
+        local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+        local count = tonumber(bucket[1])
+        if count == nil then
+            count = capacity
+        else
+            count = math.min(capacity, count + math.max(0, now - tonumber(bucket[2])) * rate)
+        end
+        if count < 1 then
+            wait = math.max(wait, (1 - count) / rate)
+        end
+        buckets[#buckets + 1] = {KEYS[i], capacity, rate, count}
+    end
+    return buckets, wait
+end
+
+local function take_tokens(buckets, now)
+    for _, bucket in ipairs(buckets) do
+        redis.call('HMSET', bucket[1], 'tokens', tostring(bucket[4] - 1), 'ts', now)
+        -- 令牌补满之后桶和新建的桶相同，可以删除
+        redis.call('EXPIRE', bucket[1], math.ceil((bucket[2] - bucket[4] + 1) / bucket[3]))
+    end
+end
+"""
+
+# KEYS: 令牌桶的key  ARGV[1]: 当前时间(秒)，由调用方传入  ARGV[2i], ARGV[2i+1]: 第i个令牌桶的容量和每秒补充的令牌数
+# 任何一个令牌桶的令牌不足时都不扣减，返回 {0, 需要等待的秒数}，否则各扣减一个令牌，返回 {1, '0'}
+TOKEN_BUCKET_SCRIPT = TOKEN_BUCKET_LUA + """
+local buckets, wait = check_buckets(1, 1)
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+take_tokens(buckets, ARGV[1])
+return {1, '0'}
+"""
+
+_script = None
+
+
+def _get_script(redis_conn):
+    global _script
+    if _script is None:
+        # 第一次调用时注册，之后使用 EVALSHA 调用
+        _script = redis_conn.register_script(TOKEN_BUCKET_SCRIPT)
+    return _script
+
+
+def bucket_args(buckets, now):
+    """
+    令牌桶的 KEYS 和 ARGV(当前时间, 第1个桶的容量, 每秒补充的令牌数, ...)
+    :param buckets: [(名称, 容量, 补充一个令牌的间隔秒数)]
+    """
+    keys = []
+    args = [repr(now)]
+    for name, capacity, interval in buckets:
+        keys.append(BUCKET_KEY % name)
+        args.extend([capacity, repr(1 / interval)])
+    return keys, args
+
+
+def consume(buckets, now, alias='default'):
+    """
+    从多个令牌桶中各取一个令牌
+    :param buckets: [(名称, 容量, 补充一个令牌的间隔秒数)]
+    :param now: 当前时间(time.time())
+    :return: (是否允许, 需要等待的秒数)
+    """
+    redis_conn = get_redis_connection(alias)
+    keys, args = bucket_args(buckets, now)
+    allowed, wait = _get_script(redis_conn)(keys=keys, args=args, client=redis_conn)
+    return bool(allowed), float(wait)
+
+
+def get_client_ip(request):
+    """客户端IP(部署在反向代理之后时，需要由代理设置 REMOTE_ADDR)"""
+    return request.META.get('REMOTE_ADDR', '')